@@ -1,17 +1,22 @@
 from http import HTTPStatus
+from uuid import UUID
 
+from async_fastapi_jwt_auth.exceptions import AuthJWTException
 from fastapi import APIRouter, Response, Request, Depends
 from starlette.requests import Request as StarletteRequest
 
-from src.models.users import User
-from src.schemas.tokens import Tokens, AccessToken
+from src.schemas.tokens import Tokens, SessionSchema, IntrospectForm, TokenIntrospection
 from src.schemas.users import UserLoginForm
 
-from src.services.auth import get_user_from_access_token, get_user_from_refresh_token
+from src.core.exceptions import CustomException
+from src.services.auth import AuthService, get_principal_from_access_token, get_principal_from_refresh_token
+from src.services.common import ServiceContainer, get_services
+from src.services.introspection import IntrospectionService, get_introspection_service, check_gateway_token
+from src.services.principals import Principal
 from src.services.tokens import TokenService, get_token_service
 from src.services.users import UserService, get_user_service
 from src.services.auth import get_user_info_from_request
-from src.core.config import oauth_services
+from src.core.oauth import oauth_services
 from src.limiter import limiter
 
 
@@ -46,8 +51,8 @@ async def auth_via_service(
     if service in oauth_services:
         oauth_service = oauth_services[service]
         user_info = await get_user_info_from_request(request, oauth_service)
-        user = await user_service.get_or_create_user(user_info)
-        tokens = await token_service.create_tokens(user.id)
+        user_id = await user_service.provision_federated_user(service, user_info)
+        tokens = await token_service.create_tokens(user_id, request.headers.get('user-agent', ''))
         return tokens
 
 
@@ -60,30 +65,107 @@ async def login_via_google(request: StarletteRequest):
 
 @router.post(
     '/refresh',
-    response_model=AccessToken,
+    response_model=Tokens,
     status_code=HTTPStatus.OK
 )
-@limiter.limit("20/minute")
+@limiter.limit("20/minute", per_user=True)
 async def refresh_access_token(
         response: Response,
         request: Request,
-        user: User = Depends(get_user_from_refresh_token),
+        user: Principal = Depends(get_principal_from_refresh_token),
         token_service: TokenService = Depends(get_token_service)
-) -> AccessToken:
-    """Обновление access токена"""
-    return await token_service.refresh(user, request, response)
+) -> Tokens:
+    """Обновление пары токенов, предъявленный refresh токен становится недействительным"""
+    return await token_service.refresh(user, response)
 
 
 @router.get(
     '/logout',
     status_code=HTTPStatus.NO_CONTENT
 )
-@limiter.limit("20/minute")
+@limiter.limit("20/minute", per_user=True)
 async def logout_from_all_devices(
         request: Request,
-        user: User = Depends(get_user_from_access_token),
+        user: Principal = Depends(get_principal_from_access_token),
         token_service: TokenService = Depends(get_token_service)
 ) -> None:
     """Выход из аккаунта со всех устройств"""
     await token_service.logout(user.id)
 
+
+@router.get(
+    '/logout/session',
+    status_code=HTTPStatus.NO_CONTENT
+)
+@limiter.limit("20/minute", per_user=True)
+async def logout_from_this_device(
+        request: Request,
+        user: Principal = Depends(get_principal_from_access_token),
+        token_service: TokenService = Depends(get_token_service)
+) -> None:
+    """Выход из аккаунта на текущем устройстве"""
+    await token_service.logout_session(user.id, await token_service.get_current_session_id())
+    await token_service.authorize.unset_jwt_cookies()
+
+
+@router.get(
+    '/sessions',
+    response_model=list[SessionSchema],
+    status_code=HTTPStatus.OK
+)
+@limiter.limit("20/minute", per_user=True)
+async def get_sessions(
+        request: Request,
+        user: Principal = Depends(get_principal_from_access_token),
+        token_service: TokenService = Depends(get_token_service)
+) -> list[SessionSchema]:
+    """Устройства, на которых выполнен вход"""
+    return await token_service.get_sessions(user.id)
+
+
+@router.delete(
+    '/sessions/{session_id}',
+    status_code=HTTPStatus.NO_CONTENT
+)
+@limiter.limit("20/minute", per_user=True)
+async def logout_from_device(
+        request: Request,
+        session_id: UUID,
+        user: Principal = Depends(get_principal_from_access_token),
+        token_service: TokenService = Depends(get_token_service)
+) -> None:
+    """Выход из аккаунта на выбранном устройстве"""
+    await token_service.logout_session(user.id, session_id)
+
+
+@router.post(
+    '/introspect',
+    response_model=list[TokenIntrospection],
+    status_code=HTTPStatus.OK,
+    dependencies=[Depends(check_gateway_token)]
+)
+@limiter.limit("600/minute")
+async def introspect_tokens(
+        payload: IntrospectForm,
+        request: Request,
+        introspection_service: IntrospectionService = Depends(get_introspection_service)
+) -> list[TokenIntrospection]:
+    """Проверка access токенов для шлюзов: результаты в порядке переданных токенов"""
+    return await introspection_service.introspect(payload.tokens)
+
+
+@router.get('/verify', status_code=HTTPStatus.OK)
+async def verify_access_token(services: ServiceContainer = Depends(get_services)) -> Response:
+    """Проверка токена для nginx auth_request: только код ответа и заголовки с пользователем.
+
+    Без response_model и без БД, пока роли в токене актуальны; nginx считает ошибкой
+    любой код, кроме 2xx, 401 и 403, поэтому недействительный токен - всегда 401.
+    """
+    try:
+        principal = await services.get(AuthService).get_principal_from_access()
+    except (CustomException, AuthJWTException):
+        return Response(status_code=HTTPStatus.UNAUTHORIZED)
+    return Response(
+        status_code=HTTPStatus.OK,
+        headers={'X-User-Id': str(principal.id), 'X-User-Roles': ','.join(principal.roles)}
+    )
@@ -1,18 +1,17 @@
 from http import HTTPStatus
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, Query, Request
+from fastapi import APIRouter, Depends, Query, Request, Response
 
-from src.models.users import User
 from src.models.roles import Role
 
 from src.schemas.validators import Paginator
-from src.schemas.roles import RoleCreateForm, RoleSchema, RoleAttachForm, RoleUpdateForm
+from src.schemas.roles import RoleCreateForm, RoleSchema, RoleAttachForm, RoleUpdateForm, RoleBulkForm, RoleBulkResult
 
-from src.services.auth import get_user_from_access_token
+from src.services.auth import get_admin_from_access_token
+from src.services.principals import Principal
 from src.services.roles import RolesService, get_role_service
 
-from src.core.exceptions import USER_DOES_NOT_HAVE_RIGHTS
 from src.limiter import limiter
 
 
@@ -25,8 +24,13 @@ async def get_roles(
         request: Request,
         paginator: Paginator = Depends(Paginator),
         role_service: RolesService = Depends(get_role_service)
-) -> list[RoleSchema]:
-    return await role_service.get_roles(paginator)
+) -> Response:
+    page = await role_service.get_roles(paginator)
+    # no-cache: клиент хранит ответ, но перед использованием сверяет ETag
+    headers = {'ETag': page.etag, 'Cache-Control': 'no-cache'}
+    if page.matches(request.headers.get('If-None-Match')):
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=headers)
+    return Response(content=page.body, media_type='application/json', headers=headers)
 
 
 @router.get('/user_roles/{user_id}', status_code=HTTPStatus.OK, response_model=list[RoleSchema])
@@ -40,68 +44,80 @@ async def get_user_roles(
 
 
 @router.post('/', status_code=HTTPStatus.CREATED, response_model=RoleSchema)
-@limiter.limit("20/minute")
+@limiter.limit("20/minute", per_user=True)
 async def create_role(
         request: Request,
         role_create_form: RoleCreateForm,
-        user: User = Depends(get_user_from_access_token),
+        user: Principal = Depends(get_admin_from_access_token),
         role_service: RolesService = Depends(get_role_service)
 ) -> Role:
-    if user.is_admin():
-        return await role_service.create_role(role_create_form)
-    raise USER_DOES_NOT_HAVE_RIGHTS
+    return await role_service.create_role(role_create_form)
 
 
 @router.delete('/{role_id}', status_code=HTTPStatus.NO_CONTENT)
-@limiter.limit("20/minute")
+@limiter.limit("20/minute", per_user=True)
 async def delete_role(
         request: Request,
         role_id: UUID,
-        user: User = Depends(get_user_from_access_token),
+        user: Principal = Depends(get_admin_from_access_token),
         role_service: RolesService = Depends(get_role_service)
 ) -> None:
-    if user.is_admin():
-        return await role_service.delete_role(role_id)
-    raise USER_DOES_NOT_HAVE_RIGHTS
+    return await role_service.delete_role(role_id)
 
 
 @router.put('/{role_id}', response_model=RoleSchema, status_code=HTTPStatus.OK)
-@limiter.limit("20/minute")
+@limiter.limit("20/minute", per_user=True)
 async def update_role(
         request: Request,
         role_id: UUID,
         role_update_form: RoleUpdateForm,
-        user: User = Depends(get_user_from_access_token),
+        user: Principal = Depends(get_admin_from_access_token),
         role_service: RolesService = Depends(get_role_service)
 ) -> RoleSchema:
-    if user.is_admin():
-        return await role_service.update_role(role_id, role_update_form)
-    raise USER_DOES_NOT_HAVE_RIGHTS
+    return await role_service.update_role(role_id, role_update_form)
 
 
 @router.post('/attach_role', status_code=HTTPStatus.NO_CONTENT)
-@limiter.limit("20/minute")
+@limiter.limit("20/minute", per_user=True)
 async def attach_role(
         request: Request,
         role_attach_form: RoleAttachForm,
-        user: User = Depends(get_user_from_access_token),
+        user: Principal = Depends(get_admin_from_access_token),
         role_service: RolesService = Depends(get_role_service)
 ) -> None:
-    if user.is_admin():
-        return await role_service.attach_role(role_attach_form)
-    raise USER_DOES_NOT_HAVE_RIGHTS
+    return await role_service.attach_role(role_attach_form)
 
 
 @router.delete('/detach_role/', status_code=HTTPStatus.NO_CONTENT)
-@limiter.limit("20/minute")
+@limiter.limit("20/minute", per_user=True)
 async def detach_role(
         request: Request,
         user_id: UUID = Query(),
         role_id: UUID = Query(),
-        user: User = Depends(get_user_from_access_token),
+        user: Principal = Depends(get_admin_from_access_token),
         role_service: RolesService = Depends(get_role_service)
 ) -> None:
-    if user.is_admin():
-        role_attach_form = RoleAttachForm(user_id=user_id, role_id=role_id)
-        return await role_service.detach_role(role_attach_form)
-    raise USER_DOES_NOT_HAVE_RIGHTS
+    role_attach_form = RoleAttachForm(user_id=user_id, role_id=role_id)
+    return await role_service.detach_role(role_attach_form)
+
+
+@router.post('/bulk_attach', status_code=HTTPStatus.OK, response_model=RoleBulkResult)
+@limiter.limit("20/minute", per_user=True)
+async def attach_roles(
+        request: Request,
+        role_bulk_form: RoleBulkForm,
+        user: Principal = Depends(get_admin_from_access_token),
+        role_service: RolesService = Depends(get_role_service)
+) -> RoleBulkResult:
+    return RoleBulkResult(count=await role_service.attach_roles(role_bulk_form))
+
+
+@router.post('/bulk_detach', status_code=HTTPStatus.OK, response_model=RoleBulkResult)
+@limiter.limit("20/minute", per_user=True)
+async def detach_roles(
+        request: Request,
+        role_bulk_form: RoleBulkForm,
+        user: Principal = Depends(get_admin_from_access_token),
+        role_service: RolesService = Depends(get_role_service)
+) -> RoleBulkResult:
+    return RoleBulkResult(count=await role_service.detach_roles(role_bulk_form))
@@ -1,37 +1,37 @@
 from http import HTTPStatus
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, Request, Query
+from fastapi import APIRouter, Depends, Request, Response, Query
 
 from src.models.users import User
-from src.services.users import UserService, get_user_service
-from src.services.auth import get_user_from_access_token
+from src.services.users import UserService, get_user_service, encode_login_history
+from src.services.auth import get_user_from_access_token, get_principal_from_access_token, get_admin_from_access_token
+from src.services.principals import Principal
 
 from src.schemas.users import UserCreateForm, ChangePasswordForm, FullUserSchema
-from src.schemas.histories import LoginHistorySchema
-from src.schemas.validators import Paginator
-from src.core.exceptions import USER_DOES_NOT_HAVE_RIGHTS
+from src.schemas.histories import LoginHistorySchema, HistoryPaginator
 from src.limiter import limiter
 
 
 router = APIRouter()
 
 
-@router.post('/signup')
+@router.post('/signup', response_model=FullUserSchema)
 @limiter.limit("20/minute")
 async def create_user(
         request: Request,
         user_create_form: UserCreateForm,
         user_service: UserService = Depends(get_user_service)
-):
-    return await user_service.create_user(user_create_form)
+) -> Response:
+    body = await user_service.create_user(user_create_form)
+    return Response(content=body, media_type='application/json')
 
 
 @router.put(
     '/change_password',
     status_code=HTTPStatus.NO_CONTENT
 )
-@limiter.limit("20/minute")
+@limiter.limit("20/minute", per_user=True)
 async def change_password(
         request: Request,
         change_password_form: ChangePasswordForm,
@@ -46,27 +46,31 @@ async def change_password(
     status_code=HTTPStatus.OK,
     response_model=list[LoginHistorySchema]
 )
-@limiter.limit("20/minute")
+@limiter.limit("20/minute", per_user=True)
 async def get_user_history(
         request: Request,
-        paginator: Paginator = Depends(Paginator),
-        user: User = Depends(get_user_from_access_token),
+        paginator: HistoryPaginator = Depends(HistoryPaginator),
+        user: Principal = Depends(get_principal_from_access_token),
         user_service: UserService = Depends(get_user_service)
-) -> list[LoginHistorySchema]:
-    return await user_service.get_user_history(user, paginator)
+) -> Response:
+    """История входов; для глубоких страниц передавайте cursor из заголовка X-Next-Cursor"""
+    login_records = await user_service.get_user_history(user, paginator)
+    response = Response(content=encode_login_history(login_records), media_type='application/json')
+    next_cursor = user_service.get_next_history_cursor(login_records, paginator.page_size)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
 
 
 @router.delete('/delete/', status_code=HTTPStatus.NO_CONTENT)
-@limiter.limit("20/minute")
+@limiter.limit("20/minute", per_user=True)
 async def delete_user(
         request: Request,
         user_id: UUID = Query(),
-        user: User = Depends(get_user_from_access_token),
+        user: Principal = Depends(get_admin_from_access_token),
         user_service: UserService = Depends(get_user_service)
 ) -> None:
-    if user.is_admin():
-        return await user_service.delete_user(user_id)
-    raise USER_DOES_NOT_HAVE_RIGHTS
+    return await user_service.delete_user(user_id)
 
 
 @router.get(
@@ -74,10 +78,10 @@ async def delete_user(
     status_code=HTTPStatus.OK,
     response_model=FullUserSchema
 )
-@limiter.limit("20/minute")
+@limiter.limit("20/minute", per_user=True)
 async def get_user_info(
         request: Request,
         user: User = Depends(get_user_from_access_token),
         user_service: UserService = Depends(get_user_service)
-) -> FullUserSchema:
-    return await user_service.get_user_info(user)
+) -> Response:
+    return Response(content=user_service.get_user_info(user), media_type='application/json')
@@ -0,0 +1,18 @@
+from http import HTTPStatus
+
+from fastapi import APIRouter, Request, Response
+
+from src.core.config import settings
+from src.core.signing import key_ring
+
+
+router = APIRouter()
+
+
+@router.get('/jwks.json', status_code=HTTPStatus.OK)
+async def get_jwks(request: Request) -> Response:
+    """Открытые ключи для проверки access токенов в других сервисах"""
+    headers = {'ETag': key_ring.etag, 'Cache-Control': f'public, max-age={settings.JWKS_MAX_AGE}'}
+    if request.headers.get('If-None-Match') == key_ring.etag:
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=headers)
+    return Response(content=key_ring.jwks, media_type='application/json', headers=headers)
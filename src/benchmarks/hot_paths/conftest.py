@@ -0,0 +1,115 @@
+"""Микробенчмарки горячих путей сервисов на pytest-benchmark.
+
+Postgres - временная база на сервере из DB_URL: схема создается миграциями,
+после прогона база удаляется. Redis - fakeredis в памяти процесса, поэтому
+время Redis-команд не учитывается, а сетевые задержки Postgres - учитываются.
+Корутины выполняются через run_until_complete, это добавляет к каждому замеру
+постоянные накладные расходы event loop (см. test_event_loop).
+
+Запуск: pytest src/benchmarks/hot_paths --benchmark-autosave
+Результаты сохраняются JSON-файлом в .benchmarks, сравнение с прошлым
+прогоном - --benchmark-compare, отдельный файл - --benchmark-json results.json
+"""
+import asyncio
+import os
+import subprocess
+import sys
+from pathlib import Path
+from uuid import uuid4
+
+import fakeredis.aioredis
+import pytest
+from fastapi import Request, Response
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from src.core.config import settings, admin_settings
+from src.core.signing import KeyedAuthJWT
+from src.db.postgres import async_session, engine as service_engine, get_engine_options
+from src.models.roles import Role
+from src.models.users import User
+from src.services.common import ServiceContainer
+from src.services.hashing import password_hasher
+from src.services.users import create_admin
+
+
+ROOT_DIR = Path(__file__).resolve().parents[3]
+ROLES_COUNT = 50
+
+
+def replace_database(url: str, database: str) -> str:
+    """URL с другой базой; строкой, а не через URL.set: alembic.ini не принимает %-экранирование"""
+    address, separator, query = url.partition('?')
+    return f'{address.rsplit("/", 1)[0]}/{database}{separator}{query}'
+
+
+async def execute_on_server(statement: str) -> None:
+    server_engine = create_async_engine(settings.DB_URL, isolation_level='AUTOCOMMIT', poolclass=NullPool)
+    async with server_engine.connect() as conn:
+        await conn.execute(text(statement))
+    await server_engine.dispose()
+
+
+@pytest.fixture(scope='session')
+def run():
+    """Выполняет корутину в общем для всего прогона event loop: соединения пула привязаны к нему"""
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+    loop.close()
+
+
+@pytest.fixture(scope='session', autouse=True)
+def database(run):
+    """Временная база; общая фабрика сессий сервиса на время прогона смотрит в нее"""
+    database_name = f'auth_bench_{uuid4().hex[:12]}'
+    database_url = replace_database(settings.DB_URL, database_name)
+    run(execute_on_server(f'CREATE DATABASE "{database_name}"'))
+    benchmark_engine = create_async_engine(database_url, **get_engine_options())
+    try:
+        subprocess.run(
+            [sys.executable, '-m', 'alembic', 'upgrade', 'head'],
+            cwd=ROOT_DIR, env={**os.environ, 'DB_URL': database_url}, check=True
+        )
+        async_session.configure(bind=benchmark_engine)
+        yield
+    finally:
+        async_session.configure(bind=service_engine)
+        password_hasher.shutdown()
+        run(benchmark_engine.dispose())
+        run(execute_on_server(f'DROP DATABASE "{database_name}" WITH (FORCE)'))
+
+
+@pytest.fixture(scope='session')
+def redis(run):
+    client = fakeredis.aioredis.FakeRedis()
+    yield client
+    run(client.aclose())
+
+
+@pytest.fixture(scope='session')
+def admin(run, database) -> User:
+    """Администратор из настроек и справочник ролей для постраничной выдачи"""
+    async def seed() -> User:
+        await create_admin()
+        async with async_session() as db:
+            db.add_all(Role(name=f'benchmark-role-{number}') for number in range(ROLES_COUNT))
+            await db.commit()
+            query = await db.execute(select(User).where(User.login == admin_settings.ADMIN_LOGIN))
+            return query.scalar_one()
+
+    return run(seed())
+
+
+@pytest.fixture(scope='session')
+def handle(redis):
+    """Вызов сервиса как из запроса: своя сессия БД и AuthJWT с токеном из заголовка Authorization"""
+    async def call(func, token: str | None = None):
+        headers = [(b'user-agent', b'benchmark')]
+        if token:
+            headers.append((b'authorization', f'Bearer {token}'.encode()))
+        request = Request({'type': 'http', 'method': 'GET', 'path': '/', 'headers': headers, 'query_string': b''})
+        async with async_session() as db:
+            return await func(ServiceContainer(db, redis, KeyedAuthJWT(req=request, res=Response())), request)
+
+    return call
@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+from src.schemas.validators import Paginator
+from src.services.auth import AuthService
+from src.services.role_catalog import role_catalog
+from src.services.roles import RolesService
+from src.services.tokens import TokenService
+from src.services.users import UserService, encode_user_info
+
+
+def test_event_loop(benchmark, run):
+    """Накладные расходы run_until_complete, входящие в остальные замеры"""
+    benchmark(lambda: run(asyncio.sleep(0)))
+
+
+def test_get_user_from_access(benchmark, run, handle, admin):
+    async def create_tokens(services, request):
+        return await services.get(TokenService).create_tokens(admin.id, 'benchmark')
+
+    async def get_user(services, request):
+        return await services.get(AuthService).get_user_from_access()
+
+    access_token = run(handle(create_tokens)).access_token
+    benchmark(lambda: run(handle(get_user, access_token)))
+
+
+@pytest.mark.parametrize('cached', (False, True), ids=('encode', 'cached'))
+def test_get_user_info(benchmark, admin, cached):
+    if cached:
+        benchmark(UserService.get_user_info, admin)
+    else:
+        benchmark(encode_user_info, admin, admin.is_admin())
+
+
+@pytest.mark.parametrize('subscribed', (False, True), ids=('postgres', 'cached'))
+def test_get_roles(benchmark, run, handle, admin, monkeypatch, subscribed):
+    # Без подписки на канал справочник читается из Postgres при каждом запросе
+    monkeypatch.setattr(role_catalog, 'subscribed', subscribed)
+    paginator = Paginator(page_size=20, page_number=1)
+
+    async def get_roles(services, request):
+        return await services.get(RolesService).get_roles(paginator)
+
+    benchmark(lambda: run(handle(get_roles)))
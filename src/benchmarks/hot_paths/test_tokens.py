@@ -0,0 +1,78 @@
+from datetime import timedelta
+from uuid import uuid4
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from fastapi import Response
+
+from src.core.config import settings, admin_settings
+from src.core.signing import KeyedAuthJWT, key_ring
+from src.generate_signing_key import generate_private_key
+from src.services.hashing import password_hasher
+from src.services.principals import Principal
+from src.services.tokens import TokenService
+
+
+@pytest.fixture(params=('HS256', 'EdDSA', 'ES256'))
+def algorithm(request, tmp_path, monkeypatch) -> str:
+    """HS256 - общий секрет без key_ring, остальные - ключ из временного каталога"""
+    for attribute in ('path', '_keys', 'jwks', 'etag'):
+        monkeypatch.setattr(key_ring, attribute, getattr(key_ring, attribute))
+    key_ring.path, key_ring._keys = None, {}
+    if request.param != 'HS256':
+        pem = generate_private_key(request.param).private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.NoEncryption()
+        )
+        (tmp_path / 'benchmark.pem').write_bytes(pem)
+        key_ring.path = str(tmp_path)
+        key_ring.load()
+    return request.param
+
+
+async def create_access_token(user_id) -> str:
+    return await KeyedAuthJWT().create_access_token(
+        subject=str(user_id),
+        expires_time=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE),
+        user_claims={'roles': [admin_settings.ADMIN_ROLE_NAME], 'rv': '0.0', 'sid': str(uuid4())}
+    )
+
+
+def test_jwt_encode(benchmark, run, admin, algorithm):
+    benchmark(lambda: run(create_access_token(admin.id)))
+
+
+def test_jwt_decode(benchmark, run, admin, algorithm):
+    token = run(create_access_token(admin.id))
+    # AuthJWT запоминает проверенные claims, поэтому экземпляр на каждый вызов, как в запросе
+    benchmark(lambda: run(KeyedAuthJWT().verify_access_token(token)))
+
+
+def test_password_verify(benchmark, run, admin):
+    benchmark(lambda: run(password_hasher.verify(admin.password, admin_settings.ADMIN_PASSWORD)))
+
+
+def test_login(benchmark, run, handle, admin):
+    async def login(services, request):
+        return await services.get(TokenService).login(
+            admin_settings.ADMIN_LOGIN, admin_settings.ADMIN_PASSWORD, request, Response()
+        )
+
+    benchmark(lambda: run(handle(login)))
+
+
+def test_refresh(benchmark, run, handle, admin):
+    principal = Principal.from_user(admin)
+
+    async def create_tokens(services, request):
+        return await services.get(TokenService).create_tokens(admin.id, 'benchmark')
+
+    async def refresh(services, request):
+        return await services.get(TokenService).refresh(principal, Response())
+
+    # Refresh токен одноразовый: новая пара на каждый раунд, ее выпуск в замер не входит
+    def setup():
+        return (run(handle(create_tokens)).refresh_token,), {}
+
+    benchmark.pedantic(lambda token: run(handle(refresh, token)), setup=setup, rounds=200, warmup_rounds=10)
@@ -0,0 +1,123 @@
+"""Накладные расходы middleware на один запрос.
+
+Сравнивает прежний стек (BaseHTTPMiddleware с проверкой X-Request-Id после обработчика
+и SessionMiddleware на всех путях) с ASGI middleware сервиса на пустом эндпоинте.
+
+Запуск: python -m src.benchmarks.middleware_overhead --requests 5000
+"""
+import argparse
+import asyncio
+import json
+import time
+from base64 import b64encode
+
+from fastapi import FastAPI, Request, status
+from fastapi.responses import ORJSONResponse
+from itsdangerous import TimestampSigner
+from starlette.middleware.sessions import SessionMiddleware
+
+from src.core.middleware import RequestIdMiddleware, PathSessionMiddleware
+
+
+SECRET_KEY = 'benchmark'
+REPEATS = 3
+SESSION_PATHS = ('/api/v1/auth/login/google', '/api/v1/auth/oauth/')
+
+
+def create_app() -> FastAPI:
+    app = FastAPI(default_response_class=ORJSONResponse)
+
+    @app.get('/api/v1/ping')
+    async def ping() -> dict:
+        return {}
+
+    return app
+
+
+def create_legacy_app() -> FastAPI:
+    app = create_app()
+    app.add_middleware(SessionMiddleware, secret_key=SECRET_KEY)
+
+    @app.middleware('http')
+    async def before_request(request: Request, call_next):
+        response = await call_next(request)
+        if not request.headers.get('X-Request-Id'):
+            return ORJSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content={'detail': 'X-Request-Id is required'})
+        return response
+
+    return app
+
+
+def create_asgi_app() -> FastAPI:
+    app = create_app()
+    app.add_middleware(PathSessionMiddleware, path_prefixes=SESSION_PATHS, secret_key=SECRET_KEY)
+    app.add_middleware(RequestIdMiddleware)
+    return app
+
+
+def create_bare_app() -> FastAPI:
+    return create_app()
+
+
+def create_session_cookie() -> dict:
+    """Cookie сессии, как у пользователя, однажды входившего через OAuth"""
+    data = b64encode(json.dumps({'_state_google_benchmark': {'data': {}}}).encode())
+    return {'session': TimestampSigner(SECRET_KEY).sign(data).decode()}
+
+
+def create_scope(headers: dict, cookies: dict) -> dict:
+    raw_headers = [(name.lower().encode(), value.encode()) for name, value in headers.items()]
+    cookie = '; '.join(f'{name}={value}' for name, value in cookies.items())
+    return {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'GET', 'scheme': 'http', 'path': '/api/v1/ping', 'raw_path': b'/api/v1/ping',
+        'root_path': '', 'query_string': b'', 'server': ('bench', 80), 'client': ('127.0.0.1', 1),
+        'headers': [*raw_headers, (b'cookie', cookie.encode())]
+    }
+
+
+async def measure(app: FastAPI, requests: int, scope: dict) -> float:
+    """Среднее время запроса в микросекундах; приложение вызывается напрямую, без HTTP клиента"""
+    async def run(count: int) -> float:
+        start = time.perf_counter()
+        for _ in range(count):
+            request_sent = False
+            response_complete = asyncio.Event()
+
+            async def receive() -> dict:
+                # Как у сервера: тело запроса, затем разрыв соединения после ответа
+                nonlocal request_sent
+                if not request_sent:
+                    request_sent = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await response_complete.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message: dict) -> None:
+                if message['type'] == 'http.response.body' and not message.get('more_body'):
+                    response_complete.set()
+
+            await app(dict(scope), receive, send)
+        return (time.perf_counter() - start) / count * 1_000_000
+
+    await run(requests // 10)
+    # Лучший из нескольких прогонов, чтобы меньше зависеть от шума
+    return min([await run(requests) for _ in range(REPEATS)])
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description='Накладные расходы middleware')
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+
+    scope = create_scope({'X-Request-Id': 'benchmark'}, create_session_cookie())
+    bare = await measure(create_bare_app(), args.requests, scope)
+    print(f'{"stack":<12}{"us/request":>12}{"overhead us":>14}')
+    for name, factory in (('legacy', create_legacy_app), ('asgi', create_asgi_app)):
+        elapsed = await measure(factory(), args.requests, scope)
+        print(f'{name:<12}{elapsed:>12.1f}{elapsed - bare:>14.1f}')
+    print(f'{"none":<12}{bare:>12.1f}{0:>14.1f}')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,111 @@
+"""Занятость пула соединений при всплеске входов.
+
+Сравнивает вход, держащий соединение на время проверки пароля (hold), со входом,
+который возвращает соединение в пул перед хешированием явным commit (release),
+и со входом на сессии DB_SESSION_MODE=unit_of_work, которая делает это сама (unit_of_work).
+
+Запуск: python -m src.benchmarks.pool_occupancy --logins 200 --concurrency 50 --pool-size 5
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import select, literal, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+from src.core.config import settings
+from src.db.postgres import UnitOfWorkSession
+from src.services.hashing import PasswordHasher
+
+
+PASSWORD = 'benchmark-password'
+SAMPLE_INTERVAL = 0.001
+MODES = ('hold', 'release', 'unit_of_work')
+
+
+async def login(session_factory, hasher: PasswordHasher, password_hash: str, mode: str) -> tuple[float, float]:
+    """Повторяет запросы TokenService.login; возвращает ожидание соединения и время входа"""
+    start = time.perf_counter()
+    async with session_factory() as db:
+        # Чтение пользователя по логину; select, а не text, чтобы unit_of_work распознал чтение
+        await db.execute(select(literal(1)))
+        first_query = time.perf_counter() - start
+        if mode == 'release':
+            await db.commit()
+        await hasher.verify(password_hash, PASSWORD)
+        # Запись refresh токена и истории входа
+        await db.execute(text('SELECT 1'))
+        await db.commit()
+    return first_query, time.perf_counter() - start
+
+
+async def sample_pool(pool, samples: list[int]) -> None:
+    while True:
+        samples.append(pool.checkedout())
+        await asyncio.sleep(SAMPLE_INTERVAL)
+
+
+async def run(mode: str, args, hasher: PasswordHasher, password_hash: str) -> dict:
+    engine = create_async_engine(
+        settings.DB_URL, pool_size=args.pool_size, max_overflow=0, pool_timeout=300
+    )
+    session_class = UnitOfWorkSession if mode == 'unit_of_work' else AsyncSession
+    session_factory = async_sessionmaker(engine, class_=session_class, expire_on_commit=False)
+    # Соединения открываем заранее, чтобы не мерить подключение к Postgres
+    async with engine.connect() as conn:
+        await conn.execute(text('SELECT 1'))
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def limited_login():
+        async with semaphore:
+            return await login(session_factory, hasher, password_hash, mode)
+
+    samples = []
+    sampler = asyncio.create_task(sample_pool(engine.sync_engine.pool, samples))
+    start = time.perf_counter()
+    results = await asyncio.gather(*(limited_login() for _ in range(args.logins)))
+    elapsed = time.perf_counter() - start
+    sampler.cancel()
+    await engine.dispose()
+
+    waits = sorted(wait for wait, _ in results)
+    latencies = sorted(latency for _, latency in results)
+    return {
+        'mode': mode,
+        'logins/s': args.logins / elapsed,
+        'wait p50 ms': statistics.median(waits) * 1000,
+        'wait p95 ms': waits[int(len(waits) * 0.95) - 1] * 1000,
+        'login p95 ms': latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        'in use avg': statistics.mean(samples),
+        'in use max': max(samples)
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description='Занятость пула соединений при входе')
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--pool-size', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=settings.HASH_POOL_WORKERS,
+                        help='процессов для хеширования')
+    args = parser.parse_args()
+
+    hasher = PasswordHasher(
+        method=settings.PASSWORD_HASH_METHOD, workers=args.workers,
+        queue_size=args.logins, timeout=300
+    )
+    password_hash = await hasher.hash(PASSWORD)
+    try:
+        rows = [await run(mode, args, hasher, password_hash) for mode in MODES]
+    finally:
+        hasher.shutdown()
+
+    columns = list(rows[0])
+    print(''.join(f'{column:>14}' for column in columns))
+    for row in rows:
+        print(f'{row["mode"]:>14}' + ''.join(f'{row[column]:>14.1f}' for column in columns[1:]))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,95 @@
+"""Стоимость сериализации ответа /users/me.
+
+Сравнивает прежний путь (jsonable_encoder по модели SQLAlchemy, FullUserSchema
+и повторная валидация по response_model) с кодированием из атрибутов модели
+и с телом из кеша по версии строки.
+
+Запуск: python -m src.benchmarks.user_serialization --iterations 20000
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime
+from uuid import UUID, uuid4
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from pydantic import BaseModel
+from sqlalchemy.orm.attributes import set_committed_value
+
+from src.core.config import admin_settings
+from src.models.roles import Role
+from src.models.users import User
+from src.services.users import UserService, encode_user_info
+
+
+REPEATS = 3
+
+
+class LegacyFullUserSchema(BaseModel):
+    id: UUID
+    login: str
+    password: str
+    first_name: str
+    last_name: str
+    created_at: datetime
+    is_admin: bool
+
+
+legacy_response_field = create_response_field('legacy_response', LegacyFullUserSchema)
+
+
+def create_user() -> User:
+    """Пользователь в том же состоянии, что после загрузки из БД с ролями"""
+    user = User(login='benchmark@example.com', first_name='Bench', last_name='Mark')
+    user.id = uuid4()
+    user.password = 'scrypt:32768:8:1$' + 'x' * 100
+    user.created_at = datetime.utcnow()
+    user.version = 1
+    set_committed_value(user, 'roles', [Role(name=admin_settings.ADMIN_ROLE_NAME), Role(name='subscriber')])
+    return user
+
+
+async def encode_legacy(user: User) -> bytes:
+    user_dto = jsonable_encoder(user)
+    user_dto['is_admin'] = user.is_admin()
+    content = await serialize_response(field=legacy_response_field, response_content=LegacyFullUserSchema(**user_dto))
+    return orjson.dumps(content)
+
+
+async def encode_direct(user: User) -> bytes:
+    return encode_user_info(user, user.is_admin())
+
+
+async def encode_cached(user: User) -> bytes:
+    return UserService.get_user_info(user)
+
+
+async def measure(encode, user: User, iterations: int) -> float:
+    """Среднее время в микросекундах, лучший из нескольких прогонов"""
+    async def run(count: int) -> float:
+        start = time.perf_counter()
+        for _ in range(count):
+            await encode(user)
+        return (time.perf_counter() - start) / count * 1_000_000
+
+    await run(iterations // 10)
+    return min([await run(iterations) for _ in range(REPEATS)])
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description='Сериализация ответа /users/me')
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    user = create_user()
+    print(f'{"path":<10}{"us/response":>14}{"bytes":>8}')
+    for name, encode in (('legacy', encode_legacy), ('direct', encode_direct), ('cached', encode_cached)):
+        elapsed = await measure(encode, user, args.iterations)
+        print(f'{name:<10}{elapsed:>14.1f}{len(await encode(user)):>8}')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
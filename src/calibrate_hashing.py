@@ -0,0 +1,71 @@
+"""Подбор стоимости хеширования паролей под бюджет CPU на один вход.
+
+Запуск: python -m src.calibrate_hashing --budget-ms 250 --method scrypt
+"""
+import argparse
+import statistics
+import time
+
+from werkzeug.security import generate_password_hash
+
+
+SCRYPT_LOG2_N = range(14, 21)
+PBKDF2_PROBE_ITERATIONS = 100_000
+PBKDF2_STEP = 10_000
+
+
+def measure(method: str, samples: int) -> float:
+    """Медианное время одного хеширования в секундах"""
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        generate_password_hash('calibration-password', method)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def calibrate_scrypt(budget: float, samples: int) -> list[tuple[str, float]]:
+    results = []
+    for log2_n in SCRYPT_LOG2_N:
+        method = f'scrypt:{2 ** log2_n}:8:1'
+        elapsed = measure(method, samples)
+        results.append((method, elapsed))
+        if elapsed > budget:
+            break
+    return results
+
+
+def calibrate_pbkdf2(budget: float, samples: int) -> list[tuple[str, float]]:
+    probe = measure(f'pbkdf2:sha256:{PBKDF2_PROBE_ITERATIONS}', samples)
+    # Время PBKDF2 линейно по числу итераций
+    iterations = int(budget / probe * PBKDF2_PROBE_ITERATIONS) // PBKDF2_STEP * PBKDF2_STEP
+    iterations = max(iterations, PBKDF2_STEP)
+    method = f'pbkdf2:sha256:{iterations}'
+    return [(f'pbkdf2:sha256:{PBKDF2_PROBE_ITERATIONS}', probe), (method, measure(method, samples))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Подбор параметров PASSWORD_HASH_METHOD')
+    parser.add_argument('--budget-ms', type=float, default=250.0,
+                        help='допустимое время CPU на одну проверку пароля, мс')
+    parser.add_argument('--method', choices=('scrypt', 'pbkdf2'), default='scrypt')
+    parser.add_argument('--samples', type=int, default=5, help='замеров на каждый вариант')
+    args = parser.parse_args()
+
+    budget = args.budget_ms / 1000
+    calibrate = calibrate_scrypt if args.method == 'scrypt' else calibrate_pbkdf2
+    results = calibrate(budget, args.samples)
+
+    print(f'{"method":<28}{"ms/hash":>10}{"logins/s/core":>16}')
+    for method, elapsed in results:
+        print(f'{method:<28}{elapsed * 1000:>10.1f}{1 / elapsed:>16.1f}')
+
+    fitting = [method for method, elapsed in results if elapsed <= budget]
+    if not fitting:
+        print(f'\nNo parameters fit into {args.budget_ms:.0f} ms, raise the budget.')
+        return
+    print(f'\nRecommended: PASSWORD_HASH_METHOD={fitting[-1]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,7 @@
+from typing import Literal
+
 from async_fastapi_jwt_auth import AuthJWT
 from pydantic_settings import BaseSettings
-from authlib.integrations.starlette_client import OAuth
-from starlette.config import Config
 
 
 class AuthJWTSettings(BaseSettings):
@@ -20,6 +20,71 @@ class Setting(BaseSettings):
     REFRESH_TOKEN_EXPIRE: int
     jaeger_agent_host_name: str
     jaeger_agent_port: int
+    TRACING_ENABLED: bool = True
+    TRACING_EXPORTER: Literal['jaeger', 'otlp_grpc', 'otlp_http', 'none'] = 'jaeger'
+    TRACING_OTLP_ENDPOINT: str | None = None
+    TRACING_CONSOLE_EXPORT: bool = False
+    TRACING_SAMPLE_RATIO: float = 0.1
+    TRACING_SLOW_REQUEST_MS: float | None = 1000.0
+    TRACING_PROMOTE_ERRORS: bool = True
+    TRACING_TAIL_BUFFER_TRACES: int = 10000
+    METRICS_EXPORT_ENDPOINT: str | None = None
+    DB_ECHO: bool = False
+    DB_POOL_PROFILE: Literal['default', 'pgbouncer'] = 'default'
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    DB_SESSION_MODE: Literal['request', 'unit_of_work'] = 'request'
+    PRINCIPAL_CACHE_ENABLED: bool = False
+    PRINCIPAL_CACHE_SIZE: int = 10000
+    PRINCIPAL_CACHE_TTL: float = 60.0
+    ROLE_VERSION_CACHE_TTL: float = 1.0
+    ROLES_BULK_MAX_SIZE: int = 100000
+    LOGOUT_REPLICA_ENABLED: bool = True
+    REPLICA_PRUNE_INTERVAL: float = 60.0
+    ROLE_CATALOG_CACHE_ENABLED: bool = True
+    ROLE_CATALOG_TTL: float = 300.0
+    USER_INFO_CACHE_SIZE: int = 10000
+    REFRESH_TOKEN_STORE: Literal['postgres', 'redis'] = 'postgres'
+    REFRESH_TOKEN_PURGE_INTERVAL: int = 3600
+    USER_PURGE_INTERVAL: float = 60.0
+    USER_PURGE_BATCH_SIZE: int = 5000
+    USER_PURGE_CLAIM_TIMEOUT: float = 600.0
+    HISTORY_WRITE_BEHIND: bool = False
+    HISTORY_BATCH_SIZE: int = 500
+    HISTORY_FLUSH_INTERVAL: float = 1.0
+    HISTORY_MAX_BACKLOG: int = 100000
+    HISTORY_PARTITIONS_AHEAD: int = 2
+    HISTORY_RETENTION_MONTHS: int | None = None
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_TRUST_PROXY_HEADERS: bool = False
+    # Адреса и сети (CIDR) прокси, чьим X-Real-IP и X-Forwarded-For можно верить
+    RATE_LIMIT_TRUSTED_PROXIES: list[str] = []
+    RATE_LIMIT_LOCAL_KEYS: int = 10000
+    PASSWORD_HASH_METHOD: str = 'scrypt:32768:8:1'
+    HASH_POOL_WORKERS: int = 2
+    HASH_QUEUE_SIZE: int = 64
+    HASH_TIMEOUT: float = 5.0
+    OAUTH_HTTP2: bool = False
+    OAUTH_MAX_CONNECTIONS: int = 20
+    OAUTH_KEEPALIVE_EXPIRY: float = 60.0
+    OAUTH_METADATA_TTL: float = 3600.0
+    OAUTH_METADATA_STALE_TTL: float = 86400.0
+    OAUTH_METADATA_CACHE_FILE: str | None = None
+    JWT_KEYS_DIR: str | None = None
+    JWT_ACTIVE_KID: str | None = None
+    JWT_KEY_ACTIVATION_DELAY: float = 600.0
+    JWT_KEYS_RELOAD_INTERVAL: float = 60.0
+    JWT_ACCEPT_HS256: bool = True
+    JWKS_MAX_AGE: int = 300
+    INTROSPECT_MAX_TOKENS: int = 100
+    INTROSPECT_CACHE_SIZE: int = 10000
+    INTROSPECT_CACHE_TTL: float = 30.0
+    # Секреты шлюзов для /auth/introspect (заголовок X-Gateway-Token); несколько - для ротации
+    INTROSPECT_GATEWAY_TOKENS: list[str] = []
 
 
 class AdminSettings(BaseSettings):
@@ -38,22 +103,6 @@ class GoogleSettings(BaseSettings):
 google_settings = GoogleSettings()
 
 
-config_data = {
-    'GOOGLE_CLIENT_ID': google_settings.GOOGLE_CLIENT_ID,
-    'GOOGLE_CLIENT_SECRET': google_settings.GOOGLE_CLIENT_SECRET
-}
-starlette_config = Config(environ=config_data)
-oauth = OAuth(starlette_config)
-oauth.register(
-    name='google',
-    server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
-    client_kwargs={'scope': 'openid email profile'},
-)
-oauth_services = {
-    'google': oauth.google
-}
-
-
 @AuthJWT.load_config
 def get_auth_settings() -> AuthJWTSettings:
     return AuthJWTSettings()
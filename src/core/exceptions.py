@@ -1,10 +1,12 @@
+from functools import partial
 from http import HTTPStatus
 
 
 class CustomException(Exception):
-    def __init__(self, message: str, status_code: int):
+    def __init__(self, message: str, status_code: int, headers: dict[str, str] | None = None):
         self.message = message
         self.status_code = status_code
+        self.headers = headers
 
 
 class ErrorMessagesUtil:
@@ -35,6 +37,10 @@ class ErrorMessagesUtil:
     def user_does_not_have_rights():
         return f"User does not have rights for that action"
 
+    @staticmethod
+    def roles_bulk_is_invalid():
+        return f"Pass either memberships or role_id with user_ids, not both and not empty."
+
     # Пользователи
 
     @staticmethod
@@ -45,6 +51,10 @@ class ErrorMessagesUtil:
     def user_already_exists():
         return f"User already exists."
 
+    @staticmethod
+    def user_changed_concurrently():
+        return f"User was changed by another request, try again."
+
     @staticmethod
     def wrong_password():
         return f"Wrong password given."
@@ -53,6 +63,26 @@ class ErrorMessagesUtil:
     def password_is_weak():
         return f"Password is weak."
 
+    @staticmethod
+    def password_hasher_overloaded():
+        return f"Too many password checks in progress, try again later."
+
+    @staticmethod
+    def password_hashing_timeout():
+        return f"Password check took too long, try again later."
+
+    # История входов
+
+    @staticmethod
+    def history_cursor_is_invalid():
+        return f"History cursor is invalid."
+
+    # Ограничение запросов
+
+    @staticmethod
+    def rate_limit_exceeded():
+        return f"Too many requests, try again later."
+
     # Токены
 
     @staticmethod
@@ -67,66 +97,137 @@ class ErrorMessagesUtil:
     def refresh_token_is_invalid():
         return f"Refresh token is invalid."
 
+    @staticmethod
+    def session_not_found():
+        return f"Session not found."
+
     @staticmethod
     def user_not_authorized():
         return f"User not authorized."
 
+    @staticmethod
+    def gateway_not_authorized():
+        return f"Gateway credentials are missing or invalid."
+
     @staticmethod
     def oauth_error():
         return f"OAuth get an error"
 
 
-USER_NOT_AUTHORIZED = CustomException(
+# Фабрики исключений: экземпляр на каждый raise, общий накапливал бы __traceback__ запросов
+USER_NOT_AUTHORIZED = partial(
+    CustomException,
     status_code=HTTPStatus.UNAUTHORIZED,
     message=ErrorMessagesUtil.user_not_authorized()
 )
 
-USER_NOT_FOUND = CustomException(
+GATEWAY_NOT_AUTHORIZED = partial(
+    CustomException,
+    status_code=HTTPStatus.UNAUTHORIZED,
+    message=ErrorMessagesUtil.gateway_not_authorized()
+)
+
+USER_NOT_FOUND = partial(
+    CustomException,
     status_code=HTTPStatus.BAD_REQUEST,
     message=ErrorMessagesUtil.user_not_found()
 )
 
-ACCESS_TOKEN_IS_INVALID = CustomException(
+ACCESS_TOKEN_IS_INVALID = partial(
+    CustomException,
     status_code=HTTPStatus.BAD_REQUEST,
     message=ErrorMessagesUtil.access_token_is_invalid()
 )
 
-WRONG_PASSWORD = CustomException(
+WRONG_PASSWORD = partial(
+    CustomException,
     status_code=HTTPStatus.BAD_REQUEST,
     message=ErrorMessagesUtil.wrong_password()
 )
 
-REFRESH_TOKEN_IS_INVALID = CustomException(
+REFRESH_TOKEN_IS_INVALID = partial(
+    CustomException,
     status_code=HTTPStatus.BAD_REQUEST,
     message=ErrorMessagesUtil.refresh_token_is_invalid()
 )
 
-USER_ALREADY_EXIST = CustomException(
+USER_ALREADY_EXIST = partial(
+    CustomException,
     status_code=HTTPStatus.CONFLICT,
     message=ErrorMessagesUtil.user_already_exists()
 )
 
-ROLE_NOT_FOUND = CustomException(
+USER_CHANGED_CONCURRENTLY = partial(
+    CustomException,
+    status_code=HTTPStatus.CONFLICT,
+    message=ErrorMessagesUtil.user_changed_concurrently()
+)
+
+ROLE_NOT_FOUND = partial(
+    CustomException,
     status_code=HTTPStatus.BAD_REQUEST,
     message=ErrorMessagesUtil.role_not_found()
 )
 
-USER_DOES_NOT_HAVE_RIGHTS = CustomException(
+USER_DOES_NOT_HAVE_RIGHTS = partial(
+    CustomException,
     status_code=HTTPStatus.FORBIDDEN,
     message=ErrorMessagesUtil.user_does_not_have_rights()
 )
 
-USER_DOES_NOT_HAVE_ROLE = CustomException(
+USER_DOES_NOT_HAVE_ROLE = partial(
+    CustomException,
     status_code=HTTPStatus.NOT_FOUND,
     message=ErrorMessagesUtil.user_doesnt_have_this_role()
 )
 
-ROLE_ALREADY_EXIST = CustomException(
+ROLE_ALREADY_EXIST = partial(
+    CustomException,
     status_code=HTTPStatus.CONFLICT,
     message=ErrorMessagesUtil.role_already_exist()
 )
 
-OAUTH_ERROR = CustomException(
+ROLES_BULK_IS_INVALID = partial(
+    CustomException,
+    status_code=HTTPStatus.BAD_REQUEST,
+    message=ErrorMessagesUtil.roles_bulk_is_invalid()
+)
+
+PASSWORD_HASHER_OVERLOADED = partial(
+    CustomException,
+    status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+    message=ErrorMessagesUtil.password_hasher_overloaded()
+)
+
+PASSWORD_HASHING_TIMEOUT = partial(
+    CustomException,
+    status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+    message=ErrorMessagesUtil.password_hashing_timeout()
+)
+
+HISTORY_CURSOR_IS_INVALID = partial(
+    CustomException,
+    status_code=HTTPStatus.BAD_REQUEST,
+    message=ErrorMessagesUtil.history_cursor_is_invalid()
+)
+
+
+def rate_limit_exceeded(retry_after: int) -> CustomException:
+    return CustomException(
+        status_code=HTTPStatus.TOO_MANY_REQUESTS,
+        message=ErrorMessagesUtil.rate_limit_exceeded(),
+        headers={'Retry-After': str(retry_after)}
+    )
+
+
+SESSION_NOT_FOUND = partial(
+    CustomException,
+    status_code=HTTPStatus.NOT_FOUND,
+    message=ErrorMessagesUtil.session_not_found()
+)
+
+OAUTH_ERROR = partial(
+    CustomException,
     status_code=HTTPStatus.BAD_REQUEST,
     message=ErrorMessagesUtil.oauth_error()
 )
@@ -0,0 +1,89 @@
+import logging
+from contextvars import ContextVar
+
+import orjson
+from opentelemetry import trace
+from starlette.middleware.sessions import SessionMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send, Message
+
+
+REQUEST_ID_HEADER = b'x-request-id'
+
+request_id_var: ContextVar[str | None] = ContextVar('request_id', default=None)
+
+MISSING_REQUEST_ID_BODY = orjson.dumps({'detail': 'X-Request-Id is required'})
+
+
+class RequestIdMiddleware:
+    """Проверяет X-Request-Id до маршрутизации и прокидывает его в span, логи и ответ.
+
+    Пути с public_path_prefixes (JWKS для других сервисов) принимаются и без него.
+    """
+
+    def __init__(self, app: ASGIApp, public_path_prefixes: tuple[str, ...] = ()) -> None:
+        self.app = app
+        self.public_path_prefixes = public_path_prefixes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        request_id = next((value for name, value in scope['headers'] if name == REQUEST_ID_HEADER), None)
+        if not request_id:
+            if scope['path'].startswith(self.public_path_prefixes):
+                await self.app(scope, receive, send)
+                return
+            await self.reject(send)
+            return
+
+        request_id_header = (REQUEST_ID_HEADER, request_id)
+        request_id = request_id.decode('latin-1')
+        trace.get_current_span().set_attribute('http.request_id', request_id)
+        token = request_id_var.set(request_id)
+
+        async def send_with_request_id(message: Message) -> None:
+            if message['type'] == 'http.response.start':
+                message['headers'] = [*message.get('headers', ()), request_id_header]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(token)
+
+    @staticmethod
+    async def reject(send: Send) -> None:
+        await send({
+            'type': 'http.response.start',
+            'status': 400,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(MISSING_REQUEST_ID_BODY)).encode())
+            ]
+        })
+        await send({'type': 'http.response.body', 'body': MISSING_REQUEST_ID_BODY})
+
+
+class PathSessionMiddleware:
+    """SessionMiddleware только для путей с указанными префиксами, остальным запросам
+    не нужно проверять и переподписывать cookie сессии"""
+
+    def __init__(self, app: ASGIApp, path_prefixes: tuple[str, ...], **session_options) -> None:
+        self.app = app
+        self.session_app = SessionMiddleware(app, **session_options)
+        self.path_prefixes = path_prefixes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] == 'http' and scope['path'].startswith(self.path_prefixes):
+            await self.session_app(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+
+class RequestIdLogFilter(logging.Filter):
+    """Добавляет request_id текущего запроса в записи лога"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get() or '-'
+        return True
@@ -0,0 +1,268 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, asdict
+from functools import partial
+
+import httpx
+import orjson
+from authlib.integrations.starlette_client import OAuth, StarletteOAuth2App
+from opentelemetry import metrics
+
+from src.core.config import settings, google_settings
+
+
+logger = logging.getLogger(__name__)
+
+meter = metrics.get_meter(__name__)
+
+# Принудительное обновление JWKS (неизвестный kid в id_token) не чаще раза в столько секунд
+MIN_FORCED_REFRESH = 30.0
+
+document_counter = meter.create_counter(
+    'auth.oauth.documents',
+    description='Обращения к метаданным и JWKS провайдеров; result: hit, stale, fetch, error'
+)
+network_histogram = meter.create_histogram(
+    'auth.oauth.callback.network_duration',
+    unit='s',
+    description='Время ответа провайдера OAuth за время обработки callback'
+)
+local_histogram = meter.create_histogram(
+    'auth.oauth.callback.local_duration',
+    unit='s',
+    description='Собственное время обработки callback без ожидания провайдера'
+)
+
+# Накопленное время сетевых запросов к провайдерам в текущем callback
+network_time_var: ContextVar[list[float] | None] = ContextVar('oauth_network_time', default=None)
+
+
+def add_network_time(elapsed: float) -> None:
+    network_time = network_time_var.get()
+    if network_time is not None:
+        network_time[0] += elapsed
+
+
+class TimedByteStream(httpx.AsyncByteStream):
+    """Тело ответа, время чтения которого тоже считается сетевым"""
+
+    def __init__(self, stream: httpx.AsyncByteStream) -> None:
+        self.stream = stream
+
+    async def __aiter__(self):
+        iterator = self.stream.__aiter__()
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+            finally:
+                add_network_time(time.perf_counter() - start)
+            yield chunk
+
+    async def aclose(self) -> None:
+        await self.stream.aclose()
+
+
+class SharedTransport(httpx.AsyncBaseTransport):
+    """Пул соединений, общий для всех провайдеров.
+
+    authlib создает клиента на каждый запрос и закрывает его вместе с транспортом,
+    поэтому aclose здесь ничего не делает, а пул закрывается в close при остановке.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport) -> None:
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        start = time.perf_counter()
+        try:
+            response = await self.transport.handle_async_request(request)
+        finally:
+            add_network_time(time.perf_counter() - start)
+        response.stream = TimedByteStream(response.stream)
+        return response
+
+    async def aclose(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        await self.transport.aclose()
+
+
+@dataclass(slots=True)
+class CachedDocument:
+    value: dict
+    fetched_at: float
+
+
+class ProviderDocumentCache:
+    """Метаданные OpenID и JWKS провайдеров с TTL и stale-while-revalidate.
+
+    Устаревший документ отдается сразу, а обновляется в фоне; если провайдер
+    недоступен, остается последний полученный. С path документы сохраняются
+    в файл, и после перезапуска воркер не ждет провайдера.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, ttl: float, stale_ttl: float,
+                 path: str | None = None) -> None:
+        self.transport = transport
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.path = path
+        self._documents: dict[str, CachedDocument] = {}
+        self._refreshes: dict[str, asyncio.Task] = {}
+
+    def load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'rb') as file:
+                documents = orjson.loads(file.read())
+            self._documents = {url: CachedDocument(**document) for url, document in documents.items()}
+        except (OSError, ValueError, TypeError) as error:
+            logger.warning('Failed to load OAuth provider documents from %s: %s', self.path, error)
+
+    def save(self, documents: dict[str, dict]) -> None:
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'wb') as file:
+            file.write(orjson.dumps(documents))
+        os.replace(tmp_path, self.path)
+
+    async def get(self, url: str, force: bool = False) -> dict:
+        document = self._documents.get(url)
+        if document is not None:
+            age = time.time() - document.fetched_at
+            if force and age < MIN_FORCED_REFRESH:
+                force = False
+            if not force and age < self.ttl:
+                document_counter.add(1, {'result': 'hit'})
+                return document.value
+            if not force and age < self.ttl + self.stale_ttl:
+                document_counter.add(1, {'result': 'stale'})
+                self.start_refresh(url)
+                return document.value
+
+        try:
+            return await asyncio.shield(self.start_refresh(url))
+        except Exception as error:
+            if document is None:
+                raise
+            logger.warning('Failed to refresh %s, using stale document: %s', url, error)
+            return document.value
+
+    def start_refresh(self, url: str) -> asyncio.Task:
+        """Одна загрузка документа на воркер, сколько бы запросов его ни ждали"""
+        task = self._refreshes.get(url)
+        if task is None:
+            task = asyncio.create_task(self.fetch(url))
+            task.add_done_callback(partial(self.on_refreshed, url))
+            self._refreshes[url] = task
+        return task
+
+    def on_refreshed(self, url: str, task: asyncio.Task) -> None:
+        self._refreshes.pop(url, None)
+        if not task.cancelled() and task.exception() is not None:
+            document_counter.add(1, {'result': 'error'})
+            logger.warning('Failed to fetch OAuth provider document %s: %s', url, task.exception())
+
+    async def fetch(self, url: str) -> dict:
+        async with httpx.AsyncClient(transport=self.transport) as client:
+            response = await client.get(url)
+            response.raise_for_status()
+            value = response.json()
+        document_counter.add(1, {'result': 'fetch'})
+        self._documents[url] = CachedDocument(value=value, fetched_at=time.time())
+        if self.path:
+            documents = {url: asdict(document) for url, document in self._documents.items()}
+            try:
+                await asyncio.to_thread(self.save, documents)
+            except OSError as error:
+                logger.warning('Failed to save OAuth provider documents to %s: %s', self.path, error)
+        return value
+
+
+shared_transport = SharedTransport(httpx.AsyncHTTPTransport(
+    http2=settings.OAUTH_HTTP2,
+    limits=httpx.Limits(
+        max_connections=settings.OAUTH_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.OAUTH_MAX_CONNECTIONS,
+        keepalive_expiry=settings.OAUTH_KEEPALIVE_EXPIRY
+    )
+))
+provider_documents = ProviderDocumentCache(
+    shared_transport,
+    ttl=settings.OAUTH_METADATA_TTL,
+    stale_ttl=settings.OAUTH_METADATA_STALE_TTL,
+    path=settings.OAUTH_METADATA_CACHE_FILE
+)
+provider_documents.load()
+
+
+class CachedOAuth2App(StarletteOAuth2App):
+    """Клиент провайдера с общим пулом соединений и кешем метаданных и JWKS"""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.client_kwargs = {'transport': shared_transport, **self.client_kwargs}
+
+    async def load_server_metadata(self) -> dict:
+        if not self._server_metadata_url:
+            return self.server_metadata
+        metadata = await provider_documents.get(self._server_metadata_url)
+        return {**self.server_metadata, **metadata}
+
+    async def fetch_jwk_set(self, force: bool = False) -> dict:
+        metadata = await self.load_server_metadata()
+        if metadata.get('jwks') and not force:
+            return metadata['jwks']
+        uri = metadata.get('jwks_uri')
+        if not uri:
+            raise RuntimeError('Missing "jwks_uri" in metadata')
+        return await provider_documents.get(uri, force=force)
+
+
+class CachedOAuth(OAuth):
+    oauth2_client_cls = CachedOAuth2App
+
+
+@contextmanager
+def measure_callback(provider: str):
+    """Делит время обработки callback на ожидание провайдера и собственную работу"""
+    network_time = [0.0]
+    token = network_time_var.set(network_time)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        network_time_var.reset(token)
+        network_histogram.record(network_time[0], {'provider': provider})
+        local_histogram.record(max(elapsed - network_time[0], 0.0), {'provider': provider})
+
+
+oauth = CachedOAuth()
+oauth.register(
+    name='google',
+    client_id=google_settings.GOOGLE_CLIENT_ID,
+    client_secret=google_settings.GOOGLE_CLIENT_SECRET,
+    server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
+    client_kwargs={'scope': 'openid email profile'},
+)
+oauth_services = {
+    'google': oauth.google
+}
+
+
+async def prefetch_provider_documents() -> None:
+    """Загрузка метаданных и JWKS при старте, чтобы первый вход не ждал провайдера"""
+    for name, provider in oauth_services.items():
+        try:
+            await provider.fetch_jwk_set()
+        except Exception as error:
+            logger.warning('Failed to prefetch OAuth provider %s documents: %s', name, error)
@@ -0,0 +1,193 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from dataclasses import dataclass
+
+import jwt
+import orjson
+from async_fastapi_jwt_auth import AuthJWT
+from async_fastapi_jwt_auth.exceptions import InvalidHeaderError, JWTDecodeError
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+from jwt.algorithms import ECAlgorithm, OKPAlgorithm
+
+from src.core.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+KEY_FILE_SUFFIX = '.pem'
+
+
+@dataclass(frozen=True, slots=True)
+class SigningKey:
+    kid: str
+    algorithm: str
+    private_key: ec.EllipticCurvePrivateKey | ed25519.Ed25519PrivateKey
+    public_key: ec.EllipticCurvePublicKey | ed25519.Ed25519PublicKey
+    # Время появления ключа: подписывать им можно только после публикации в JWKS
+    created_at: float
+
+    @classmethod
+    def from_pem(cls, kid: str, pem: bytes, created_at: float) -> 'SigningKey':
+        private_key = serialization.load_pem_private_key(pem, password=None)
+        if isinstance(private_key, ed25519.Ed25519PrivateKey):
+            algorithm = 'EdDSA'
+        elif isinstance(private_key, ec.EllipticCurvePrivateKey) and isinstance(private_key.curve, ec.SECP256R1):
+            algorithm = 'ES256'
+        else:
+            raise ValueError(f'Unsupported key type for {kid}: use Ed25519 or EC P-256')
+        return cls(kid, algorithm, private_key, private_key.public_key(), created_at)
+
+    def public_jwk(self) -> dict:
+        if self.algorithm == 'EdDSA':
+            jwk = OKPAlgorithm.to_jwk(self.public_key, as_dict=True)
+        else:
+            jwk = ECAlgorithm.to_jwk(self.public_key, as_dict=True)
+        return {**jwk, 'kid': self.kid, 'alg': self.algorithm, 'use': 'sig'}
+
+
+class KeyRing:
+    """Ключи подписи токенов из каталога: файл <kid>.pem с закрытым ключом Ed25519 или EC P-256.
+
+    Все ключи каталога публикуются в JWKS и принимаются при проверке. Подписывает
+    JWT_ACTIVE_KID, а без него - самый новый ключ, опубликованный не меньше
+    JWT_KEY_ACTIVATION_DELAY назад. Ротация: положить новый ключ, старый удалить,
+    когда истекут выданные им refresh токены.
+    """
+
+    def __init__(self, path: str | None, active_kid: str | None, activation_delay: float) -> None:
+        self.path = path
+        self.active_kid = active_kid
+        self.activation_delay = activation_delay
+        self._keys: dict[str, SigningKey] = {}
+        self.jwks = orjson.dumps({'keys': []})
+        self.etag = self.make_etag(self.jwks)
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    @staticmethod
+    def make_etag(body: bytes) -> str:
+        return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+    def load(self) -> None:
+        if not self.enabled:
+            return
+        keys = {}
+        for file_name in sorted(os.listdir(self.path)):
+            if not file_name.endswith(KEY_FILE_SUFFIX):
+                continue
+            file_path = os.path.join(self.path, file_name)
+            kid = file_name.removesuffix(KEY_FILE_SUFFIX)
+            previous = self._keys.get(kid)
+            created_at = os.path.getmtime(file_path)
+            if previous and previous.created_at == created_at:
+                keys[kid] = previous
+                continue
+            with open(file_path, 'rb') as file:
+                keys[kid] = SigningKey.from_pem(kid, file.read(), created_at)
+        if not keys:
+            raise ValueError(f'No signing keys found in {self.path}')
+        self._keys = keys
+        self.jwks = orjson.dumps({'keys': [key.public_jwk() for key in keys.values()]})
+        self.etag = self.make_etag(self.jwks)
+
+    def get(self, kid: str) -> SigningKey | None:
+        return self._keys.get(kid)
+
+    @property
+    def active(self) -> SigningKey | None:
+        if not self._keys:
+            return None
+        if self.active_kid in self._keys:
+            return self._keys[self.active_kid]
+        keys = sorted(self._keys.values(), key=lambda key: key.created_at)
+        published = [key for key in keys if key.created_at + self.activation_delay <= time.time()]
+        # При первом запуске опубликованных заранее ключей нет - подписываем самым старым
+        return published[-1] if published else keys[0]
+
+
+class KeyedAuthJWT(AuthJWT):
+    """AuthJWT с подписью ключами из key_ring (заголовок kid) и проверкой по kid.
+
+    Токены без kid проверяются прежним общим секретом HS256, пока это разрешено
+    JWT_ACCEPT_HS256. Проверенные claims запоминаются на время запроса: get_raw_jwt
+    вызывается несколько раз, а проверка подписи не бесплатна.
+    """
+
+    async def _create_token(self, algorithm: str | None = None, headers: dict | None = None, **kwargs) -> str:
+        signing_key = key_ring.active
+        self._signing_key = signing_key
+        if signing_key is None:
+            return await super()._create_token(algorithm=algorithm, headers=headers, **kwargs)
+        return await super()._create_token(
+            algorithm=signing_key.algorithm, headers={**(headers or {}), 'kid': signing_key.kid}, **kwargs
+        )
+
+    async def _get_secret_key(self, algorithm: str, process: str):
+        signing_key = getattr(self, '_signing_key', None)
+        if process == 'encode' and signing_key is not None:
+            return signing_key.private_key
+        return await super()._get_secret_key(algorithm, process)
+
+    async def _verified_token(self, encoded_token: str, issuer: str | None = None) -> dict:
+        verified = self.__dict__.setdefault('_verified_tokens', {})
+        claims = verified.get((encoded_token, issuer))
+        if claims is None:
+            claims = await self._verify(encoded_token, issuer)
+            verified[(encoded_token, issuer)] = claims
+        return claims
+
+    async def verify_access_token(self, encoded_token: str) -> dict:
+        """Claims чужого access токена (не из запроса), как при проверке jwt_required"""
+        claims = await self._verified_token(encoded_token, self._decode_issuer)
+        if claims.get('type') != 'access':
+            raise JWTDecodeError(status_code=422, message='Only access tokens are allowed')
+        return claims
+
+    async def _verify(self, encoded_token: str, issuer: str | None) -> dict:
+        try:
+            kid = jwt.get_unverified_header(encoded_token).get('kid')
+        except Exception as err:
+            raise InvalidHeaderError(status_code=422, message=str(err))
+        if kid is None:
+            if key_ring.enabled and not settings.JWT_ACCEPT_HS256:
+                raise JWTDecodeError(status_code=422, message='Token has no key id')
+            return await super()._verified_token(encoded_token, issuer)
+
+        signing_key = key_ring.get(kid)
+        if signing_key is None:
+            raise JWTDecodeError(status_code=422, message=f'Unknown key id {kid}')
+        try:
+            return jwt.decode(
+                encoded_token,
+                signing_key.public_key,
+                issuer=issuer,
+                audience=self._decode_audience,
+                leeway=self._decode_leeway,
+                algorithms=[signing_key.algorithm]
+            )
+        except Exception as err:
+            raise JWTDecodeError(status_code=422, message=str(err))
+
+
+async def run_key_reload() -> None:
+    """Подхватывает добавленные и удаленные ключи без перезапуска"""
+    while True:
+        await asyncio.sleep(settings.JWT_KEYS_RELOAD_INTERVAL)
+        try:
+            await asyncio.to_thread(key_ring.load)
+        except Exception:
+            logger.warning('Failed to reload signing keys from %s', key_ring.path, exc_info=True)
+
+
+key_ring = KeyRing(
+    path=settings.JWT_KEYS_DIR,
+    active_kid=settings.JWT_ACTIVE_KID,
+    activation_delay=settings.JWT_KEY_ACTIVATION_DELAY
+)
+key_ring.load()
@@ -0,0 +1,134 @@
+import threading
+from typing import Sequence
+
+from opentelemetry import trace
+from opentelemetry.context import Context
+from opentelemetry.sdk.trace import ReadableSpan, SpanProcessor
+from opentelemetry.sdk.trace.sampling import Decision, Sampler, SamplingResult
+from opentelemetry.trace import Link, SpanContext, SpanKind, StatusCode, TraceFlags
+from opentelemetry.util.types import Attributes
+
+from src.core.cache import TTLCache
+
+
+# Сколько ждать корневой span трассы, прежде чем выбросить ее буфер
+TAIL_BUFFER_TTL = 60.0
+MAX_SPANS_PER_TRACE = 512
+
+
+def in_trace() -> bool:
+    """Запросы к Redis и Postgres из фоновых циклов идут вне трассы запроса и span-ов не пишут"""
+    return trace.get_current_span().get_span_context().is_valid
+
+
+class RecordingSampler(Sampler):
+    """Не попавшие в выборку span-ы все равно записываются (RECORD_ONLY),
+    чтобы TailPromotingSpanProcessor мог отправить трассу с ошибкой или медленным запросом"""
+
+    def __init__(self, delegate: Sampler) -> None:
+        self.delegate = delegate
+
+    def should_sample(
+            self,
+            parent_context: Context | None,
+            trace_id: int,
+            name: str,
+            kind: SpanKind | None = None,
+            attributes: Attributes = None,
+            links: Sequence[Link] | None = None,
+            trace_state=None
+    ) -> SamplingResult:
+        result = self.delegate.should_sample(
+            parent_context, trace_id, name, kind, attributes, links, trace_state
+        )
+        if result.decision != Decision.DROP:
+            return result
+        return SamplingResult(Decision.RECORD_ONLY, result.attributes, result.trace_state)
+
+    def get_description(self) -> str:
+        return f'RecordingSampler{{{self.delegate.get_description()}}}'
+
+
+class TailPromotingSpanProcessor(SpanProcessor):
+    """Передает в экспорт трассы из выборки, а также трассы запросов вне выборки,
+    корневой span которых завершился ошибкой или длился дольше slow_ns"""
+
+    def __init__(self, delegate: SpanProcessor, slow_ns: int | None, promote_errors: bool, max_traces: int) -> None:
+        self.delegate = delegate
+        self.slow_ns = slow_ns
+        self.promote_errors = promote_errors
+        self._buffers = TTLCache(max_traces, TAIL_BUFFER_TTL)
+        # Span-ы, завершившиеся после корня (фоновые задачи запроса), идут следом за трассой
+        self._promoted = TTLCache(max_traces, TAIL_BUFFER_TTL)
+        self._lock = threading.Lock()
+
+    def on_start(self, span, parent_context: Context | None = None) -> None:
+        self.delegate.on_start(span, parent_context)
+
+    def on_end(self, span: ReadableSpan) -> None:
+        if span.context.trace_flags.sampled:
+            self.delegate.on_end(span)
+            return
+
+        trace_id = span.context.trace_id
+        with self._lock:
+            if self._promoted.get(trace_id):
+                self.delegate.on_end(as_sampled(span))
+                return
+            buffer = self._buffers.get(trace_id)
+            if buffer is None:
+                buffer = []
+                self._buffers.set(trace_id, buffer)
+            if len(buffer) < MAX_SPANS_PER_TRACE:
+                buffer.append(span)
+            if not self.is_local_root(span):
+                return
+            self._buffers.pop(trace_id)
+            if not self.should_promote(span):
+                return
+            self._promoted.set(trace_id, True)
+        for buffered_span in buffer:
+            self.delegate.on_end(as_sampled(buffered_span))
+
+    @staticmethod
+    def is_local_root(span: ReadableSpan) -> bool:
+        return span.parent is None or span.parent.is_remote
+
+    def should_promote(self, span: ReadableSpan) -> bool:
+        # Корни фоновых задач (долгие блокирующие чтения) медленными запросами не считаются
+        if span.kind != SpanKind.SERVER:
+            return False
+        if self.promote_errors:
+            if span.status.status_code == StatusCode.ERROR:
+                return True
+            if (span.attributes or {}).get('http.status_code', 0) >= 500:
+                return True
+        return self.slow_ns is not None and span.end_time - span.start_time >= self.slow_ns
+
+    def shutdown(self) -> None:
+        self.delegate.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self.delegate.force_flush(timeout_millis)
+
+
+def as_sampled(span: ReadableSpan) -> ReadableSpan:
+    """Копия span-а с флагом sampled: экспортеры пропускают span-ы без него"""
+    context = span.context
+    return ReadableSpan(
+        name=span.name,
+        context=SpanContext(
+            context.trace_id, context.span_id, context.is_remote,
+            TraceFlags(context.trace_flags | TraceFlags.SAMPLED), context.trace_state
+        ),
+        parent=span.parent,
+        resource=span.resource,
+        attributes=span.attributes,
+        events=span.events,
+        links=span.links,
+        kind=span.kind,
+        status=span.status,
+        start_time=span.start_time,
+        end_time=span.end_time,
+        instrumentation_scope=span.instrumentation_scope
+    )
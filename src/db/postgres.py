@@ -1,15 +1,257 @@
-from sqlalchemy.orm import declarative_base
+import time
+from uuid import uuid4
+
+from opentelemetry import metrics, trace
+from opentelemetry.metrics import Observation
+from opentelemetry.trace import SpanKind, Status, StatusCode
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import declarative_base, Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 
 from src.core.config import settings
+from src.core.tracing import in_trace
 
 
 Base = declarative_base()
 
-engine = create_async_engine(settings.DB_URL, echo=True, future=True)
+meter = metrics.get_meter(__name__)
+tracer = trace.get_tracer(__name__)
+
+# Длина SQL в атрибуте span-а
+MAX_STATEMENT_LENGTH = 1000
+
+checkout_histogram = meter.create_histogram(
+    'auth.db.pool.checkout_duration',
+    unit='s',
+    description='Ожидание соединения из пула, включая открытие нового'
+)
+checkout_timeout_counter = meter.create_counter(
+    'auth.db.pool.checkout_timeouts',
+    description='Запросы, не дождавшиеся свободного соединения за DB_POOL_TIMEOUT'
+)
+in_use_counter = meter.create_up_down_counter(
+    'auth.db.pool.in_use',
+    description='Соединения, выданные из пула'
+)
+connection_age_histogram = meter.create_histogram(
+    'auth.db.pool.connection_age',
+    unit='s',
+    description='Время жизни соединения до закрытия'
+)
+
+
+class InstrumentedPoolMixin:
+    """Замеряет время выдачи соединения: ожидание в очереди пула или подключение к Postgres"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            checkout_timeout_counter.add(1)
+            raise
+        finally:
+            checkout_histogram.record(time.perf_counter() - start)
+
+
+class InstrumentedQueuePool(InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+class InstrumentedNullPool(InstrumentedPoolMixin, NullPool):
+    pass
+
+
+def get_engine_options() -> dict:
+    """Параметры движка из настроек.
+
+    Профиль pgbouncer рассчитан на PgBouncer в режиме transaction: соединения
+    держит PgBouncer, а подготовленные выражения не переживают транзакцию,
+    поэтому их кеш отключен, а имена уникальны.
+    """
+    if settings.DB_POOL_PROFILE == 'pgbouncer':
+        return {
+            'poolclass': InstrumentedNullPool,
+            'connect_args': {
+                'statement_cache_size': 0,
+                'prepared_statement_cache_size': 0,
+                'prepared_statement_name_func': lambda: f'__asyncpg_{uuid4()}__'
+            }
+        }
+    return {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': settings.DB_POOL_SIZE,
+        'max_overflow': settings.DB_MAX_OVERFLOW,
+        'pool_timeout': settings.DB_POOL_TIMEOUT,
+        'pool_recycle': settings.DB_POOL_RECYCLE,
+        'pool_pre_ping': settings.DB_POOL_PRE_PING,
+        'connect_args': {
+            'statement_cache_size': settings.DB_STATEMENT_CACHE_SIZE,
+            'prepared_statement_cache_size': settings.DB_STATEMENT_CACHE_SIZE
+        }
+    }
+
+
+# Транзакция сессии что-то изменила: до commit/rollback соединение отдавать нельзя
+TRANSACTION_WRITES = 'transaction_writes'
+
+
+class UnitOfWorkSyncSession(Session):
+    pass
+
+
+@event.listens_for(UnitOfWorkSyncSession, 'after_transaction_end')
+def on_transaction_end(session, transaction) -> None:
+    # after_begin не подходит: транзакция начинается уже после do_orm_execute первого запроса
+    if transaction.parent is None:
+        session.info.pop(TRANSACTION_WRITES, None)
+
+
+@event.listens_for(UnitOfWorkSyncSession, 'do_orm_execute')
+def on_session_execute(orm_execute_state) -> None:
+    statement = orm_execute_state.statement
+    # SELECT ... FOR UPDATE держит блокировки до конца транзакции; text() не разбираем и считаем записью
+    if not orm_execute_state.is_select or getattr(statement, '_for_update_arg', None) is not None:
+        orm_execute_state.session.info[TRANSACTION_WRITES] = True
+
+
+@event.listens_for(UnitOfWorkSyncSession, 'after_flush')
+def on_session_flush(session, flush_context) -> None:
+    session.info[TRANSACTION_WRITES] = True
+
+
+class UnitOfWorkSession(AsyncSession):
+    """Сессия, которая возвращает соединение в пул после каждого чтения вне транзакции с изменениями.
+
+    Соединение берется при первом запросе, а чтение без изменений сразу завершается
+    commit: между запросами к БД (хеширование пароля, HTTP к провайдеру) сессия
+    соединение не держит, и явный release_connection в сервисах не нужен.
+    Изменения и SELECT ... FOR UPDATE держат соединение до commit, как обычно.
+    Цена - COMMIT на каждое чтение.
+    """
+
+    sync_session_class = UnitOfWorkSyncSession
+
+    async def execute(self, *args, **kwargs):
+        result = await super().execute(*args, **kwargs)
+        await self.release_if_idle()
+        return result
+
+    async def scalar(self, *args, **kwargs):
+        result = await super().scalar(*args, **kwargs)
+        await self.release_if_idle()
+        return result
+
+    async def get(self, *args, **kwargs):
+        result = await super().get(*args, **kwargs)
+        await self.release_if_idle()
+        return result
+
+    async def refresh(self, *args, **kwargs) -> None:
+        await super().refresh(*args, **kwargs)
+        await self.release_if_idle()
+
+    async def release_if_idle(self) -> None:
+        if not self.in_transaction() or self.info.get(TRANSACTION_WRITES):
+            return
+        if self.new or self.dirty or self.deleted:
+            return
+        await self.commit()
+
+
+engine = create_async_engine(settings.DB_URL, echo=settings.DB_ECHO, future=True, **get_engine_options())
 async_session = async_sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
 )
+# Сессии запросов; фоновые задачи с длинными транзакциями используют async_session
+request_session = async_sessionmaker(
+    engine,
+    class_=UnitOfWorkSession if settings.DB_SESSION_MODE == 'unit_of_work' else AsyncSession,
+    expire_on_commit=False
+)
+
+
+@event.listens_for(engine.sync_engine, 'connect')
+def on_connect(dbapi_connection, connection_record) -> None:
+    connection_record.info['connected_at'] = time.monotonic()
+
+
+@event.listens_for(engine.sync_engine, 'close')
+def on_close(dbapi_connection, connection_record) -> None:
+    connected_at = connection_record.info.get('connected_at')
+    if connected_at is not None:
+        connection_age_histogram.record(time.monotonic() - connected_at)
+
+
+@event.listens_for(engine.sync_engine, 'checkout')
+def on_checkout(dbapi_connection, connection_record, connection_proxy) -> None:
+    in_use_counter.add(1)
+
+
+@event.listens_for(engine.sync_engine, 'checkin')
+def on_checkin(dbapi_connection, connection_record) -> None:
+    in_use_counter.add(-1)
+
+
+@event.listens_for(engine.sync_engine, 'before_cursor_execute')
+def start_query_span(conn, cursor, statement, parameters, context, executemany) -> None:
+    # Сессия выполняет запрос в greenlet с контекстом вызывающей задачи, поэтому родитель - span запроса
+    if not in_trace():
+        return
+    context._span = tracer.start_span(
+        statement.split(maxsplit=1)[0] if statement else 'db.query',
+        kind=SpanKind.CLIENT,
+        attributes={
+            'db.system': 'postgresql',
+            'db.statement': statement[:MAX_STATEMENT_LENGTH],
+            'db.executemany': executemany
+        }
+    )
+
+
+@event.listens_for(engine.sync_engine, 'after_cursor_execute')
+def end_query_span(conn, cursor, statement, parameters, context, executemany) -> None:
+    span = getattr(context, '_span', None)
+    if span is not None:
+        span.end()
+        context._span = None
+
+
+@event.listens_for(engine.sync_engine, 'handle_error')
+def fail_query_span(exception_context) -> None:
+    span = getattr(exception_context.execution_context, '_span', None)
+    if span is not None:
+        span.record_exception(exception_context.original_exception)
+        span.set_status(Status(StatusCode.ERROR))
+        span.end()
+        exception_context.execution_context._span = None
+
+
+def observe_pool(method: str):
+    def callback(options):
+        pool = engine.sync_engine.pool
+        if isinstance(pool, QueuePool):
+            yield Observation(getattr(pool, method)())
+    return callback
+
+
+meter.create_observable_gauge(
+    'auth.db.pool.size',
+    callbacks=[observe_pool('size')],
+    description='Постоянных соединений в пуле'
+)
+meter.create_observable_gauge(
+    'auth.db.pool.idle',
+    callbacks=[observe_pool('checkedin')],
+    description='Свободные соединения в пуле'
+)
+meter.create_observable_gauge(
+    'auth.db.pool.overflow',
+    callbacks=[observe_pool('overflow')],
+    description='Соединения сверх pool_size; отрицательное значение - еще не открытые постоянные'
+)
 
 
 async def create_database() -> None:
@@ -25,6 +267,11 @@ async def purge_database() -> None:
 
 
 async def get_session() -> AsyncSession:
-    """Получение сессии"""
-    async with async_session() as session:
+    """Получение сессии.
+
+    Соединение берется из пула при первом запросе и возвращается после commit/rollback,
+    поэтому перед долгой работой без БД транзакцию стоит завершить. В режиме
+    DB_SESSION_MODE=unit_of_work сессия делает это сама после каждого чтения.
+    """
+    async with request_session() as session:
         yield session
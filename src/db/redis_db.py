@@ -1,10 +1,81 @@
+import asyncio
+import logging
+from typing import Callable
+
+from opentelemetry import trace
+from opentelemetry.trace import SpanKind
 from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
 
 from src.core.config import settings
+from src.core.tracing import in_trace
+
+
+logger = logging.getLogger(__name__)
+
+LISTEN_RETRY_DELAY = 1.0
+
+tracer = trace.get_tracer(__name__)
+
+
+class TracedRedis(Redis):
+    """Клиент Redis со span-ом на каждую команду внутри трассы; команды конвейера пишутся одним span-ом"""
+
+    async def execute_command(self, *args, **options):
+        if not in_trace():
+            return await super().execute_command(*args, **options)
+        with tracer.start_as_current_span(
+            str(args[0]), kind=SpanKind.CLIENT, attributes={'db.system': 'redis'}
+        ):
+            return await super().execute_command(*args, **options)
 
+    def pipeline(self, transaction: bool = True, shard_hint=None):
+        return TracedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
 
-redis = Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT)
+
+class TracedPipeline(Pipeline):
+
+    async def execute(self, raise_on_error: bool = True):
+        if not in_trace():
+            return await super().execute(raise_on_error)
+        with tracer.start_as_current_span(
+            'PIPELINE', kind=SpanKind.CLIENT,
+            attributes={'db.system': 'redis', 'db.redis.commands': len(self.command_stack)}
+        ):
+            return await super().execute(raise_on_error)
+
+
+redis = TracedRedis(host=settings.REDIS_HOST, port=settings.REDIS_PORT)
 
 
 async def get_redis() -> Redis:
     return redis
+
+
+async def listen_channel(
+        channel: str,
+        on_message: Callable[[str], None],
+        on_subscription_change: Callable[[bool], None]
+) -> None:
+    """Бесконечно слушает канал Redis и переподключается при обрыве.
+
+    on_subscription_change(True) вызывается после подтверждения подписки,
+    on_subscription_change(False) - при ее потере: сообщения в это время могли пропасть.
+    """
+    while True:
+        pubsub = redis.pubsub()
+        try:
+            await pubsub.subscribe(channel)
+            async for message in pubsub.listen():
+                if message['type'] == 'subscribe':
+                    on_subscription_change(True)
+                elif message['type'] == 'message':
+                    on_message(message['data'].decode())
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.warning('Lost subscription to %s, reconnecting', channel, exc_info=True)
+        finally:
+            on_subscription_change(False)
+            await pubsub.reset()
+        await asyncio.sleep(LISTEN_RETRY_DELAY)
@@ -0,0 +1,41 @@
+"""Новый ключ подписи токенов в каталоге JWT_KEYS_DIR.
+
+Запуск: python -m src.generate_signing_key --keys-dir keys --algorithm EdDSA
+"""
+import argparse
+import os
+from datetime import datetime
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+
+
+def generate_private_key(algorithm: str) -> ec.EllipticCurvePrivateKey | ed25519.Ed25519PrivateKey:
+    if algorithm == 'EdDSA':
+        return ed25519.Ed25519PrivateKey.generate()
+    return ec.generate_private_key(ec.SECP256R1())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Генерация ключа подписи токенов')
+    parser.add_argument('--keys-dir', required=True, help='каталог ключей (JWT_KEYS_DIR)')
+    parser.add_argument('--algorithm', choices=('EdDSA', 'ES256'), default='EdDSA')
+    parser.add_argument('--kid', help='идентификатор ключа, по умолчанию - текущее время')
+    args = parser.parse_args()
+
+    kid = args.kid or datetime.utcnow().strftime('%Y%m%d%H%M%S')
+    pem = generate_private_key(args.algorithm).private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption()
+    )
+    os.makedirs(args.keys_dir, exist_ok=True)
+    path = os.path.join(args.keys_dir, f'{kid}.pem')
+    # Ключ сразу попадает в JWKS, а подписывать начинает через JWT_KEY_ACTIVATION_DELAY
+    with open(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'wb') as file:
+        file.write(pem)
+    print(f'Created {path} ({args.algorithm}, kid={kid})')
+
+
+if __name__ == '__main__':
+    main()
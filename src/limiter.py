@@ -1,5 +1,194 @@
-from slowapi import Limiter
-from slowapi.util import get_remote_address
+import inspect
+import logging
+import math
+import time
+from dataclasses import dataclass
+from functools import wraps
+from ipaddress import ip_address, ip_network
 
+from fastapi import Request
+from opentelemetry import metrics
+from redis.asyncio.client import Redis
 
-limiter = Limiter(key_func=get_remote_address)
+from src.core.cache import TTLCache
+from src.core.config import settings
+from src.core.exceptions import rate_limit_exceeded
+from src.db.redis_db import redis as redis_client
+
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {
+    'second': 1,
+    'minute': 60,
+    'hour': 60 * 60,
+    'day': 24 * 60 * 60
+}
+
+meter = metrics.get_meter(__name__)
+
+rejected_counter = meter.create_counter(
+    'auth.rate_limit.rejected',
+    description='Запросы, отклоненные ограничителем; stage=local - без обращения к Redis'
+)
+redis_error_counter = meter.create_counter(
+    'auth.rate_limit.redis_errors',
+    description='Проверки, пропущенные из-за недоступности Redis'
+)
+
+
+@dataclass(frozen=True, slots=True)
+class Rate:
+    limit: int
+    period: float
+
+    @classmethod
+    def parse(cls, value: str) -> 'Rate':
+        """'20/minute' -> Rate(20, 60)"""
+        limit, period = value.split('/')
+        return cls(limit=int(limit), period=PERIODS[period.strip().rstrip('s')])
+
+    @property
+    def emission_interval(self) -> float:
+        return self.period / self.limit
+
+
+class TokenBucket:
+    """Локальное ведро воркера с теми же параметрами, что и общий лимит.
+
+    Воркер видит только часть запросов клиента, поэтому если пусто его ведро,
+    общий лимит точно превышен и в Redis можно не ходить.
+    """
+
+    def __init__(self, rate: Rate) -> None:
+        self.rate = rate
+        self.tokens = float(rate.limit)
+        self.updated_at = time.monotonic()
+
+    def consume(self) -> float:
+        """0 - токен взят, иначе через сколько секунд он появится"""
+        now = time.monotonic()
+        refill = (now - self.updated_at) / self.rate.emission_interval
+        self.tokens = min(self.tokens + refill, self.rate.limit)
+        self.updated_at = now
+        if self.tokens < 1:
+            return (1 - self.tokens) * self.rate.emission_interval
+        self.tokens -= 1
+        return 0.0
+
+
+class RateLimiter:
+    """Ограничение частоты запросов, общее для всех воркеров (GCRA в Redis)"""
+
+    # KEYS: ключ клиента; ARGV: интервал между запросами и допустимый всплеск, мс.
+    # Возвращает 0, если запрос пропущен, иначе через сколько мс повторить
+    GCRA_SCRIPT = """
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+    local emission_interval = tonumber(ARGV[1])
+    local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+    if tat < now then
+        tat = now
+    end
+    local new_tat = tat + emission_interval
+    local allow_at = new_tat - tonumber(ARGV[2])
+    if now < allow_at then
+        return allow_at - now
+    end
+    redis.call('SET', KEYS[1], string.format('%d', new_tat), 'PX', string.format('%d', new_tat - now))
+    return 0
+    """
+
+    def __init__(self, redis: Redis, enabled: bool, local_keys: int) -> None:
+        self.enabled = enabled
+        self.local_keys = local_keys
+        self.gcra_script = redis.register_script(self.GCRA_SCRIPT)
+
+    def limit(self, rate: str, per_user: bool = False):
+        """Декоратор эндпоинта; per_user - считать по пользователю из параметра user, а не по IP"""
+        parsed_rate = Rate.parse(rate)
+
+        def decorator(func):
+            scope = f'{func.__module__}.{func.__name__}'
+            # Ошибка при регистрации маршрута, а не 500 на первом запросе
+            request_parameter = get_request_parameter(func)
+            buckets = TTLCache(self.local_keys, parsed_rate.period)
+
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                if self.enabled:
+                    key = self.get_key(kwargs[request_parameter], kwargs.get('user') if per_user else None)
+                    await self.check(scope, key, parsed_rate, buckets)
+                return await func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def get_key(request: Request, user) -> str:
+        if user is not None:
+            return f'user:{user.id}'
+        return f'ip:{get_client_ip(request)}'
+
+    async def check(self, scope: str, key: str, rate: Rate, buckets: TTLCache) -> None:
+        bucket = buckets.get(key) or TokenBucket(rate)
+        buckets.set(key, bucket)
+        retry_after = bucket.consume()
+        if retry_after:
+            rejected_counter.add(1, {'scope': scope, 'stage': 'local'})
+            raise rate_limit_exceeded(math.ceil(retry_after))
+
+        try:
+            retry_after_ms = await self.gcra_script(
+                keys=[f'rate:{scope}:{key}'],
+                args=[int(rate.emission_interval * 1000), int(rate.period * 1000)]
+            )
+        except Exception as error:
+            # Недоступность Redis не должна останавливать сервис, остается локальное ведро
+            logger.warning('Rate limit check failed, falling back to local bucket: %s', error)
+            redis_error_counter.add(1, {'scope': scope})
+            return
+        if retry_after_ms:
+            rejected_counter.add(1, {'scope': scope, 'stage': 'redis'})
+            raise rate_limit_exceeded(math.ceil(retry_after_ms / 1000))
+
+
+def get_request_parameter(func) -> str:
+    for name, parameter in inspect.signature(func).parameters.items():
+        if isinstance(parameter.annotation, type) and issubclass(parameter.annotation, Request):
+            return name
+    raise TypeError(f'{func.__qualname__} has no Request parameter required by the rate limiter')
+
+
+trusted_proxies = [ip_network(network, strict=False) for network in settings.RATE_LIMIT_TRUSTED_PROXIES]
+
+
+def is_trusted_proxy(host: str) -> bool:
+    try:
+        address = ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in trusted_proxies)
+
+
+def get_client_ip(request: Request) -> str:
+    """IP клиента с учетом nginx: X-Real-IP он перезаписывает, в X-Forwarded-For - последний адрес.
+
+    Заголовкам верим только от прокси из RATE_LIMIT_TRUSTED_PROXIES, иначе клиент
+    получал бы новое ведро на каждый запрос, подставляя свой X-Real-IP.
+    """
+    client_ip = request.client.host if request.client else 'unknown'
+    if settings.RATE_LIMIT_TRUST_PROXY_HEADERS and is_trusted_proxy(client_ip):
+        real_ip = request.headers.get('X-Real-IP')
+        if real_ip:
+            return real_ip.strip()
+        forwarded_for = request.headers.get('X-Forwarded-For')
+        if forwarded_for:
+            return forwarded_for.split(',')[-1].strip()
+    return client_ip
+
+
+limiter = RateLimiter(
+    redis=redis_client,
+    enabled=settings.RATE_LIMIT_ENABLED,
+    local_keys=settings.RATE_LIMIT_LOCAL_KEYS
+)
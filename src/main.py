@@ -1,41 +1,107 @@
-from fastapi import FastAPI, Request, status
+import asyncio
+import logging
+
+from fastapi import FastAPI, Request
 from fastapi.responses import ORJSONResponse
-from slowapi import _rate_limit_exceeded_handler
-from slowapi.errors import RateLimitExceeded
-from starlette.middleware.sessions import SessionMiddleware
-from opentelemetry import trace
-from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry import trace, metrics
+from opentelemetry.sdk.trace import TracerProvider, SynchronousMultiSpanProcessor
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
+from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter as OTLPHTTPSpanExporter
 from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
-from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter, SpanExporter
 from opentelemetry.sdk.resources import SERVICE_NAME, Resource
 from opentelemetry.exporter.jaeger.thrift import JaegerExporter
 
 from src.core.config import settings
 from src.core.exceptions import CustomException
-from src.services.users import create_admin
-from src.limiter import limiter
+from src.core.tracing import RecordingSampler, TailPromotingSpanProcessor
+from src.core.oauth import prefetch_provider_documents, shared_transport
+from src.core.signing import key_ring, run_key_reload
+from src.core.middleware import RequestIdMiddleware, PathSessionMiddleware, RequestIdLogFilter
+from src.services.users import create_admin, run_deleted_user_purge
+from src.services.hashing import password_hasher
+from src.services.principals import principal_cache
+from src.services.revocation import logout_watermarks, session_revocations, run_replica_prune
+from src.services.role_catalog import role_catalog
+from src.services.refresh_tokens import run_refresh_token_purge
+from src.services.history import login_history_writer, run_partition_maintenance
 from src.api.v1 import users
 from src.api.v1 import auth
 from src.api.v1 import roles
+from src.api import well_known
 from src.core.config import auth_jwt_settings
 
 
+def create_span_exporter() -> SpanExporter | None:
+    if settings.TRACING_EXPORTER == 'otlp_grpc':
+        return OTLPSpanExporter(endpoint=settings.TRACING_OTLP_ENDPOINT, insecure=True)
+    if settings.TRACING_EXPORTER == 'otlp_http':
+        return OTLPHTTPSpanExporter(endpoint=settings.TRACING_OTLP_ENDPOINT)
+    if settings.TRACING_EXPORTER == 'jaeger':
+        return JaegerExporter(
+            agent_host_name=settings.jaeger_agent_host_name,
+            agent_port=settings.jaeger_agent_port
+        )
+    return None
+
+
 def configure_tracer() -> None:
-    trace.set_tracer_provider(TracerProvider(
-        resource=Resource.create({SERVICE_NAME: "auth.api"})
-    ))
-    trace.get_tracer_provider().add_span_processor(
-        BatchSpanProcessor(
-            JaegerExporter(
-                agent_host_name=settings.jaeger_agent_host_name,
-                agent_port=settings.jaeger_agent_port
-            )
+    if not settings.TRACING_ENABLED:
+        return
+    # Трассы вне выборки записываются, только если их может понадобиться отправить по итогам запроса
+    promote = settings.TRACING_PROMOTE_ERRORS or settings.TRACING_SLOW_REQUEST_MS is not None
+    sampler = ParentBased(TraceIdRatioBased(settings.TRACING_SAMPLE_RATIO))
+    provider = TracerProvider(
+        resource=Resource.create({SERVICE_NAME: "auth.api"}),
+        sampler=RecordingSampler(sampler) if promote else sampler
+    )
+
+    processor = SynchronousMultiSpanProcessor()
+    exporter = create_span_exporter()
+    if exporter:
+        processor.add_span_processor(BatchSpanProcessor(exporter))
+    if settings.TRACING_CONSOLE_EXPORT:
+        processor.add_span_processor(BatchSpanProcessor(ConsoleSpanExporter()))
+    if promote:
+        slow_ns = None
+        if settings.TRACING_SLOW_REQUEST_MS is not None:
+            slow_ns = int(settings.TRACING_SLOW_REQUEST_MS * 1_000_000)
+        processor = TailPromotingSpanProcessor(
+            processor, slow_ns, settings.TRACING_PROMOTE_ERRORS, settings.TRACING_TAIL_BUFFER_TRACES
         )
+    provider.add_span_processor(processor)
+    trace.set_tracer_provider(provider)
+
+
+def configure_meter() -> None:
+    if not settings.METRICS_EXPORT_ENDPOINT:
+        return
+    reader = PeriodicExportingMetricReader(
+        OTLPMetricExporter(endpoint=settings.METRICS_EXPORT_ENDPOINT, insecure=True)
     )
-    trace.get_tracer_provider().add_span_processor(BatchSpanProcessor(ConsoleSpanExporter()))
+    metrics.set_meter_provider(MeterProvider(
+        resource=Resource.create({SERVICE_NAME: "auth.api"}),
+        metric_readers=[reader]
+    ))
+
+
+def configure_logging() -> None:
+    handler = logging.StreamHandler()
+    handler.addFilter(RequestIdLogFilter())
+    handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s'))
+    logger = logging.getLogger('src')
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
 
 
 configure_tracer()
+configure_meter()
+configure_logging()
 
 
 app = FastAPI(
@@ -45,31 +111,56 @@ app = FastAPI(
     default_response_class=ORJSONResponse
 )
 
+# Последний добавленный middleware - внешний: span OTel, затем проверка X-Request-Id, затем сессии
+app.add_middleware(
+    PathSessionMiddleware,
+    path_prefixes=('/api/v1/auth/login/google', '/api/v1/auth/oauth/'),
+    secret_key=auth_jwt_settings.authjwt_secret_key
+)
+app.add_middleware(RequestIdMiddleware, public_path_prefixes=('/.well-known/',))
 FastAPIInstrumentor.instrument_app(app)
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
-app.add_middleware(SessionMiddleware, secret_key=auth_jwt_settings.authjwt_secret_key)
-
-
-@app.middleware('http')
-async def before_request(request: Request, call_next):
-    response = await call_next(request)
-    request_id = request.headers.get('X-Request-Id')
-    if not request_id:
-        return ORJSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content={'detail': 'X-Request-Id is required'})
-    return response
 
 
 @app.exception_handler(CustomException)
 async def uvicorn_exception_handler(request: Request, exc: CustomException):
-    return ORJSONResponse(status_code=exc.status_code, content={'message': exc.message})
+    return ORJSONResponse(status_code=exc.status_code, content={'message': exc.message}, headers=exc.headers)
+
+
+# Фоновые задачи воркера: подписки на каналы Redis и т.п.
+background_tasks: list[asyncio.Task] = []
 
 
 @app.on_event("startup")
 async def startup() -> None:
     await create_admin()
+    if principal_cache.enabled:
+        background_tasks.append(asyncio.create_task(principal_cache.listen()))
+    if logout_watermarks.enabled:
+        background_tasks.append(asyncio.create_task(logout_watermarks.listen()))
+        background_tasks.append(asyncio.create_task(run_replica_prune()))
+    if session_revocations.enabled:
+        background_tasks.append(asyncio.create_task(session_revocations.listen()))
+    if role_catalog.enabled:
+        background_tasks.append(asyncio.create_task(role_catalog.listen()))
+    background_tasks.append(asyncio.create_task(run_refresh_token_purge()))
+    background_tasks.append(asyncio.create_task(run_partition_maintenance()))
+    if key_ring.enabled:
+        background_tasks.append(asyncio.create_task(run_key_reload()))
+    background_tasks.append(asyncio.create_task(run_deleted_user_purge()))
+    if login_history_writer.enabled:
+        background_tasks.append(asyncio.create_task(login_history_writer.run()))
+    background_tasks.append(asyncio.create_task(prefetch_provider_documents()))
+
+
+@app.on_event("shutdown")
+async def shutdown() -> None:
+    for task in background_tasks:
+        task.cancel()
+    password_hasher.shutdown()
+    await shared_transport.close()
 
 
 app.include_router(users.router, prefix='/api/v1/users', tags=['users'])
 app.include_router(auth.router, prefix='/api/v1/auth', tags=['auth'])
 app.include_router(roles.router, prefix='/api/v1/roles', tags=['roles'])
+app.include_router(well_known.router, prefix='/.well-known', tags=['jwks'])
@@ -10,6 +10,8 @@ from src.models.users import User
 from src.models.tokens import RefreshTokens
 from src.models.history import LoginHistory
 from src.models.roles import Role
+from src.models.identities import FederatedIdentity
+from src.models.sessions import UserSession
 from src.db.postgres import Base
 from src.core.config import settings
 
@@ -0,0 +1,26 @@
+"""users_purging_at
+
+Revision ID: 3f9c2b7d41e6
+Revises: 1ac65f817998
+Create Date: 2026-10-18 21:14:09.512367
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9c2b7d41e6'
+down_revision: Union[str, None] = '1ac65f817998'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('purging_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'purging_at')
@@ -0,0 +1,45 @@
+"""refresh_tokens_by_jti
+
+Revision ID: 4b4f2dd33712
+Revises: 4523b79517b2
+Create Date: 2026-10-18 10:12:41.530118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4b4f2dd33712'
+down_revision: Union[str, None] = '4523b79517b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Старые записи хранили токен целиком и без срока жизни, пользователям придется войти заново
+    op.execute('DELETE FROM refresh_tokens')
+    op.drop_column('refresh_tokens', 'refresh_token')
+    op.add_column('refresh_tokens', sa.Column('jti', sa.UUID(), nullable=False))
+    op.add_column('refresh_tokens', sa.Column('family_id', sa.UUID(), nullable=False))
+    op.add_column('refresh_tokens', sa.Column('expires_at', sa.DateTime(), nullable=False))
+    op.add_column('refresh_tokens', sa.Column('rotated_at', sa.DateTime(), nullable=True))
+    op.create_index(op.f('ix_refresh_tokens_jti'), 'refresh_tokens', ['jti'], unique=True)
+    op.create_index(op.f('ix_refresh_tokens_family_id'), 'refresh_tokens', ['family_id'], unique=False)
+    op.create_index(op.f('ix_refresh_tokens_expires_at'), 'refresh_tokens', ['expires_at'], unique=False)
+    op.create_index(op.f('ix_refresh_tokens_user_id'), 'refresh_tokens', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_refresh_tokens_user_id'), table_name='refresh_tokens')
+    op.drop_index(op.f('ix_refresh_tokens_expires_at'), table_name='refresh_tokens')
+    op.drop_index(op.f('ix_refresh_tokens_family_id'), table_name='refresh_tokens')
+    op.drop_index(op.f('ix_refresh_tokens_jti'), table_name='refresh_tokens')
+    op.execute('DELETE FROM refresh_tokens')
+    op.drop_column('refresh_tokens', 'rotated_at')
+    op.drop_column('refresh_tokens', 'expires_at')
+    op.drop_column('refresh_tokens', 'family_id')
+    op.drop_column('refresh_tokens', 'jti')
+    op.add_column('refresh_tokens', sa.Column('refresh_token', sa.String(length=400), nullable=True))
@@ -0,0 +1,59 @@
+"""cascade_user_deletes
+
+Revision ID: 623954a64f2b
+Revises: d218a16f19e1
+Create Date: 2026-10-18 18:03:31.409990
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '623954a64f2b'
+down_revision: Union[str, None] = 'd218a16f19e1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (таблица, колонка, таблица по ссылке)
+FOREIGN_KEYS = [
+    ('login_history', 'user_id', 'users'),
+    ('refresh_tokens', 'user_id', 'users'),
+    ('user_roles', 'user_id', 'users'),
+    ('user_roles', 'role_id', 'roles'),
+]
+
+
+def replace_foreign_key(table: str, column: str, referent: str, ondelete: str | None) -> None:
+    # Имена ключей зависят от истории миграций (login_history_user_id_fkey1), поэтому ищем их в каталоге
+    names = op.get_bind().execute(sa.text(
+        "SELECT conname FROM pg_constraint "
+        "WHERE contype = 'f' AND conrelid = CAST(:table AS regclass) "
+        "AND conkey = ARRAY[(SELECT attnum FROM pg_attribute "
+        "WHERE attrelid = CAST(:table AS regclass) AND attname = :column)]::smallint[]"
+    ), {'table': table, 'column': column}).scalars().all()
+    for name in names:
+        op.drop_constraint(name, table, type_='foreignkey')
+    op.create_foreign_key(f'{table}_{column}_fkey', table, referent, [column], ['id'], ondelete=ondelete)
+
+
+def upgrade() -> None:
+    for table, column, referent in FOREIGN_KEYS:
+        replace_foreign_key(table, column, referent, ondelete='CASCADE')
+    op.add_column('users', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.create_index(
+        'ix_users_deleted_at', 'users', ['deleted_at'], unique=False,
+        postgresql_where=sa.text('deleted_at IS NOT NULL')
+    )
+
+
+def downgrade() -> None:
+    # Помеченные пользователи удаляются сразу, иначе после отката они снова станут активными
+    op.execute('DELETE FROM users WHERE deleted_at IS NOT NULL')
+    op.drop_index('ix_users_deleted_at', table_name='users', postgresql_where=sa.text('deleted_at IS NOT NULL'))
+    op.drop_column('users', 'deleted_at')
+    for table, column, referent in FOREIGN_KEYS:
+        replace_foreign_key(table, column, referent, ondelete=None)
@@ -0,0 +1,83 @@
+"""partition_login_history
+
+Revision ID: 7f7b8873730e
+Revises: 4b4f2dd33712
+Create Date: 2026-10-18 11:04:19.206734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7f7b8873730e'
+down_revision: Union[str, None] = '4b4f2dd33712'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.rename_table('login_history', 'login_history_old')
+    op.execute('ALTER INDEX login_history_pkey RENAME TO login_history_old_pkey')
+
+    # Ключ партиционирования обязан входить в первичный ключ
+    op.create_table('login_history',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('user_id', sa.UUID(), nullable=True),
+    sa.Column('user_agent', sa.String(length=200), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id', 'created_at'),
+    postgresql_partition_by='RANGE (created_at)'
+    )
+    op.create_index('ix_login_history_user_id_created_at', 'login_history', ['user_id', 'created_at', 'id'])
+    op.execute('CREATE TABLE login_history_default PARTITION OF login_history DEFAULT')
+
+    op.execute("""
+    CREATE FUNCTION create_login_history_partition(month date) RETURNS void AS $$
+    DECLARE
+        start_date date := date_trunc('month', month);
+        end_date date := start_date + interval '1 month';
+    BEGIN
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF login_history FOR VALUES FROM (%L) TO (%L)',
+            'login_history_' || to_char(start_date, 'YYYY_MM'), start_date, end_date
+        );
+    END;
+    $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+    SELECT create_login_history_partition(month::date)
+    FROM generate_series(
+        date_trunc('month', LEAST(COALESCE((SELECT min(created_at) FROM login_history_old), now()), now())),
+        date_trunc('month', now()) + interval '2 months',
+        interval '1 month'
+    ) AS month
+    """)
+    op.execute("""
+    INSERT INTO login_history (id, user_id, user_agent, created_at)
+    SELECT id, user_id, user_agent, COALESCE(created_at, now()) FROM login_history_old
+    """)
+    op.drop_table('login_history_old')
+
+
+def downgrade() -> None:
+    op.rename_table('login_history', 'login_history_partitioned')
+    op.execute('ALTER INDEX login_history_pkey RENAME TO login_history_partitioned_pkey')
+    op.create_table('login_history',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('user_id', sa.UUID(), nullable=True),
+    sa.Column('user_agent', sa.String(length=200), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('id')
+    )
+    op.execute("""
+    INSERT INTO login_history (id, user_id, user_agent, created_at)
+    SELECT id, user_id, user_agent, created_at FROM login_history_partitioned
+    """)
+    op.execute('DROP TABLE login_history_partitioned CASCADE')
+    op.execute('DROP FUNCTION create_login_history_partition(date)')
@@ -0,0 +1,42 @@
+"""federated_identities
+
+Revision ID: 8088be74475d
+Revises: 7f7b8873730e
+Create Date: 2026-10-18 17:45:12.318904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8088be74475d'
+down_revision: Union[str, None] = '7f7b8873730e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('federated_identities',
+    sa.Column('provider', sa.String(length=50), nullable=False),
+    sa.Column('subject', sa.String(length=255), nullable=False),
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.Column('email', sa.String(length=255), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('last_login_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('provider', 'subject')
+    )
+    op.create_index(op.f('ix_federated_identities_user_id'), 'federated_identities', ['user_id'], unique=False)
+    # Пользователи, созданные через OAuth раньше, сохраняют случайный пароль: отличить их не по чему
+    op.alter_column('users', 'password', existing_type=sa.String(length=255), nullable=True)
+
+
+def downgrade() -> None:
+    # Пароль-заглушка, который не совпадет ни с одним хешем
+    op.execute("UPDATE users SET password = '!' WHERE password IS NULL")
+    op.alter_column('users', 'password', existing_type=sa.String(length=255), nullable=False)
+    op.drop_index(op.f('ix_federated_identities_user_id'), table_name='federated_identities')
+    op.drop_table('federated_identities')
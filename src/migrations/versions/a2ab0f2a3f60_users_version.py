@@ -0,0 +1,26 @@
+"""users_version
+
+Revision ID: a2ab0f2a3f60
+Revises: 8088be74475d
+Create Date: 2026-10-18 18:02:37.904115
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a2ab0f2a3f60'
+down_revision: Union[str, None] = '8088be74475d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'version')
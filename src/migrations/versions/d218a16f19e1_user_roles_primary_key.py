@@ -0,0 +1,38 @@
+"""user_roles_primary_key
+
+Revision ID: d218a16f19e1
+Revises: a2ab0f2a3f60
+Create Date: 2026-10-18 17:58:23.388855
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd218a16f19e1'
+down_revision: Union[str, None] = 'a2ab0f2a3f60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Пары без пользователя или роли и повторы, которые раньше допускала таблица без ключа
+    op.execute('DELETE FROM user_roles WHERE user_id IS NULL OR role_id IS NULL')
+    op.execute("""
+        DELETE FROM user_roles a USING user_roles b
+        WHERE a.user_id = b.user_id AND a.role_id = b.role_id AND a.ctid > b.ctid
+    """)
+    op.alter_column('user_roles', 'user_id', existing_type=sa.UUID(), nullable=False)
+    op.alter_column('user_roles', 'role_id', existing_type=sa.UUID(), nullable=False)
+    op.create_primary_key('user_roles_pkey', 'user_roles', ['user_id', 'role_id'])
+    op.create_index('ix_user_roles_role_id', 'user_roles', ['role_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_user_roles_role_id', table_name='user_roles')
+    op.drop_constraint('user_roles_pkey', 'user_roles', type_='primary')
+    op.alter_column('user_roles', 'role_id', existing_type=sa.UUID(), nullable=True)
+    op.alter_column('user_roles', 'user_id', existing_type=sa.UUID(), nullable=True)
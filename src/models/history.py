@@ -1,7 +1,7 @@
 import uuid
 from datetime import datetime
 
-from sqlalchemy import Column, DateTime, String, ForeignKey
+from sqlalchemy import Column, DateTime, String, ForeignKey, Index
 from sqlalchemy.orm import mapped_column
 from sqlalchemy.dialects.postgresql import UUID
 
@@ -10,7 +10,13 @@ from src.db.postgres import Base
 
 class LoginHistory(Base):
     __tablename__ = 'login_history'
-    id = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, unique=True, nullable=False)
-    user_id = mapped_column(ForeignKey('users.id'))
+    __table_args__ = (
+        # Под keyset-пагинацию истории пользователя
+        Index('ix_login_history_user_id_created_at', 'user_id', 'created_at', 'id'),
+        # Помесячные партиции создаются и удаляются в src/services/history.py
+        {'postgresql_partition_by': 'RANGE (created_at)'},
+    )
+    id = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, nullable=False)
+    user_id = mapped_column(ForeignKey('users.id', ondelete='CASCADE'))
     user_agent = Column(String(200), nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, primary_key=True, default=datetime.utcnow, nullable=False)
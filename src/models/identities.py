@@ -0,0 +1,17 @@
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, String, ForeignKey
+from sqlalchemy.orm import mapped_column
+
+from src.db.postgres import Base
+
+
+class FederatedIdentity(Base):
+    """Учетная запись пользователя у внешнего провайдера OAuth"""
+    __tablename__ = 'federated_identities'
+    provider = Column(String(50), primary_key=True)
+    subject = Column(String(255), primary_key=True)
+    user_id = mapped_column(ForeignKey('users.id', ondelete='CASCADE'), index=True, nullable=False)
+    email = Column(String(255))
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    last_login_at = Column(DateTime, default=datetime.utcnow, nullable=False)
@@ -0,0 +1,20 @@
+import uuid
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, String, ForeignKey
+from sqlalchemy.orm import mapped_column
+from sqlalchemy.dialects.postgresql import UUID
+
+from src.db.postgres import Base
+
+
+class UserSession(Base):
+    """Вход с одного устройства: id совпадает с claim sid токенов и семейством refresh токенов"""
+    __tablename__ = 'sessions'
+    id = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, nullable=False)
+    user_id = mapped_column(ForeignKey('users.id', ondelete='CASCADE'), index=True, nullable=False)
+    user_agent = Column(String(200), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    last_seen_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    # Продлевается при каждом обновлении токенов вместе со сроком refresh токена
+    expires_at = Column(DateTime, index=True, nullable=False)
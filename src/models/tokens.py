@@ -1,7 +1,7 @@
 import uuid
 from datetime import datetime
 
-from sqlalchemy import Column, DateTime, String, ForeignKey
+from sqlalchemy import Column, DateTime, ForeignKey
 from sqlalchemy.orm import mapped_column
 from sqlalchemy.dialects.postgresql import UUID
 
@@ -11,6 +11,9 @@ from src.db.postgres import Base
 class RefreshTokens(Base):
     __tablename__ = 'refresh_tokens'
     id = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, unique=True, nullable=False)
-    user_id = mapped_column(ForeignKey('users.id'))
-    refresh_token = Column(String(400))
+    user_id = mapped_column(ForeignKey('users.id', ondelete='CASCADE'), index=True)
+    jti = Column(UUID(as_uuid=True), unique=True, index=True, nullable=False)
+    family_id = Column(UUID(as_uuid=True), index=True, nullable=False)
+    expires_at = Column(DateTime, index=True, nullable=False)
+    rotated_at = Column(DateTime)
     created_at = Column(DateTime, default=datetime.utcnow)
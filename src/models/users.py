@@ -1,25 +1,25 @@
 import uuid
-import random
-import string
 from datetime import datetime
 
-from sqlalchemy import Column, DateTime, String, Table, ForeignKey
+from sqlalchemy import Column, DateTime, Index, Integer, String, Table, ForeignKey
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import relationship
-from werkzeug.security import check_password_hash, generate_password_hash
+from sqlalchemy.orm import backref, relationship
 
 from src.db.postgres import Base
 from src.models.roles import Role
 from src.models.history import LoginHistory
 from src.models.tokens import RefreshTokens
 from src.core.config import admin_settings
+from src.services.hashing import password_hasher
 
 
 UserRoles = Table(
     'user_roles',
     Base.metadata,
-    Column('user_id', ForeignKey('users.id')),
-    Column('role_id', ForeignKey('roles.id'))
+    Column('user_id', ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+    Column('role_id', ForeignKey('roles.id', ondelete='CASCADE'), primary_key=True),
+    # Первичный ключ покрывает поиск по user_id, обратный поиск - по role_id
+    Index('ix_user_roles_role_id', 'role_id')
 )
 
 
@@ -28,28 +28,49 @@ class User(Base):
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, unique=True, nullable=False)
     login = Column(String(255), unique=True, nullable=False)
-    password = Column(String(255), nullable=False)
+    # NULL - вход только через внешнего провайдера
+    password = Column(String(255))
     first_name = Column(String(50))
     last_name = Column(String(50))
-    roles = relationship(Role, secondary=UserRoles, backref='users', lazy='selectin', cascade='save-update, merge, delete')
-    login_history = relationship(LoginHistory, cascade='save-update, merge, delete')
-    refresh_tokens = relationship(RefreshTokens, cascade='save-update, merge, delete')
+    # Связанные строки удаляет сама БД (ON DELETE CASCADE), ORM их не загружает
+    roles = relationship(
+        Role, secondary=UserRoles, backref=backref('users', passive_deletes=True), lazy='selectin', passive_deletes=True
+    )
+    login_history = relationship(LoginHistory, cascade='save-update, merge, delete', passive_deletes=True)
+    refresh_tokens = relationship(RefreshTokens, cascade='save-update, merge, delete', passive_deletes=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Пользователь удален и ждет очистки в run_deleted_user_purge
+    deleted_at = Column(DateTime)
+    # Очистку удаленного пользователя взял воркер; по истечении USER_PURGE_CLAIM_TIMEOUT ее берет другой
+    purging_at = Column(DateTime)
+    # Растет при каждом UPDATE строки через ORM, по нему кешируется тело /users/me
+    version = Column(Integer, nullable=False, server_default='1')
 
-    def __init__(self, login: str, password: str, first_name: str, last_name: str) -> None:
+    __table_args__ = (
+        Index('ix_users_deleted_at', 'deleted_at', postgresql_where=deleted_at.isnot(None)),
+    )
+    __mapper_args__ = {'version_id_col': version}
+
+    def __init__(self, login: str, first_name: str, last_name: str) -> None:
         self.login = login
-        self.password = generate_password_hash(password)
         self.first_name = first_name
         self.last_name = last_name
 
-    def check_password(self, password: str) -> bool:
-        return check_password_hash(self.password, password)
+    async def set_password(self, password: str) -> None:
+        self.password = await password_hasher.hash(password)
+
+    @property
+    def is_deleted(self) -> bool:
+        return self.deleted_at is not None
+
+    @property
+    def has_password(self) -> bool:
+        return self.password is not None
 
-    @staticmethod
-    def generate_strong_password(password_length):
-        characters = string.ascii_letters + string.digits + string.punctuation
-        password = ''.join(random.choice(characters) for _ in range(password_length))
-        return password
+    async def check_password(self, password: str) -> bool:
+        if not self.has_password:
+            return False
+        return await password_hasher.verify(self.password, password)
 
     def is_admin(self):
         for role in self.roles:
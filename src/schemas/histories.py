@@ -1,8 +1,35 @@
+import base64
 from datetime import datetime
+from uuid import UUID
 
+import orjson
+from fastapi import Query
 from pydantic import BaseModel
 
+from src.core.exceptions import HISTORY_CURSOR_IS_INVALID
+from src.schemas.validators import Paginator
+
 
 class LoginHistorySchema(BaseModel):
     user_agent: str
     created_at: datetime
+
+
+class HistoryCursor(BaseModel):
+    """Позиция последней выданной записи для keyset-пагинации"""
+    created_at: datetime
+    id: UUID
+
+    def encode(self) -> str:
+        return base64.urlsafe_b64encode(orjson.dumps(self.model_dump(mode='json'))).decode()
+
+    @classmethod
+    def decode(cls, cursor: str) -> 'HistoryCursor':
+        try:
+            return cls.model_validate_json(base64.urlsafe_b64decode(cursor.encode()))
+        except ValueError:
+            raise HISTORY_CURSOR_IS_INVALID()
+
+
+class HistoryPaginator(Paginator):
+    cursor: str | None = Query(default=None, description='Значение заголовка X-Next-Cursor прошлой страницы')
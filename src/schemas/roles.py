@@ -1,6 +1,8 @@
 from uuid import UUID
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+from src.core.config import settings
 
 
 class RoleBaseModel(BaseModel):
@@ -22,3 +24,14 @@ class RoleUpdateForm(RoleBaseModel):
 class RoleAttachForm(BaseModel):
     user_id: UUID
     role_id: UUID
+
+
+class RoleBulkForm(BaseModel):
+    """Пары пользователь-роль списком либо одна роль для списка пользователей"""
+    memberships: list[RoleAttachForm] = Field(default=[], max_length=settings.ROLES_BULK_MAX_SIZE)
+    role_id: UUID | None = None
+    user_ids: list[UUID] = Field(default=[], max_length=settings.ROLES_BULK_MAX_SIZE)
+
+
+class RoleBulkResult(BaseModel):
+    count: int
@@ -1,4 +1,9 @@
-from pydantic import BaseModel
+from datetime import datetime
+from uuid import UUID
+
+from pydantic import BaseModel, Field
+
+from src.core.config import settings
 
 
 class AccessToken(BaseModel):
@@ -7,3 +12,25 @@ class AccessToken(BaseModel):
 
 class Tokens(AccessToken):
     refresh_token: str
+
+
+class SessionSchema(BaseModel):
+    id: UUID
+    user_agent: str
+    created_at: datetime
+    last_seen_at: datetime
+    expires_at: datetime
+    current: bool
+
+
+class IntrospectForm(BaseModel):
+    tokens: list[str] = Field(min_length=1, max_length=settings.INTROSPECT_MAX_TOKENS)
+
+
+class TokenIntrospection(BaseModel):
+    """Результат проверки токена; для недействительного заполнен только active"""
+    active: bool
+    sub: UUID | None = None
+    roles: list[str] | None = None
+    exp: int | None = None
+    sid: UUID | None = None
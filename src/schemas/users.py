@@ -36,9 +36,8 @@ class ChangePasswordForm(BaseModel):
 class FullUserSchema(BaseModel):
     id: UUID
     login: str
-    password: str
-    first_name: str
-    last_name: str
+    first_name: str | None
+    last_name: str | None
     created_at: datetime
     is_admin: bool
 
@@ -1,20 +1,20 @@
 from uuid import UUID
 
-from async_fastapi_jwt_auth import AuthJWT
 from async_fastapi_jwt_auth.exceptions import MissingTokenError, JWTDecodeError
 from authlib.integrations.base_client.errors import MismatchingStateError
 from authlib.integrations.starlette_client import OAuth
 from starlette.requests import Request as StarletteRequest
 from fastapi import Depends
-from redis.asyncio.client import Redis
-from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.core.exceptions import OAUTH_ERROR
+from src.core.oauth import measure_callback
+from src.core.exceptions import USER_DOES_NOT_HAVE_RIGHTS
 from src.core.exceptions import USER_NOT_AUTHORIZED, USER_NOT_FOUND, ACCESS_TOKEN_IS_INVALID, REFRESH_TOKEN_IS_INVALID
-from src.db.postgres import get_session
-from src.db.redis_db import get_redis
 from src.models.users import User
-from src.services.common import BaseService
+from src.services.common import BaseService, ServiceContainer, get_services
+from src.services.principals import Principal, principal_cache
+from src.services.revocation import get_logout_time, is_session_revoked, token_issued_at
+from src.services.role_claims import role_versions
 
 
 class AuthService(BaseService):
@@ -23,31 +23,60 @@ class AuthService(BaseService):
         try:
             await token_required_func()
         except (MissingTokenError, JWTDecodeError):
-            raise USER_NOT_AUTHORIZED
+            raise USER_NOT_AUTHORIZED()
 
         user_id = await self.authorize.get_jwt_subject()
         if not user_id:
-            raise USER_NOT_FOUND
+            raise USER_NOT_FOUND()
         return user_id
 
-    async def is_token_created_before_logout(self, user: User) -> bool:
-        logout_time = await self.redis.get(str(user.id))
+    async def is_token_created_before_logout(self, logout_time: float | None) -> bool:
         if logout_time:
             token = await self.authorize.get_raw_jwt()
-            created_at = token['iat']
-            if created_at <= float(logout_time.decode()):
+            if token_issued_at(token) <= logout_time:
                 return True
         return False
 
+    async def is_token_session_revoked(self) -> bool:
+        token = await self.authorize.get_raw_jwt()
+        return 'sid' in token and await is_session_revoked(self.redis, token['sid'])
+
+    async def check_token_not_revoked(self, logout_time: float | None, token_exception) -> None:
+        if await self.is_token_created_before_logout(logout_time) or await self.is_token_session_revoked():
+            await self.authorize.unset_jwt_cookies()
+            raise token_exception()
+
     async def get_user_from_token(self, token_required_func, token_exception) -> User:
         user_id = await self.get_user_id_from_token(token_required_func)
         user: User = await self.get_user_by_id(user_id)
+        await self.check_token_not_revoked(await get_logout_time(self.redis, user.id), token_exception)
+        return user
 
-        if await self.is_token_created_before_logout(user):
-            await self.authorize.unset_jwt_cookies()
-            raise token_exception
+    async def get_principal(self, user_id: UUID) -> Principal:
+        principal = principal_cache.get(UUID(str(user_id)))
+        if principal:
+            return principal
 
-        return user
+        generation = principal_cache.generation
+        user: User = await self.get_user_by_id(user_id)
+        principal = Principal.from_user(user)
+        principal_cache.set(principal, generation)
+        return principal
+
+    async def get_principal_from_claims(self, user_id: UUID) -> Principal | None:
+        """Пользователь из claims access токена, если его роли с тех пор не менялись"""
+        claims = await self.authorize.get_raw_jwt()
+        if 'roles' not in claims or 'rv' not in claims:
+            return None
+        if claims['rv'] != await role_versions.get(self.redis, user_id):
+            return None
+        return Principal.from_claims(user_id, claims)
+
+    async def get_principal_from_token(self, token_required_func, token_exception) -> Principal:
+        user_id = await self.get_user_id_from_token(token_required_func)
+        principal = await self.get_principal_from_claims(user_id) or await self.get_principal(user_id)
+        await self.check_token_not_revoked(await get_logout_time(self.redis, principal.id), token_exception)
+        return principal
 
     async def get_user_from_access(self):
         token_required_func = self.authorize.jwt_required
@@ -56,37 +85,43 @@ class AuthService(BaseService):
             token_required_func, token_exception
         )
 
-    async def get_user_from_refresh(self):
-        token_required_func = self.authorize.jwt_refresh_token_required
-        token_exception = REFRESH_TOKEN_IS_INVALID
-        return await self.get_user_from_token(
-            token_required_func, token_exception
+    async def get_principal_from_access(self) -> Principal:
+        return await self.get_principal_from_token(
+            self.authorize.jwt_required, ACCESS_TOKEN_IS_INVALID
+        )
+
+    async def get_principal_from_refresh(self) -> Principal:
+        return await self.get_principal_from_token(
+            self.authorize.jwt_refresh_token_required, REFRESH_TOKEN_IS_INVALID
         )
 
 
-async def get_user_from_access_token(
-        db: AsyncSession = Depends(get_session),
-        redis: Redis = Depends(get_redis),
-        authorize: AuthJWT = Depends()
-) -> User:
-    return await AuthService(db, redis, authorize).get_user_from_access()
+async def get_user_from_access_token(services: ServiceContainer = Depends(get_services)) -> User:
+    return await services.get(AuthService).get_user_from_access()
+
 
+async def get_principal_from_access_token(services: ServiceContainer = Depends(get_services)) -> Principal:
+    return await services.get(AuthService).get_principal_from_access()
 
-async def get_user_from_refresh_token(
-        db: AsyncSession = Depends(get_session),
-        redis: Redis = Depends(get_redis),
-        authorize: AuthJWT = Depends()
-) -> User:
-    return await AuthService(db, redis, authorize).get_user_from_refresh()
+
+async def get_admin_from_access_token(user: Principal = Depends(get_principal_from_access_token)) -> Principal:
+    if not user.is_admin():
+        raise USER_DOES_NOT_HAVE_RIGHTS()
+    return user
+
+
+async def get_principal_from_refresh_token(services: ServiceContainer = Depends(get_services)) -> Principal:
+    return await services.get(AuthService).get_principal_from_refresh()
 
 
 async def get_user_info_from_request(
         request: StarletteRequest,
         oauth_service: OAuth
 ) -> dict:
-    try:
-        token = await oauth_service.authorize_access_token(request)
-    except MismatchingStateError:
-        raise OAUTH_ERROR
+    with measure_callback(oauth_service.name):
+        try:
+            token = await oauth_service.authorize_access_token(request)
+        except MismatchingStateError:
+            raise OAUTH_ERROR()
     user_info = token['userinfo']
     return user_info
@@ -1,10 +1,15 @@
+from typing import TypeVar
 from uuid import UUID
 
 from async_fastapi_jwt_auth import AuthJWT
+from fastapi import Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 from redis.asyncio.client import Redis
 
 from src.core.exceptions import USER_NOT_FOUND
+from src.core.signing import KeyedAuthJWT
+from src.db.postgres import get_session
+from src.db.redis_db import get_redis
 from src.models.users import User
 
 
@@ -23,9 +28,50 @@ class BaseService:
         await self.db.commit()
         await self.db.refresh(model_object)
 
+    async def release_connection(self) -> None:
+        """Завершает транзакцию и возвращает соединение в пул.
+
+        Загруженные объекты остаются доступны (expire_on_commit=False),
+        следующий запрос сессии возьмет соединение заново. В режиме
+        DB_SESSION_MODE=unit_of_work после чтения соединение уже отдано, вызов ничего не делает.
+        """
+        await self.db.commit()
+
     async def get_user_by_id(self, user_id: UUID) -> User:
         user: User = await self.db.get(User, user_id)
-        if not user:
-            raise USER_NOT_FOUND
+        if not user or user.is_deleted:
+            raise USER_NOT_FOUND()
         return user
 
+
+ServiceType = TypeVar('ServiceType', bound=BaseService)
+
+
+class ServiceContainer:
+    """Сервисы одного запроса: создаются при первом обращении, используют общую сессию
+    и освобождаются вместе с запросом"""
+
+    def __init__(
+            self, db: AsyncSession,
+            redis: Redis = None,
+            authorize: AuthJWT = None):
+        self.db = db
+        self.redis = redis
+        self.authorize = authorize
+        self._services: dict[type, BaseService] = {}
+
+    def get(self, service_class: type[ServiceType]) -> ServiceType:
+        service = self._services.get(service_class)
+        if service is None:
+            service = service_class(self.db, self.redis, self.authorize)
+            self._services[service_class] = service
+        return service
+
+
+def get_services(
+        db: AsyncSession = Depends(get_session),
+        redis: Redis = Depends(get_redis),
+        authorize: AuthJWT = Depends(KeyedAuthJWT)
+) -> ServiceContainer:
+    """FastAPI кеширует зависимость в пределах запроса, поэтому контейнер на запрос один"""
+    return ServiceContainer(db, redis, authorize)
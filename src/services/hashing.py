@@ -0,0 +1,129 @@
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from opentelemetry import metrics, trace
+from werkzeug.security import check_password_hash, generate_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+from src.core.config import settings
+from src.core.exceptions import PASSWORD_HASHER_OVERLOADED, PASSWORD_HASHING_TIMEOUT
+
+
+meter = metrics.get_meter(__name__)
+tracer = trace.get_tracer(__name__)
+
+queue_wait_histogram = meter.create_histogram(
+    'auth.password_hash.queue_wait',
+    unit='s',
+    description='Время ожидания свободного процесса для хеширования'
+)
+hash_time_histogram = meter.create_histogram(
+    'auth.password_hash.duration',
+    unit='s',
+    description='Время хеширования или проверки пароля внутри процесса'
+)
+pending_counter = meter.create_up_down_counter(
+    'auth.password_hash.pending',
+    description='Количество операций в очереди и в работе'
+)
+rejected_counter = meter.create_counter(
+    'auth.password_hash.rejected',
+    description='Операции, отклоненные из-за переполнения очереди или таймаута'
+)
+
+
+def normalize_hash_method(method: str) -> str:
+    """Дополняет метод параметрами по умолчанию werkzeug: 'scrypt' -> 'scrypt:32768:8:1'"""
+    name, *params = method.split(':')
+    if name == 'scrypt':
+        defaults = [str(2 ** 15), '8', '1']
+    elif name == 'pbkdf2':
+        defaults = ['sha256', str(DEFAULT_PBKDF2_ITERATIONS)]
+    else:
+        return method
+    return ':'.join([name, *params, *defaults[len(params):]])
+
+
+def _timed_call(func, *args) -> tuple:
+    """Выполняется в дочернем процессе: возвращает результат, момент старта и длительность"""
+    started_at = time.time()
+    start = time.perf_counter()
+    result = func(*args)
+    return result, started_at, time.perf_counter() - start
+
+
+class PasswordHasher:
+    """Хеширование паролей в пуле процессов, чтобы не блокировать event loop"""
+
+    def __init__(self, method: str, workers: int, queue_size: int, timeout: float) -> None:
+        self.method = normalize_hash_method(method)
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._executor: ProcessPoolExecutor | None = None
+        self._pending = 0
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn вместо fork: у воркера uvicorn уже есть потоки (экспортеры OTel)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=get_context('spawn')
+            )
+        return self._executor
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _run(self, operation: str, func, *args):
+        with tracer.start_as_current_span(f'password_hash.{operation}') as span:
+            if self._pending >= self.queue_size:
+                rejected_counter.add(1, {'operation': operation, 'reason': 'overloaded'})
+                raise PASSWORD_HASHER_OVERLOADED()
+
+            self._pending += 1
+            pending_counter.add(1)
+            span.set_attribute('password_hash.pending', self._pending)
+            submitted_at = time.time()
+            future = self.executor.submit(_timed_call, func, *args)
+            try:
+                result, started_at, duration = await asyncio.wait_for(
+                    asyncio.wrap_future(future), self.timeout
+                )
+            except asyncio.TimeoutError:
+                future.cancel()
+                rejected_counter.add(1, {'operation': operation, 'reason': 'timeout'})
+                raise PASSWORD_HASHING_TIMEOUT()
+            finally:
+                self._pending -= 1
+                pending_counter.add(-1)
+
+            queue_wait = max(started_at - submitted_at, 0.0)
+            queue_wait_histogram.record(queue_wait, {'operation': operation})
+            hash_time_histogram.record(duration, {'operation': operation})
+            span.set_attribute('password_hash.queue_wait_ms', queue_wait * 1000)
+            span.set_attribute('password_hash.duration_ms', duration * 1000)
+            return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run('hash', generate_password_hash, password, self.method)
+
+    async def verify(self, password_hash: str, password: str) -> bool:
+        return await self._run('verify', check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        """Хеш записан с методом или стоимостью, отличными от текущих настроек"""
+        method = password_hash.split('$', 1)[0]
+        return normalize_hash_method(method) != self.method
+
+
+password_hasher = PasswordHasher(
+    method=settings.PASSWORD_HASH_METHOD,
+    workers=settings.HASH_POOL_WORKERS,
+    queue_size=settings.HASH_QUEUE_SIZE,
+    timeout=settings.HASH_TIMEOUT
+)
@@ -0,0 +1,266 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from datetime import datetime
+from uuid import UUID, uuid5, NAMESPACE_URL
+
+from opentelemetry import metrics
+from opentelemetry.metrics import Observation
+from redis.asyncio.client import Redis
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, OperationalError, InterfaceError
+
+from src.core.config import settings
+from src.db.postgres import async_session
+from src.db.redis_db import redis as redis_client
+
+
+logger = logging.getLogger(__name__)
+
+HISTORY_STREAM = 'auth:login_history'
+HISTORY_GROUP = 'history-writers'
+# Сообщения, которые другой воркер взял и не подтвердил за это время, забираем себе
+CLAIM_IDLE_MS = 60_000
+CLAIM_INTERVAL = 30.0
+RETRY_DELAY = 1.0
+PARTITION_MAINTENANCE_INTERVAL = 24 * 60 * 60
+# Ключ advisory lock, чтобы воркеры не создавали партиции одновременно
+PARTITION_LOCK_KEY = 7_301_001
+PARTITION_PREFIX = 'login_history_'
+# События удаленных пользователей пропускаем, а не роняем всю пачку на внешнем ключе
+INSERT_LOGIN_HISTORY = text(
+    'INSERT INTO login_history (id, user_id, user_agent, created_at) '
+    'SELECT CAST(:id AS uuid), CAST(:user_id AS uuid), :user_agent, CAST(:created_at AS timestamp) '
+    'WHERE EXISTS (SELECT 1 FROM users WHERE users.id = CAST(:user_id AS uuid)) '
+    'ON CONFLICT DO NOTHING'
+)
+
+meter = metrics.get_meter(__name__)
+
+batch_size_histogram = meter.create_histogram(
+    'auth.login_history.batch_size',
+    description='Количество записей истории в одной пачке вставки'
+)
+flush_time_histogram = meter.create_histogram(
+    'auth.login_history.flush_duration',
+    unit='s',
+    description='Время вставки пачки истории в Postgres'
+)
+fallback_counter = meter.create_counter(
+    'auth.login_history.sync_writes',
+    description='Записи истории, сохраненные напрямую в Postgres из-за отставания или ошибки Redis'
+)
+dropped_counter = meter.create_counter(
+    'auth.login_history.dropped',
+    description='События истории, которые нельзя записать в Postgres и которые удалены из потока'
+)
+
+
+class LoginHistoryWriter:
+    """Отложенная запись истории входов: события копятся в Redis Stream и вставляются пачками"""
+
+    def __init__(self, enabled: bool, batch_size: int, flush_interval: float, max_backlog: int) -> None:
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backlog = max_backlog
+        self.consumer = f'{socket.gethostname()}-{os.getpid()}'
+        # Обновляются циклом записи, метрики и проверка переполнения читают готовые значения
+        self.backlog = 0
+        self.pending = 0
+        self.lag_seconds = 0.0
+
+        meter.create_observable_gauge(
+            'auth.login_history.backlog',
+            callbacks=[lambda options: [Observation(self.backlog)]],
+            description='События истории в потоке, еще не записанные в Postgres'
+        )
+        meter.create_observable_gauge(
+            'auth.login_history.pending',
+            callbacks=[lambda options: [Observation(self.pending)]],
+            description='События, выданные воркерам и еще не подтвержденные'
+        )
+        meter.create_observable_gauge(
+            'auth.login_history.lag',
+            unit='s',
+            callbacks=[lambda options: [Observation(self.lag_seconds)]],
+            description='Возраст самого старого незаписанного события'
+        )
+
+    async def append(self, redis: Redis, user_id: UUID, user_agent: str) -> bool:
+        """Ставит событие в поток; False - записать нужно сразу, поток переполнен или недоступен"""
+        if not self.enabled:
+            return False
+        if self.backlog >= self.max_backlog:
+            fallback_counter.add(1, {'reason': 'backlog'})
+            return False
+        try:
+            await redis.xadd(HISTORY_STREAM, {
+                'user_id': str(user_id),
+                'user_agent': user_agent,
+                'created_at': repr(time.time())
+            })
+        except Exception:
+            logger.warning('Failed to append login event, writing directly', exc_info=True)
+            fallback_counter.add(1, {'reason': 'redis_error'})
+            return False
+        return True
+
+    async def ensure_group(self) -> None:
+        try:
+            await redis_client.xgroup_create(HISTORY_STREAM, HISTORY_GROUP, id='0', mkstream=True)
+        except Exception as error:
+            if 'BUSYGROUP' not in str(error):
+                raise
+
+    @staticmethod
+    def to_row(message_id: bytes, fields: dict) -> dict:
+        return {
+            # id выводим из id сообщения, чтобы повторная доставка не создала дубль
+            'id': uuid5(NAMESPACE_URL, f'{HISTORY_STREAM}/{message_id.decode()}'),
+            'user_id': UUID(fields[b'user_id'].decode()),
+            'user_agent': fields[b'user_agent'].decode()[:200],
+            'created_at': datetime.utcfromtimestamp(float(fields[b'created_at']))
+        }
+
+    @staticmethod
+    async def insert_rows(rows: list[dict]) -> None:
+        async with async_session() as db:
+            await db.execute(INSERT_LOGIN_HISTORY, rows)
+            await db.commit()
+
+    async def insert_row_or_drop(self, row: dict) -> None:
+        try:
+            await self.insert_rows([row])
+        except DBAPIError as error:
+            # Обрыв соединения временный - пачка повторится целиком, остальное не пройдет и при повторе
+            if error.connection_invalidated or isinstance(error, (OperationalError, InterfaceError)):
+                raise
+            logger.error('Dropping login history event %s', row['id'], exc_info=True)
+            dropped_counter.add(1, {'reason': 'database'})
+
+    async def flush(self, messages: list) -> None:
+        if not messages:
+            return
+        start = time.perf_counter()
+        rows = []
+        for message_id, fields in messages:
+            try:
+                rows.append(self.to_row(message_id, fields))
+            except (KeyError, TypeError, ValueError):
+                logger.error('Dropping malformed login history event %s', message_id, exc_info=True)
+                dropped_counter.add(1, {'reason': 'malformed'})
+        try:
+            if rows:
+                await self.insert_rows(rows)
+        except DBAPIError:
+            # Одна плохая запись откатывает всю пачку: пишем по одной, чтобы пропустить только ее
+            logger.warning('Failed to insert login history batch, inserting one by one', exc_info=True)
+            for row in rows:
+                await self.insert_row_or_drop(row)
+        message_ids = [message_id for message_id, _ in messages]
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.xack(HISTORY_STREAM, HISTORY_GROUP, *message_ids)
+            pipe.xdel(HISTORY_STREAM, *message_ids)
+            await pipe.execute()
+        batch_size_histogram.record(len(rows))
+        flush_time_histogram.record(time.perf_counter() - start)
+
+    async def update_stats(self) -> None:
+        # Подтвержденные сообщения удаляются, поэтому длина потока и есть отставание
+        self.backlog = await redis_client.xlen(HISTORY_STREAM)
+        pending = await redis_client.xpending(HISTORY_STREAM, HISTORY_GROUP)
+        self.pending = pending['pending']
+        oldest = await redis_client.xrange(HISTORY_STREAM, count=1)
+        if oldest:
+            created_ms = int(oldest[0][0].decode().split('-')[0])
+            self.lag_seconds = max(time.time() - created_ms / 1000, 0.0)
+        else:
+            self.lag_seconds = 0.0
+
+    async def claim_stale(self) -> None:
+        response = await redis_client.xautoclaim(
+            HISTORY_STREAM, HISTORY_GROUP, self.consumer,
+            min_idle_time=CLAIM_IDLE_MS, count=self.batch_size
+        )
+        await self.flush(response[1])
+
+    async def run(self) -> None:
+        last_claim = 0.0
+        while True:
+            try:
+                await self.ensure_group()
+                while True:
+                    if time.monotonic() - last_claim > CLAIM_INTERVAL:
+                        # Отмечаем заранее: упавший claim не должен блокировать чтение новых событий
+                        last_claim = time.monotonic()
+                        await self.claim_stale()
+                    response = await redis_client.xreadgroup(
+                        HISTORY_GROUP, self.consumer, {HISTORY_STREAM: '>'},
+                        count=self.batch_size, block=int(self.flush_interval * 1000)
+                    )
+                    for _, messages in response:
+                        await self.flush(messages)
+                    await self.update_stats()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning('Login history writer failed, retrying', exc_info=True)
+                await asyncio.sleep(RETRY_DELAY)
+
+
+login_history_writer = LoginHistoryWriter(
+    enabled=settings.HISTORY_WRITE_BEHIND,
+    batch_size=settings.HISTORY_BATCH_SIZE,
+    flush_interval=settings.HISTORY_FLUSH_INTERVAL,
+    max_backlog=settings.HISTORY_MAX_BACKLOG
+)
+
+
+async def maintain_login_history_partitions() -> None:
+    """Создает помесячные партиции истории наперед и удаляет вышедшие за срок хранения"""
+    async with async_session() as db:
+        await db.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': PARTITION_LOCK_KEY})
+        await db.execute(
+            text(
+                "SELECT create_login_history_partition("
+                "(date_trunc('month', now()) + make_interval(months => months_ahead))::date) "
+                "FROM generate_series(0, :months_ahead) AS months_ahead"
+            ),
+            {'months_ahead': settings.HISTORY_PARTITIONS_AHEAD}
+        )
+        if settings.HISTORY_RETENTION_MONTHS:
+            await drop_expired_partitions(db, settings.HISTORY_RETENTION_MONTHS)
+        await db.commit()
+
+
+async def drop_expired_partitions(db, retention_months: int) -> None:
+    now = datetime.utcnow()
+    # Номер месяца, партиции раньше которого больше не нужны
+    border = now.year * 12 + now.month - 1 - retention_months
+    query = await db.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE pg_inherits.inhparent = 'login_history'::regclass"
+    ))
+    for partition_name in query.scalars().all():
+        try:
+            year, month = partition_name.removeprefix(PARTITION_PREFIX).split('_')
+            partition_month = int(year) * 12 + int(month) - 1
+        except ValueError:
+            # login_history_default и чужие партиции не трогаем
+            continue
+        if partition_month < border:
+            await db.execute(text(f'ALTER TABLE login_history DETACH PARTITION "{partition_name}"'))
+            await db.execute(text(f'DROP TABLE "{partition_name}"'))
+
+
+async def run_partition_maintenance() -> None:
+    while True:
+        try:
+            await maintain_login_history_partitions()
+        except Exception:
+            logger.warning('Login history partition maintenance failed', exc_info=True)
+        await asyncio.sleep(PARTITION_MAINTENANCE_INTERVAL)
@@ -0,0 +1,138 @@
+import hmac
+import time
+from uuid import UUID
+
+from async_fastapi_jwt_auth.exceptions import AuthJWTException
+from fastapi import Depends, Header
+from sqlalchemy import text
+
+from src.core.cache import TTLCache
+from src.core.config import settings
+from src.core.exceptions import GATEWAY_NOT_AUTHORIZED
+from src.schemas.tokens import TokenIntrospection
+from src.services.common import BaseService, ServiceContainer, get_services
+from src.services.revocation import REVOKED_SESSIONS_KEY, logout_key, token_issued_at
+from src.services.role_claims import ROLES_VERSION_KEY, format_version, user_roles_version_key
+
+
+# Роли пользователей, изменившиеся после выдачи токенов; удаленных пользователей в выборке нет
+SELECT_USER_ROLES = text("""
+    SELECT users.id, roles.name
+    FROM users
+    LEFT JOIN user_roles ON user_roles.user_id = users.id
+    LEFT JOIN roles ON roles.id = user_roles.role_id
+    WHERE users.id = ANY(CAST(:user_ids AS uuid[])) AND users.deleted_at IS NULL
+""")
+
+INACTIVE = TokenIntrospection(active=False)
+
+
+class IntrospectionService(BaseService):
+    """Проверка пачки access токенов: один запрос к Redis и не больше одного к БД.
+
+    Подпись каждого токена проверяется один раз, claims запоминаются на
+    INTROSPECT_CACHE_TTL: шлюзы присылают одни и те же токены много раз.
+    Отзыв и роли проверяются при каждом запросе.
+    """
+
+    async def introspect(self, tokens: list[str]) -> list[TokenIntrospection]:
+        claims_by_token = {token: await self.verify(token) for token in dict.fromkeys(tokens)}
+        valid_claims = {token: claims for token, claims in claims_by_token.items() if claims is not None}
+        results = await self.check_claims(valid_claims) if valid_claims else {}
+        return [results.get(token, INACTIVE) for token in tokens]
+
+    async def verify(self, token: str) -> dict | None:
+        claims = verified_claims.get(token)
+        if claims is None:
+            try:
+                claims = await self.authorize.verify_access_token(token)
+            except AuthJWTException:
+                return None
+            verified_claims.set(token, claims)
+        # Из кеша может прийти уже истекший токен
+        return claims if claims['exp'] > time.time() else None
+
+    async def check_claims(self, valid_claims: dict[str, dict]) -> dict[str, TokenIntrospection]:
+        user_ids = list({UUID(claims['sub']) for claims in valid_claims.values()})
+        session_ids = list({claims['sid'] for claims in valid_claims.values() if 'sid' in claims})
+        logout_times, role_versions, revoked_sessions = await self.read_revocations(user_ids, session_ids)
+
+        now = time.time()
+        active_claims = {
+            token: claims for token, claims in valid_claims.items()
+            if token_issued_at(claims) > logout_times.get(UUID(claims['sub']), 0.0)
+            and revoked_sessions.get(claims.get('sid'), 0.0) <= now
+        }
+        stale_user_ids = {
+            UUID(claims['sub']) for claims in active_claims.values()
+            if 'roles' not in claims or claims.get('rv') != role_versions[UUID(claims['sub'])]
+        }
+        user_roles = await self.get_user_roles(stale_user_ids) if stale_user_ids else {}
+
+        results = {}
+        for token, claims in active_claims.items():
+            user_id = UUID(claims['sub'])
+            if user_id not in stale_user_ids:
+                roles = claims['roles']
+            elif user_id in user_roles:
+                roles = user_roles[user_id]
+            else:
+                continue
+            results[token] = TokenIntrospection(
+                active=True, sub=user_id, roles=roles, exp=claims['exp'], sid=claims.get('sid')
+            )
+        return results
+
+    async def read_revocations(
+            self, user_ids: list[UUID], session_ids: list[str]
+    ) -> tuple[dict[UUID, float], dict[UUID, str], dict[str, float]]:
+        """Отметки выхода, версии ролей и отзывы сессий одним обращением к Redis"""
+        keys = [logout_key(user_id) for user_id in user_ids]
+        keys += [ROLES_VERSION_KEY] + [user_roles_version_key(user_id) for user_id in user_ids]
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.mget(keys)
+            if session_ids:
+                pipe.zmscore(REVOKED_SESSIONS_KEY, session_ids)
+            replies = await pipe.execute()
+
+        values = replies[0]
+        logout_values, roles_version, user_versions = (
+            values[:len(user_ids)], values[len(user_ids)], values[len(user_ids) + 1:]
+        )
+        logout_times = {
+            user_id: float(value.decode()) for user_id, value in zip(user_ids, logout_values) if value
+        }
+        role_versions = {
+            user_id: format_version(roles_version, user_version)
+            for user_id, user_version in zip(user_ids, user_versions)
+        }
+        revoked_sessions = {
+            session_id: expires_at for session_id, expires_at in zip(session_ids, replies[1]) if expires_at
+        } if session_ids else {}
+        return logout_times, role_versions, revoked_sessions
+
+    async def get_user_roles(self, user_ids: set[UUID]) -> dict[UUID, list[str]]:
+        query = await self.db.execute(SELECT_USER_ROLES, {'user_ids': list(user_ids)})
+        user_roles: dict[UUID, list[str]] = {}
+        for user_id, role_name in query.all():
+            roles = user_roles.setdefault(user_id, [])
+            if role_name is not None:
+                roles.append(role_name)
+        await self.release_connection()
+        return {user_id: sorted(roles) for user_id, roles in user_roles.items()}
+
+
+def check_gateway_token(x_gateway_token: str | None = Header(None)) -> None:
+    """Токены и роли пользователей отдаются только шлюзам; без настроенных секретов - никому"""
+    if not x_gateway_token or not any(
+        hmac.compare_digest(x_gateway_token.encode(), token.encode())
+        for token in settings.INTROSPECT_GATEWAY_TOKENS
+    ):
+        raise GATEWAY_NOT_AUTHORIZED()
+
+
+def get_introspection_service(services: ServiceContainer = Depends(get_services)) -> IntrospectionService:
+    return services.get(IntrospectionService)
+
+
+verified_claims = TTLCache(settings.INTROSPECT_CACHE_SIZE, settings.INTROSPECT_CACHE_TTL)
@@ -0,0 +1,89 @@
+from dataclasses import dataclass
+from uuid import UUID
+
+from redis.asyncio.client import Redis
+
+from src.core.cache import TTLCache
+from src.core.config import settings, admin_settings
+from src.db.redis_db import listen_channel
+from src.models.users import User
+
+
+INVALIDATION_CHANNEL = 'auth:principal_invalidation'
+INVALIDATE_ALL = '*'
+
+
+@dataclass(frozen=True, slots=True)
+class Principal:
+    """Аутентифицированный пользователь без привязки к сессии БД"""
+    id: UUID
+    roles: tuple[str, ...]
+
+    @classmethod
+    def from_user(cls, user: User) -> 'Principal':
+        return cls(
+            id=user.id,
+            roles=tuple(role.name for role in user.roles)
+        )
+
+    @classmethod
+    def from_claims(cls, user_id: UUID, claims: dict) -> 'Principal':
+        return cls(id=UUID(str(user_id)), roles=tuple(claims['roles']))
+
+    def is_admin(self) -> bool:
+        return admin_settings.ADMIN_ROLE_NAME in self.roles
+
+
+class PrincipalCache:
+    """Кеш пользователей воркера, сбрасываемый через Redis pub/sub.
+
+    Пока подписки на канал нет, кеш не используется: инвалидации могли потеряться.
+    """
+
+    def __init__(self, enabled: bool, maxsize: int, ttl: float) -> None:
+        self.enabled = enabled
+        self.subscribed = False
+        # Растет при каждой инвалидации, чтобы не положить в кеш данные, прочитанные до нее
+        self.generation = 0
+        self._cache = TTLCache(maxsize, ttl)
+
+    @property
+    def active(self) -> bool:
+        return self.enabled and self.subscribed
+
+    def get(self, user_id: UUID) -> Principal | None:
+        if not self.active:
+            return None
+        return self._cache.get(user_id)
+
+    def set(self, principal: Principal, generation: int) -> None:
+        if self.active and generation == self.generation:
+            self._cache.set(principal.id, principal)
+
+    def invalidate(self, user_id: str) -> None:
+        self.generation += 1
+        if user_id == INVALIDATE_ALL:
+            self._cache.clear()
+        else:
+            self._cache.pop(UUID(user_id))
+
+    def on_subscription_change(self, subscribed: bool) -> None:
+        self.subscribed = subscribed
+        self.invalidate(INVALIDATE_ALL)
+
+    async def listen(self) -> None:
+        await listen_channel(INVALIDATION_CHANNEL, self.invalidate, self.on_subscription_change)
+
+
+async def publish_principal_invalidation(redis: Redis, user_id: UUID | None = None) -> None:
+    """Сброс пользователя во всех воркерах; без user_id - сброс всего кеша"""
+    if not principal_cache.enabled:
+        return
+    await redis.publish(INVALIDATION_CHANNEL, str(user_id) if user_id else INVALIDATE_ALL)
+
+
+principal_cache = PrincipalCache(
+    enabled=settings.PRINCIPAL_CACHE_ENABLED,
+    maxsize=settings.PRINCIPAL_CACHE_SIZE,
+    ttl=settings.PRINCIPAL_CACHE_TTL
+)
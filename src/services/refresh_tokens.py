@@ -0,0 +1,202 @@
+import asyncio
+import logging
+from datetime import datetime
+from enum import Enum
+from uuid import UUID
+
+from redis.asyncio.client import Redis
+from sqlalchemy import select, update, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.core.config import settings
+from src.db.postgres import async_session
+from src.models.sessions import UserSession
+from src.models.tokens import RefreshTokens
+
+
+logger = logging.getLogger(__name__)
+
+
+class RotationResult(Enum):
+    ROTATED = 'rotated'
+    # Токен уже обменяли раньше: его украли или клиент повторил запрос
+    REUSED = 'reused'
+    UNKNOWN = 'unknown'
+
+
+class PostgresRefreshTokenStore:
+    """Refresh токены в Postgres: строка на jti, семейство - цепочка ротаций одного входа"""
+
+    def __init__(self, db: AsyncSession) -> None:
+        self.db = db
+
+    async def add(self, user_id: UUID, jti: UUID, family_id: UUID, expires_at: datetime) -> None:
+        self.db.add(RefreshTokens(user_id=user_id, jti=jti, family_id=family_id, expires_at=expires_at))
+        await self.db.commit()
+
+    async def rotate(self, user_id: UUID, jti: UUID, new_jti: UUID, expires_at: datetime) -> RotationResult:
+        query = await self.db.execute(
+            update(RefreshTokens)
+            .where(
+                RefreshTokens.jti == jti,
+                RefreshTokens.user_id == user_id,
+                RefreshTokens.rotated_at.is_(None)
+            )
+            .values(rotated_at=datetime.utcnow())
+            .returning(RefreshTokens.family_id)
+        )
+        family_id = query.scalar()
+        if family_id:
+            await self.add(user_id, new_jti, family_id, expires_at)
+            return RotationResult.ROTATED
+
+        query = await self.db.execute(
+            select(RefreshTokens.family_id).where(RefreshTokens.jti == jti, RefreshTokens.user_id == user_id)
+        )
+        family_id = query.scalar()
+        if not family_id:
+            await self.db.rollback()
+            return RotationResult.UNKNOWN
+        await self.db.execute(delete(RefreshTokens).where(RefreshTokens.family_id == family_id))
+        await self.db.commit()
+        return RotationResult.REUSED
+
+    async def revoke_family(self, user_id: UUID, family_id: UUID) -> None:
+        await self.db.execute(
+            delete(RefreshTokens).where(RefreshTokens.family_id == family_id, RefreshTokens.user_id == user_id)
+        )
+        await self.db.commit()
+
+    async def revoke_user(self, user_id: UUID) -> None:
+        await self.db.execute(delete(RefreshTokens).where(RefreshTokens.user_id == user_id))
+        await self.db.commit()
+
+
+class RedisRefreshTokenStore:
+    """Refresh токены в Redis с TTL по сроку жизни токена, без обращений к Postgres"""
+
+    TOKEN_PREFIX = 'refresh:'
+    FAMILY_PREFIX = 'refresh_family:'
+    USER_PREFIX = 'refresh_user:'
+
+    # KEYS: старый токен, новый токен, семейства пользователя; ARGV: user_id, ttl нового токена, префиксы
+    ROTATE_SCRIPT = """
+    local token = redis.call('HMGET', KEYS[1], 'user', 'family', 'rotated')
+    if not token[1] or token[1] ~= ARGV[1] then
+        return 'unknown'
+    end
+    local family_key = ARGV[4] .. token[2]
+    if token[3] == '1' then
+        for _, jti in ipairs(redis.call('SMEMBERS', family_key)) do
+            redis.call('DEL', ARGV[3] .. jti)
+        end
+        redis.call('DEL', family_key)
+        redis.call('SREM', KEYS[3], token[2])
+        return 'reused'
+    end
+    redis.call('HSET', KEYS[1], 'rotated', '1')
+    redis.call('HSET', KEYS[2], 'user', ARGV[1], 'family', token[2], 'rotated', '0')
+    redis.call('EXPIRE', KEYS[2], ARGV[2])
+    redis.call('SADD', family_key, string.sub(KEYS[2], string.len(ARGV[3]) + 1))
+    redis.call('EXPIRE', family_key, ARGV[2])
+    redis.call('EXPIRE', KEYS[3], ARGV[2])
+    return 'rotated'
+    """
+
+    # KEYS: семейство, множество семейств пользователя; ARGV: id семейства, префикс токенов
+    REVOKE_FAMILY_SCRIPT = """
+    if redis.call('SISMEMBER', KEYS[2], ARGV[1]) == 0 then
+        return
+    end
+    for _, jti in ipairs(redis.call('SMEMBERS', KEYS[1])) do
+        redis.call('DEL', ARGV[2] .. jti)
+    end
+    redis.call('DEL', KEYS[1])
+    redis.call('SREM', KEYS[2], ARGV[1])
+    """
+
+    # KEYS: множество семейств пользователя; ARGV: префиксы
+    REVOKE_USER_SCRIPT = """
+    for _, family in ipairs(redis.call('SMEMBERS', KEYS[1])) do
+        local family_key = ARGV[2] .. family
+        for _, jti in ipairs(redis.call('SMEMBERS', family_key)) do
+            redis.call('DEL', ARGV[1] .. jti)
+        end
+        redis.call('DEL', family_key)
+    end
+    redis.call('DEL', KEYS[1])
+    """
+
+    def __init__(self, redis: Redis) -> None:
+        self.redis = redis
+        self.rotate_script = redis.register_script(self.ROTATE_SCRIPT)
+        self.revoke_family_script = redis.register_script(self.REVOKE_FAMILY_SCRIPT)
+        self.revoke_user_script = redis.register_script(self.REVOKE_USER_SCRIPT)
+
+    @staticmethod
+    def ttl(expires_at: datetime) -> int:
+        return max(int((expires_at - datetime.utcnow()).total_seconds()), 1)
+
+    async def add(self, user_id: UUID, jti: UUID, family_id: UUID, expires_at: datetime) -> None:
+        ttl = self.ttl(expires_at)
+        token_key = f'{self.TOKEN_PREFIX}{jti}'
+        family_key = f'{self.FAMILY_PREFIX}{family_id}'
+        user_key = f'{self.USER_PREFIX}{user_id}'
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(token_key, mapping={'user': str(user_id), 'family': str(family_id), 'rotated': '0'})
+            pipe.expire(token_key, ttl)
+            pipe.sadd(family_key, str(jti))
+            pipe.expire(family_key, ttl)
+            pipe.sadd(user_key, str(family_id))
+            pipe.expire(user_key, ttl)
+            await pipe.execute()
+
+    async def rotate(self, user_id: UUID, jti: UUID, new_jti: UUID, expires_at: datetime) -> RotationResult:
+        result = await self.rotate_script(
+            keys=[
+                f'{self.TOKEN_PREFIX}{jti}',
+                f'{self.TOKEN_PREFIX}{new_jti}',
+                f'{self.USER_PREFIX}{user_id}'
+            ],
+            args=[str(user_id), self.ttl(expires_at), self.TOKEN_PREFIX, self.FAMILY_PREFIX]
+        )
+        return RotationResult(result.decode())
+
+    async def revoke_family(self, user_id: UUID, family_id: UUID) -> None:
+        await self.revoke_family_script(
+            keys=[f'{self.FAMILY_PREFIX}{family_id}', f'{self.USER_PREFIX}{user_id}'],
+            args=[str(family_id), self.TOKEN_PREFIX]
+        )
+
+    async def revoke_user(self, user_id: UUID) -> None:
+        await self.revoke_user_script(
+            keys=[f'{self.USER_PREFIX}{user_id}'],
+            args=[self.TOKEN_PREFIX, self.FAMILY_PREFIX]
+        )
+
+
+def create_refresh_token_store(
+        db: AsyncSession, redis: Redis
+) -> PostgresRefreshTokenStore | RedisRefreshTokenStore:
+    if settings.REFRESH_TOKEN_STORE == 'redis':
+        return RedisRefreshTokenStore(redis)
+    return PostgresRefreshTokenStore(db)
+
+
+async def purge_expired_refresh_tokens() -> None:
+    async with async_session() as db:
+        now = datetime.utcnow()
+        if settings.REFRESH_TOKEN_STORE == 'postgres':
+            await db.execute(delete(RefreshTokens).where(RefreshTokens.expires_at < now))
+        await db.execute(delete(UserSession).where(UserSession.expires_at < now))
+        await db.commit()
+
+
+async def run_refresh_token_purge() -> None:
+    """Периодически удаляет истекшие сессии и токены, которые держались ради обнаружения повторов"""
+    while True:
+        try:
+            await purge_expired_refresh_tokens()
+        except Exception:
+            logger.warning('Failed to purge expired refresh tokens', exc_info=True)
+        await asyncio.sleep(settings.REFRESH_TOKEN_PURGE_INTERVAL)
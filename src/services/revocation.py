@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
+from uuid import UUID
+
+from redis.asyncio.client import Redis
+
+from src.core.config import settings
+from src.db.redis_db import redis as redis_client, listen_channel
+
+
+logger = logging.getLogger(__name__)
+
+LOGOUT_KEY_PREFIX = 'logout:'
+LOGOUT_CHANNEL = 'auth:logout'
+REVOKED_SESSIONS_KEY = 'revoked_sessions'
+SESSION_REVOKED_CHANNEL = 'auth:session_revoked'
+SCAN_BATCH_SIZE = 1000
+ISSUED_AT_MS_CLAIM = 'iat_ms'
+
+
+def logout_key(user_id: UUID) -> str:
+    return f'{LOGOUT_KEY_PREFIX}{user_id}'
+
+
+def issued_at_claims() -> dict:
+    """Время выпуска токена в миллисекундах: iat целый и не отличает вход от выхода в ту же секунду"""
+    return {ISSUED_AT_MS_CLAIM: time.time_ns() // 1_000_000}
+
+
+def token_issued_at(claims: dict) -> float:
+    """Время выпуска токена для сравнения с отметкой выхода; у старых токенов только iat"""
+    if ISSUED_AT_MS_CLAIM in claims:
+        return claims[ISSUED_AT_MS_CLAIM] / 1000
+    return claims['iat']
+
+
+def access_token_lifetime() -> int:
+    """Время жизни access токена в секундах (ACCESS_TOKEN_EXPIRE задан в минутах)"""
+    return settings.ACCESS_TOKEN_EXPIRE * 60
+
+
+class RedisReplica(ABC):
+    """Копия данных из Redis в памяти воркера, обновляемая через канал pub/sub.
+
+    Снимок загружается при каждой подписке на канал; пока копия не синхронизирована,
+    проверки ходят в Redis напрямую.
+    """
+
+    channel: str
+
+    def __init__(self, enabled: bool) -> None:
+        self.enabled = enabled
+        self.synced = False
+        self._load_task: asyncio.Task | None = None
+
+    @abstractmethod
+    def on_message(self, message: str) -> None:
+        """Изменение из канала"""
+
+    @abstractmethod
+    async def load(self) -> None:
+        """Снимок данных из Redis; в конце выставляет synced"""
+
+    @abstractmethod
+    def prune(self) -> None:
+        """Удаление истекших записей, вызывается run_replica_prune"""
+
+    def on_subscription_change(self, subscribed: bool) -> None:
+        self.synced = False
+        if self._load_task:
+            self._load_task.cancel()
+            self._load_task = None
+        if subscribed:
+            # Загружаем снимок уже после подписки, чтобы не пропустить изменения между ними
+            self._load_task = asyncio.create_task(self._load_safely())
+
+    async def _load_safely(self) -> None:
+        try:
+            await self.load()
+        except Exception:
+            logger.warning('Failed to load %s replica, using Redis directly', self.channel, exc_info=True)
+
+    async def listen(self) -> None:
+        await listen_channel(self.channel, self.on_message, self.on_subscription_change)
+
+
+class LogoutWatermarks(RedisReplica):
+    """Копия отметок выхода пользователей (user_id -> timestamp) в памяти воркера"""
+
+    channel = LOGOUT_CHANNEL
+
+    def __init__(self, enabled: bool) -> None:
+        super().__init__(enabled)
+        self._watermarks: dict[UUID, float] = {}
+
+    def get(self, user_id: UUID) -> float | None:
+        return self._watermarks.get(user_id)
+
+    def add(self, user_id: UUID, logout_time: float) -> None:
+        self._watermarks[user_id] = max(logout_time, self._watermarks.get(user_id, 0.0))
+
+    def prune(self) -> None:
+        # Токены, выданные раньше этой границы, уже истекли сами
+        border = time.time() - access_token_lifetime()
+        expired = [user_id for user_id, logout_time in self._watermarks.items() if logout_time < border]
+        for user_id in expired:
+            del self._watermarks[user_id]
+
+    def on_message(self, message: str) -> None:
+        user_id, logout_time = message.split()
+        self.add(UUID(user_id), float(logout_time))
+
+    async def load(self) -> None:
+        async for keys in self._scan_batches():
+            values = await redis_client.mget(keys)
+            for key, value in zip(keys, values):
+                if value:
+                    self.add(UUID(key.decode().removeprefix(LOGOUT_KEY_PREFIX)), float(value.decode()))
+        self.prune()
+        self.synced = True
+
+    @staticmethod
+    async def _scan_batches():
+        batch = []
+        async for key in redis_client.scan_iter(match=f'{LOGOUT_KEY_PREFIX}*', count=SCAN_BATCH_SIZE):
+            batch.append(key)
+            if len(batch) == SCAN_BATCH_SIZE:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+class SessionRevocations(RedisReplica):
+    """Отозванные сессии (sid -> срок последнего access токена сессии) в памяти воркера.
+
+    В Redis это sorted set со сроком в score: проверка - ZSCORE, а записи
+    истекших токенов удаляются при каждом отзыве, поэтому размер ограничен
+    числом отозванных сессий с еще живыми токенами.
+    """
+
+    channel = SESSION_REVOKED_CHANNEL
+
+    def __init__(self, enabled: bool) -> None:
+        super().__init__(enabled)
+        self._revoked: dict[UUID, float] = {}
+
+    def is_revoked(self, session_id: UUID) -> bool:
+        return self._revoked.get(session_id, 0.0) > time.time()
+
+    def add(self, session_id: UUID, expires_at: float) -> None:
+        self._revoked[session_id] = expires_at
+
+    def prune(self) -> None:
+        now = time.time()
+        expired = [session_id for session_id, expires_at in self._revoked.items() if expires_at <= now]
+        for session_id in expired:
+            del self._revoked[session_id]
+
+    def on_message(self, message: str) -> None:
+        session_id, expires_at = message.split()
+        self.add(UUID(session_id), float(expires_at))
+
+    async def load(self) -> None:
+        revoked = await redis_client.zrangebyscore(REVOKED_SESSIONS_KEY, time.time(), '+inf', withscores=True)
+        self._revoked.update((UUID(session_id.decode()), expires_at) for session_id, expires_at in revoked)
+        self.prune()
+        self.synced = True
+
+
+async def get_logout_time(redis: Redis, user_id: UUID) -> float | None:
+    if logout_watermarks.synced:
+        return logout_watermarks.get(UUID(str(user_id)))
+    logout_time = await redis.get(logout_key(user_id))
+    return float(logout_time.decode()) if logout_time else None
+
+
+async def save_logout_time(redis: Redis, user_id: UUID, logout_time: float) -> None:
+    # Свое сообщение из канала придет позже, а до него копия воркера пропускала бы отозванные токены
+    if logout_watermarks.enabled:
+        logout_watermarks.add(UUID(str(user_id)), logout_time)
+    await redis.set(logout_key(user_id), str(logout_time), access_token_lifetime())
+    await redis.publish(LOGOUT_CHANNEL, f'{user_id} {logout_time}')
+
+
+async def is_session_revoked(redis: Redis, session_id: UUID) -> bool:
+    if session_revocations.synced:
+        return session_revocations.is_revoked(UUID(str(session_id)))
+    expires_at = await redis.zscore(REVOKED_SESSIONS_KEY, str(session_id))
+    return expires_at is not None and expires_at > time.time()
+
+
+async def save_session_revocation(redis: Redis, session_id: UUID) -> None:
+    """Отзыв access токенов сессии до истечения самого позднего из них"""
+    now = time.time()
+    expires_at = now + access_token_lifetime()
+    if session_revocations.enabled:
+        session_revocations.add(UUID(str(session_id)), expires_at)
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.zremrangebyscore(REVOKED_SESSIONS_KEY, '-inf', now)
+        pipe.zadd(REVOKED_SESSIONS_KEY, {str(session_id): expires_at})
+        pipe.expire(REVOKED_SESSIONS_KEY, access_token_lifetime())
+        await pipe.execute()
+    await redis.publish(SESSION_REVOKED_CHANNEL, f'{session_id} {expires_at}')
+
+
+async def run_replica_prune() -> None:
+    """Удаляет из копий истекшие записи: проход по всей копии - раз в интервал, а не на каждое сообщение"""
+    while True:
+        await asyncio.sleep(settings.REPLICA_PRUNE_INTERVAL)
+        logout_watermarks.prune()
+        session_revocations.prune()
+
+
+logout_watermarks = LogoutWatermarks(enabled=settings.LOGOUT_REPLICA_ENABLED)
+session_revocations = SessionRevocations(enabled=settings.LOGOUT_REPLICA_ENABLED)
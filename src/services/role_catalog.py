@@ -0,0 +1,136 @@
+import asyncio
+import hashlib
+from dataclasses import dataclass
+
+import orjson
+from redis.asyncio.client import Redis
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.core.cache import TTLCache
+from src.core.config import settings
+from src.db.redis_db import listen_channel
+from src.models.roles import Role
+from src.schemas.roles import RoleSchema
+
+
+CATALOG_CHANNEL = 'auth:roles_catalog'
+CATALOG_VERSION_KEY = 'roles:catalog_version'
+# Готовых страниц в памяти; параметры пагинации задает клиент, поэтому число ограничено
+PAGE_CACHE_SIZE = 256
+
+
+@dataclass(frozen=True, slots=True)
+class RolesPage:
+    body: bytes
+    etag: str
+
+    def matches(self, if_none_match: str | None) -> bool:
+        if not if_none_match:
+            return False
+        # Для If-None-Match сравнение слабое, поэтому префикс W/ не учитываем
+        tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+        return '*' in tags or self.etag in tags
+
+
+@dataclass(frozen=True, slots=True)
+class CatalogSnapshot:
+    version: int
+    roles: tuple[RoleSchema, ...]
+
+
+class RoleCatalog:
+    """Справочник ролей воркера с номером версии.
+
+    Версия хранится в Redis и увеличивается при каждом изменении ролей,
+    новые версии рассылаются через pub/sub. Пока подписки нет, справочник
+    каждый раз читается из Postgres.
+    """
+
+    def __init__(self, enabled: bool, ttl: float) -> None:
+        self.enabled = enabled
+        self.ttl = ttl
+        self.subscribed = False
+        self.generation = 0
+        self._snapshot: CatalogSnapshot | None = None
+        self._loaded_at = 0.0
+        self._pages = TTLCache(PAGE_CACHE_SIZE, ttl)
+        self._lock = asyncio.Lock()
+
+    @property
+    def active(self) -> bool:
+        return self.enabled and self.subscribed
+
+    def is_fresh(self) -> bool:
+        return (
+            self.active
+            and self._snapshot is not None
+            and asyncio.get_running_loop().time() - self._loaded_at < self.ttl
+        )
+
+    async def get_page(self, db: AsyncSession, redis: Redis, page_number: int, page_size: int) -> RolesPage:
+        snapshot = await self.get_snapshot(db, redis)
+        key = (snapshot.version, page_number, page_size)
+        page = self._pages.get(key)
+        if page is None:
+            start = (page_number - 1) * page_size
+            page = self.render_page(snapshot.roles[start:start + page_size])
+            if self.is_fresh():
+                self._pages.set(key, page)
+        return page
+
+    @staticmethod
+    def render_page(roles: tuple[RoleSchema, ...]) -> RolesPage:
+        body = orjson.dumps([role.model_dump(mode='json') for role in roles])
+        return RolesPage(body=body, etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+
+    async def get_snapshot(self, db: AsyncSession, redis: Redis) -> CatalogSnapshot:
+        if self.is_fresh():
+            return self._snapshot
+        if not self.active:
+            return await self.load(db, redis)
+        # Один запрос в воркере перечитывает справочник, остальные ждут его результат
+        async with self._lock:
+            if self.is_fresh():
+                return self._snapshot
+            generation = self.generation
+            snapshot = await self.load(db, redis)
+            if generation == self.generation:
+                self._snapshot = snapshot
+                self._loaded_at = asyncio.get_running_loop().time()
+            return snapshot
+
+    @staticmethod
+    async def load(db: AsyncSession, redis: Redis) -> CatalogSnapshot:
+        # Версию читаем до ролей: изменение между чтениями придет следующим сообщением
+        version = int(await redis.get(CATALOG_VERSION_KEY) or 0)
+        query = await db.execute(select(Role).order_by(Role.name, Role.id))
+        roles = tuple(RoleSchema(id=role.id, name=role.name) for role in query.scalars().all())
+        return CatalogSnapshot(version=version, roles=roles)
+
+    def invalidate(self, version: str | None = None) -> None:
+        if version is not None and self._snapshot is not None and int(version) == self._snapshot.version:
+            return
+        self.generation += 1
+        self._snapshot = None
+        self._pages.clear()
+
+    def on_subscription_change(self, subscribed: bool) -> None:
+        self.subscribed = subscribed
+        self.invalidate()
+
+    async def listen(self) -> None:
+        await listen_channel(CATALOG_CHANNEL, self.invalidate, self.on_subscription_change)
+
+
+async def bump_role_catalog_version(redis: Redis) -> None:
+    """Новая версия справочника ролей для всех воркеров"""
+    role_catalog.invalidate()
+    version = await redis.incr(CATALOG_VERSION_KEY)
+    await redis.publish(CATALOG_CHANNEL, version)
+
+
+role_catalog = RoleCatalog(
+    enabled=settings.ROLE_CATALOG_CACHE_ENABLED,
+    ttl=settings.ROLE_CATALOG_TTL
+)
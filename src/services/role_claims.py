@@ -0,0 +1,84 @@
+import time
+from typing import Iterable
+from uuid import UUID
+
+from redis.asyncio.client import Redis
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.core.cache import TTLCache
+from src.core.config import settings
+from src.models.roles import Role
+from src.models.users import UserRoles
+from src.services.revocation import access_token_lifetime
+
+
+# Меняется при переименовании и удалении ролей: имена в выданных токенах могли устареть
+ROLES_VERSION_KEY = 'roles:claims_version'
+USER_ROLES_VERSION_PREFIX = 'roles_version:'
+
+
+def user_roles_version_key(user_id: UUID) -> str:
+    return f'{USER_ROLES_VERSION_PREFIX}{user_id}'
+
+
+def format_version(roles_version: bytes | None, user_version: bytes | None) -> str:
+    """Значение claim rv из версий ролей и пользователя, прочитанных из Redis"""
+    return f'{int(roles_version or 0)}.{int(user_version or 0)}'
+
+
+class RoleVersions:
+    """Версии ролей пользователей (claim rv в access токене) с коротким кешем в памяти воркера.
+
+    Версия пользователя - время последнего изменения его ролей. Ключ живет столько же,
+    сколько access токен: когда он истекает, токенов с прежними ролями уже нет.
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.ttl = ttl
+        self._cache = TTLCache(maxsize, ttl)
+
+    async def get(self, redis: Redis, user_id: UUID) -> str:
+        version = self._cache.get(user_id) if self.ttl else None
+        if version is None:
+            version = await self.read(redis, user_id)
+        return version
+
+    async def read(self, redis: Redis, user_id: UUID) -> str:
+        roles_version, user_version = await redis.mget(ROLES_VERSION_KEY, user_roles_version_key(user_id))
+        version = format_version(roles_version, user_version)
+        if self.ttl:
+            self._cache.set(user_id, version)
+        return version
+
+    async def bump_user(self, redis: Redis, user_id: UUID) -> None:
+        await self.bump_users(redis, [user_id])
+
+    async def bump_users(self, redis: Redis, user_ids: Iterable[UUID]) -> None:
+        version = time.time_ns() // 1000
+        lifetime = access_token_lifetime()
+        async with redis.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                self._cache.pop(user_id)
+                pipe.set(user_roles_version_key(user_id), version, lifetime)
+            await pipe.execute()
+
+    async def bump_all(self, redis: Redis) -> None:
+        self._cache.clear()
+        await redis.incr(ROLES_VERSION_KEY)
+
+
+async def get_role_claims(db: AsyncSession, redis: Redis, user_id: UUID) -> dict:
+    """Claims ролей для access токена"""
+    # Версию читаем до ролей: изменение между ними даст несовпадение версий, а не устаревшие роли
+    version = await role_versions.read(redis, user_id)
+    query = await db.execute(
+        select(Role.name).join(UserRoles, UserRoles.c.role_id == Role.id).where(UserRoles.c.user_id == user_id)
+    )
+    return {'roles': sorted(query.scalars().all()), 'rv': version}
+
+
+role_versions = RoleVersions(
+    maxsize=settings.PRINCIPAL_CACHE_SIZE,
+    ttl=settings.ROLE_VERSION_CACHE_TTL
+)
@@ -1,87 +1,143 @@
-from functools import lru_cache
 from uuid import UUID
 
 from fastapi import Depends
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.engine.result import Result
 from fastapi.encoders import jsonable_encoder
+from sqlalchemy import text
 from sqlalchemy.exc import IntegrityError
 
-from src.db.postgres import get_session
-from src.core.exceptions import ROLE_NOT_FOUND, USER_DOES_NOT_HAVE_ROLE, ROLE_ALREADY_EXIST
+from src.core.exceptions import ROLE_NOT_FOUND, USER_DOES_NOT_HAVE_ROLE, ROLE_ALREADY_EXIST, ROLES_BULK_IS_INVALID
 from src.models.roles import Role
 from src.models.users import User
-from src.schemas.roles import RoleCreateForm, RoleAttachForm, RoleUpdateForm
+from src.schemas.roles import RoleCreateForm, RoleAttachForm, RoleUpdateForm, RoleBulkForm
 from src.schemas.validators import Paginator
-from src.services.common import BaseService
+from src.services.common import BaseService, ServiceContainer, get_services
+from src.services.principals import publish_principal_invalidation
+from src.services.role_catalog import RolesPage, role_catalog, bump_role_catalog_version
+from src.services.role_claims import role_versions
+
+
+# Пары передаются двумя массивами: один параметр на массив при любом размере пакета.
+# Несуществующие пользователи и роли пропускаются, уже выданные роли не дублируются
+ATTACH_ROLES = text("""
+INSERT INTO user_roles (user_id, role_id)
+SELECT pairs.user_id, pairs.role_id
+FROM unnest(CAST(:user_ids AS uuid[]), CAST(:role_ids AS uuid[])) AS pairs(user_id, role_id)
+WHERE EXISTS (SELECT 1 FROM users WHERE users.id = pairs.user_id AND users.deleted_at IS NULL)
+  AND EXISTS (SELECT 1 FROM roles WHERE roles.id = pairs.role_id)
+ON CONFLICT DO NOTHING
+RETURNING user_id
+""")
+
+DETACH_ROLES = text("""
+DELETE FROM user_roles
+USING unnest(CAST(:user_ids AS uuid[]), CAST(:role_ids AS uuid[])) AS pairs(user_id, role_id)
+WHERE user_roles.user_id = pairs.user_id AND user_roles.role_id = pairs.role_id
+RETURNING user_roles.user_id
+""")
+
+# Если ролей изменилось у большего числа пользователей, кеш сбрасывается целиком, а не по одному
+PRINCIPAL_INVALIDATION_LIMIT = 100
 
 
 class RolesService(BaseService):
 
-    async def get_roles(self, paginator: Paginator) -> list[Role]:
-        query = await self.get_roles_query(paginator.page_number, paginator.page_size)
-        roles = await self.get_roles_from_query(query)
-        return roles
+    async def get_roles(self, paginator: Paginator) -> RolesPage:
+        return await role_catalog.get_page(self.db, self.redis, paginator.page_number, paginator.page_size)
 
     async def get_user_roles(self, user_id: UUID) -> list[Role]:
         user = await self.db.get(User, user_id)
         return user.roles
 
-    @staticmethod
-    async def get_roles_from_query(query: Result) -> list[Role]:
-        roles = [role for role in query.scalars().all()]
-        return roles
-
-    async def get_roles_query(self, page_number: int, page_size: int) -> Result:
-        query = await self.db.execute(
-            select(Role)
-            .offset((page_number - 1) * page_size)
-            .limit(page_size)
-        )
-        return query
-
     async def create_role(self, role_create_form: RoleCreateForm) -> Role:
         role = Role(name=role_create_form.name)
         try:
             await self.update_model_object(role)
         except IntegrityError:
-            raise ROLE_ALREADY_EXIST
+            raise ROLE_ALREADY_EXIST()
+        await bump_role_catalog_version(self.redis)
         return role
 
     async def attach_role(self, role_attach_form: RoleAttachForm) -> None:
         user = await self.get_user_by_id(role_attach_form.user_id)
         role = await self.get_role_by_id(role_attach_form.role_id)
-        user.roles.append(role)
+        if role not in user.roles:
+            user.roles.append(role)
         await self.db.commit()
+        await role_versions.bump_user(self.redis, user.id)
+        await publish_principal_invalidation(self.redis, user.id)
 
     async def detach_role(self, role_attach_form: RoleAttachForm) -> None:
         user = await self.get_user_by_id(role_attach_form.user_id)
         role = await self.get_role_by_id(role_attach_form.role_id)
         self.remove_role_from_user(user, role)
         await self.db.commit()
+        await role_versions.bump_user(self.redis, user.id)
+        await publish_principal_invalidation(self.redis, user.id)
+
+    async def attach_roles(self, role_bulk_form: RoleBulkForm) -> int:
+        """Выдача ролей пакетом одним INSERT, возвращает число новых пар"""
+        return await self.change_roles(ATTACH_ROLES, role_bulk_form)
+
+    async def detach_roles(self, role_bulk_form: RoleBulkForm) -> int:
+        """Отзыв ролей пакетом одним DELETE, возвращает число удаленных пар"""
+        return await self.change_roles(DETACH_ROLES, role_bulk_form)
+
+    async def change_roles(self, statement, role_bulk_form: RoleBulkForm) -> int:
+        user_ids, role_ids = await self.get_bulk_pairs(role_bulk_form)
+        query = await self.db.execute(statement, {'user_ids': user_ids, 'role_ids': role_ids})
+        changed_user_ids = query.scalars().all()
+        await self.db.commit()
+        await self.on_user_roles_changed(set(changed_user_ids))
+        return len(changed_user_ids)
+
+    async def get_bulk_pairs(self, role_bulk_form: RoleBulkForm) -> tuple[list[UUID], list[UUID]]:
+        if role_bulk_form.memberships and not (role_bulk_form.role_id or role_bulk_form.user_ids):
+            return (
+                [membership.user_id for membership in role_bulk_form.memberships],
+                [membership.role_id for membership in role_bulk_form.memberships]
+            )
+        if role_bulk_form.role_id and role_bulk_form.user_ids and not role_bulk_form.memberships:
+            role = await self.get_role_by_id(role_bulk_form.role_id)
+            return role_bulk_form.user_ids, [role.id] * len(role_bulk_form.user_ids)
+        raise ROLES_BULK_IS_INVALID()
+
+    async def on_user_roles_changed(self, user_ids: set[UUID]) -> None:
+        if not user_ids:
+            return
+        await role_versions.bump_users(self.redis, user_ids)
+        if len(user_ids) > PRINCIPAL_INVALIDATION_LIMIT:
+            await publish_principal_invalidation(self.redis)
+            return
+        for user_id in user_ids:
+            await publish_principal_invalidation(self.redis, user_id)
 
     @staticmethod
     def remove_role_from_user(user: User, role: Role) -> None:
         try:
             user.roles.remove(role)
         except ValueError:
-            raise USER_DOES_NOT_HAVE_ROLE
+            raise USER_DOES_NOT_HAVE_ROLE()
 
     async def delete_role(self, role_id: UUID):
         role = await self.get_role_by_id(role_id)
         await self.db.delete(role)
         await self.db.commit()
+        await bump_role_catalog_version(self.redis)
+        await role_versions.bump_all(self.redis)
+        await publish_principal_invalidation(self.redis)
 
     async def update_role(self, role_id: UUID, role_update_form: RoleUpdateForm) -> Role:
         role = await self.get_role_by_id(role_id)
         await self.update_role_data(role, role_update_form)
+        await bump_role_catalog_version(self.redis)
+        await role_versions.bump_all(self.redis)
+        await publish_principal_invalidation(self.redis)
         return role
 
     async def get_role_by_id(self, role_id: UUID) -> Role:
         role: Role = await self.db.get(Role, role_id)
         if not role:
-            raise ROLE_NOT_FOUND
+            raise ROLE_NOT_FOUND()
         return role
 
     async def update_role_data(self, role: Role, role_update_form: RoleUpdateForm) -> None:
@@ -92,8 +148,5 @@ class RolesService(BaseService):
         await self.update_model_object(role)
 
 
-@lru_cache()
-def get_role_service(
-        db: AsyncSession = Depends(get_session)
-) -> RolesService:
-    return RolesService(db)
+def get_role_service(services: ServiceContainer = Depends(get_services)) -> RolesService:
+    return services.get(RolesService)
@@ -0,0 +1,48 @@
+from datetime import datetime
+from uuid import UUID
+
+from sqlalchemy import select, update, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.models.sessions import UserSession
+
+
+class SessionStore:
+    """Сессии пользователя по устройствам; refresh токены сессии - семейство с тем же id"""
+
+    def __init__(self, db: AsyncSession) -> None:
+        self.db = db
+
+    async def create(self, session_id: UUID, user_id: UUID, user_agent: str, expires_at: datetime) -> None:
+        self.db.add(UserSession(id=session_id, user_id=user_id, user_agent=user_agent[:200], expires_at=expires_at))
+        await self.db.commit()
+
+    async def touch(self, session_id: UUID, expires_at: datetime) -> None:
+        await self.db.execute(
+            update(UserSession)
+            .where(UserSession.id == session_id)
+            .values(last_seen_at=datetime.utcnow(), expires_at=expires_at)
+        )
+        await self.db.commit()
+
+    async def get_user_sessions(self, user_id: UUID) -> list[UserSession]:
+        query = await self.db.execute(
+            select(UserSession)
+            .where(UserSession.user_id == user_id, UserSession.expires_at > datetime.utcnow())
+            .order_by(UserSession.last_seen_at.desc())
+        )
+        return list(query.scalars().all())
+
+    async def delete(self, user_id: UUID, session_id: UUID) -> bool:
+        query = await self.db.execute(
+            delete(UserSession)
+            .where(UserSession.id == session_id, UserSession.user_id == user_id)
+            .returning(UserSession.id)
+        )
+        deleted = query.scalar() is not None
+        await self.db.commit()
+        return deleted
+
+    async def delete_user_sessions(self, user_id: UUID) -> None:
+        await self.db.execute(delete(UserSession).where(UserSession.user_id == user_id))
+        await self.db.commit()
@@ -1,85 +1,135 @@
+import time
 from datetime import timedelta, datetime
-from functools import lru_cache
-from uuid import UUID
+from uuid import UUID, uuid4
 
 from fastapi import Response, Request, Depends
 from async_fastapi_jwt_auth import AuthJWT
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.engine.result import Result
-from sqlalchemy import select, delete
+from sqlalchemy import select
 from redis.asyncio.client import Redis
+from opentelemetry import trace
 
 
 from src.models.users import User
 from src.models.history import LoginHistory
-from src.models.tokens import RefreshTokens
-from src.schemas.tokens import Tokens, AccessToken
-from src.db.postgres import get_session
-from src.db.redis_db import get_redis
-from src.core.exceptions import WRONG_PASSWORD, REFRESH_TOKEN_IS_INVALID, USER_NOT_FOUND, USER_NOT_AUTHORIZED
-from src.core.config import settings, auth_jwt_settings, oauth
-from src.services.common import BaseService
+from src.schemas.tokens import Tokens, AccessToken, SessionSchema
+from src.core.exceptions import WRONG_PASSWORD, REFRESH_TOKEN_IS_INVALID, USER_NOT_FOUND, SESSION_NOT_FOUND
+from src.core.config import settings
+from src.services.common import BaseService, ServiceContainer, get_services
+from src.services.hashing import password_hasher
+from src.services.users import schedule_password_rehash
+from src.services.principals import Principal
+from src.services.role_claims import get_role_claims
+from src.services.revocation import save_logout_time, save_session_revocation, issued_at_claims
+from src.services.refresh_tokens import create_refresh_token_store, RotationResult
+from src.services.history import login_history_writer
+from src.services.sessions import SessionStore
+
+
+tracer = trace.get_tracer(__name__)
 
 
 class TokenService(BaseService):
 
+    def __init__(
+            self, db: AsyncSession,
+            redis: Redis = None,
+            authorize: AuthJWT = None):
+        super().__init__(db, redis, authorize)
+        self.refresh_tokens = create_refresh_token_store(db, redis)
+        self.sessions = SessionStore(db)
+
     async def get_user_by_login(self, login: str) -> User:
-        sql_request = await self.db.execute(select(User).where(User.login == login))
+        sql_request = await self.db.execute(select(User).where(User.login == login, User.deleted_at.is_(None)))
         user: User = sql_request.scalar()
         if not user:
-            raise USER_NOT_FOUND
+            raise USER_NOT_FOUND()
         return user
 
     async def login(
             self, login: str, password: str, request: Request, response: Response
     ) -> Tokens:
         user = await self.get_user_by_login(login)
-        if not user.check_password(password):
-            raise WRONG_PASSWORD
-
-        tokens = await self.create_tokens(user.id)
-        await self.save_refresh_token(user.id, tokens.refresh_token)
+        # Пока идет хеширование, соединение не нужно - отдаем его другим запросам
+        await self.release_connection()
+        if not await user.check_password(password):
+            raise WRONG_PASSWORD()
+        if password_hasher.needs_rehash(user.password):
+            schedule_password_rehash(user, password)
+
+        tokens = await self.create_tokens(user.id, request.headers['user-agent'])
         await self.save_entry_information(user.id, request.headers['user-agent'])
         await self.set_tokens_to_cookie(response, tokens)
 
         return tokens
 
-    async def refresh(self, user: User, request: Request, response: Response):
-        refresh_token_cookie = request.cookies[auth_jwt_settings.authjwt_refresh_cookie_key]
-
-        if await self.is_refresh_token_exist(user.id, refresh_token_cookie):
-            access_token = await self.create_access_token(user.id)
-            await self.set_access_token_to_cookie(response, access_token.access_token)
-            return access_token
-
-        raise REFRESH_TOKEN_IS_INVALID
-
-    async def create_access_token(self, user_id: UUID) -> AccessToken:
-        access_token = await self.authorize.create_access_token(
-            subject=str(user_id),
-            expires_time=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE)
+    async def refresh(self, user: Principal, response: Response) -> Tokens:
+        """Обмен refresh токена на новую пару; старый refresh токен больше не принимается"""
+        refresh_token = await self.authorize.get_raw_jwt()
+        # Токены, выданные до появления сессий, обменять нельзя: нужен повторный вход
+        if 'sid' not in refresh_token:
+            await self.authorize.unset_jwt_cookies()
+            raise REFRESH_TOKEN_IS_INVALID()
+        session_id = UUID(refresh_token['sid'])
+        new_jti = uuid4()
+        expires_at = self.get_refresh_token_expire_time()
+        result = await self.refresh_tokens.rotate(user.id, UUID(refresh_token['jti']), new_jti, expires_at)
+        if result != RotationResult.ROTATED:
+            await self.authorize.unset_jwt_cookies()
+            raise REFRESH_TOKEN_IS_INVALID()
+
+        access_token = await self.create_access_token(user.id, session_id)
+        tokens = Tokens(
+            access_token=access_token.access_token,
+            refresh_token=await self.create_refresh_token(user.id, new_jti, session_id)
         )
+        await self.sessions.touch(session_id, expires_at)
+        await self.set_tokens_to_cookie(response, tokens)
+        return tokens
+
+    async def create_access_token(self, user_id: UUID, session_id: UUID) -> AccessToken:
+        # Роли в токене, чтобы проверять права без обращения к БД
+        role_claims = await get_role_claims(self.db, self.redis, user_id)
+        role_claims['sid'] = str(session_id)
+        role_claims.update(issued_at_claims())
+        with tracer.start_as_current_span('jwt.encode', attributes={'jwt.type': 'access'}):
+            access_token = await self.authorize.create_access_token(
+                subject=str(user_id),
+                expires_time=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE),
+                user_claims=role_claims
+            )
         return AccessToken(access_token=access_token)
 
-    async def create_tokens(self, user_id: UUID) -> Tokens:
-        access_token = await self.create_access_token(user_id)
-        refresh_token = await self.authorize.create_refresh_token(
-            subject=str(user_id),
-            expires_time=timedelta(minutes=settings.REFRESH_TOKEN_EXPIRE)
-        )
+    async def create_refresh_token(self, user_id: UUID, jti: UUID, session_id: UUID) -> str:
+        # jti задаем сами, чтобы сохранить его без повторного декодирования токена
+        with tracer.start_as_current_span('jwt.encode', attributes={'jwt.type': 'refresh'}):
+            return await self.authorize.create_refresh_token(
+                subject=str(user_id),
+                expires_time=timedelta(minutes=settings.REFRESH_TOKEN_EXPIRE),
+                user_claims={'jti': str(jti), 'sid': str(session_id), **issued_at_claims()}
+            )
+
+    @staticmethod
+    def get_refresh_token_expire_time() -> datetime:
+        return datetime.utcnow() + timedelta(minutes=settings.REFRESH_TOKEN_EXPIRE)
+
+    async def create_tokens(self, user_id: UUID, user_agent: str) -> Tokens:
+        """Новая сессия устройства; ее id - claim sid обоих токенов и семейство refresh токенов"""
+        session_id = uuid4()
+        expires_at = self.get_refresh_token_expire_time()
+        await self.sessions.create(session_id, user_id, user_agent, expires_at)
+        access_token = await self.create_access_token(user_id, session_id)
+        jti = uuid4()
+        refresh_token = await self.create_refresh_token(user_id, jti, session_id)
+        await self.refresh_tokens.add(user_id, jti, session_id, expires_at)
         return Tokens(
             access_token=access_token.access_token,
             refresh_token=refresh_token
         )
 
-    async def save_refresh_token(self, user_id: UUID, refresh_token: str) -> None:
-        refresh_token_entry = RefreshTokens(
-            user_id=user_id,
-            refresh_token=refresh_token
-        )
-        await self.update_model_object(refresh_token_entry)
-
     async def save_entry_information(self, user_id: UUID, user_agent: str) -> None:
+        if await login_history_writer.append(self.redis, user_id, user_agent):
+            return
         login_history = LoginHistory(
             user_id=user_id,
             user_agent=user_agent
@@ -88,47 +138,50 @@ class TokenService(BaseService):
 
     @staticmethod
     async def set_access_token_to_cookie(response: Response, access_token: str) -> None:
+        # Сроки токенов заданы в минутах, а max_age и expires cookie - в секундах
         response.set_cookie('access_token', access_token,
-                            settings.ACCESS_TOKEN_EXPIRE,
-                            settings.ACCESS_TOKEN_EXPIRE,
+                            settings.ACCESS_TOKEN_EXPIRE * 60,
+                            settings.ACCESS_TOKEN_EXPIRE * 60,
                             '/', None, False, True, 'lax')
 
     async def set_tokens_to_cookie(self, response: Response, tokens: Tokens) -> None:
         await self.set_access_token_to_cookie(response, tokens.access_token)
         response.set_cookie('refresh_token', tokens.refresh_token,
-                            settings.REFRESH_TOKEN_EXPIRE,
-                            settings.REFRESH_TOKEN_EXPIRE,
+                            settings.REFRESH_TOKEN_EXPIRE * 60,
+                            settings.REFRESH_TOKEN_EXPIRE * 60,
                             '/', None, False, True, 'lax')
 
-    async def get_refresh_token_query(self, user_id: UUID, refresh_token: str) -> Result:
-        query = await self.db.execute(
-            select(RefreshTokens).where(
-                RefreshTokens.user_id == user_id
-            ).filter(RefreshTokens.refresh_token == refresh_token))
-        return query
-
-    async def is_refresh_token_exist(self, user_id: UUID, refresh_token: str) -> bool:
-        query = await self.get_refresh_token_query(user_id, refresh_token)
-        refresh_token = query.scalar()
-        return True if refresh_token else False
-
-    async def delete_refresh_token_by_user_id(self, user_id: UUID):
-        await self.db.execute(delete(RefreshTokens).where(RefreshTokens.user_id == user_id))
-        await self.db.commit()
-
     async def logout(self, user_id: UUID) -> None:
-        await self.delete_refresh_token_by_user_id(user_id)
-        await self.redis.set(
-            str(user_id),
-            str(datetime.utcnow().timestamp()),
-            settings.ACCESS_TOKEN_EXPIRE)
+        await self.refresh_tokens.revoke_user(user_id)
+        await self.sessions.delete_user_sessions(user_id)
+        await save_logout_time(self.redis, user_id, time.time())
         await self.authorize.unset_jwt_cookies()
 
-
-@lru_cache()
-def get_token_service(
-        db: AsyncSession = Depends(get_session),
-        redis: Redis = Depends(get_redis),
-        authorize: AuthJWT = Depends()
-) -> TokenService:
-    return TokenService(db, redis, authorize)
+    async def logout_session(self, user_id: UUID, session_id: UUID | None) -> None:
+        """Выход на одном устройстве: refresh токены сессии удаляются, access токены отзываются по sid"""
+        if session_id is None or not await self.sessions.delete(user_id, session_id):
+            raise SESSION_NOT_FOUND()
+        await self.refresh_tokens.revoke_family(user_id, session_id)
+        await save_session_revocation(self.redis, session_id)
+
+    async def get_current_session_id(self) -> UUID | None:
+        token = await self.authorize.get_raw_jwt()
+        return UUID(token['sid']) if 'sid' in token else None
+
+    async def get_sessions(self, user_id: UUID) -> list[SessionSchema]:
+        current_session_id = await self.get_current_session_id()
+        return [
+            SessionSchema(
+                id=session.id,
+                user_agent=session.user_agent,
+                created_at=session.created_at,
+                last_seen_at=session.last_seen_at,
+                expires_at=session.expires_at,
+                current=session.id == current_session_id
+            )
+            for session in await self.sessions.get_user_sessions(user_id)
+        ]
+
+
+def get_token_service(services: ServiceContainer = Depends(get_services)) -> TokenService:
+    return services.get(TokenService)
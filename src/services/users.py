@@ -1,26 +1,64 @@
-from functools import lru_cache
+import asyncio
+import logging
+from datetime import datetime, timedelta
 from uuid import UUID
 
+import orjson
 from fastapi import Depends
 from fastapi.encoders import jsonable_encoder
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, delete, tuple_, text, or_
 from sqlalchemy.engine.result import Result
 from sqlalchemy.exc import IntegrityError
-from werkzeug.security import generate_password_hash
+from sqlalchemy.orm.exc import StaleDataError
 
-from src.schemas.users import UserCreateForm, ChangePasswordForm, FullUserSchema
-from src.schemas.histories import LoginHistorySchema
-from src.schemas.validators import Paginator
+from src.schemas.users import UserCreateForm, ChangePasswordForm
+from src.schemas.histories import HistoryCursor, HistoryPaginator
 
 from src.models.users import User
 from src.models.roles import Role
 from src.models.history import LoginHistory
+from src.models.identities import FederatedIdentity
 
-from src.core.exceptions import USER_ALREADY_EXIST, WRONG_PASSWORD
-from src.core.config import admin_settings
-from src.db.postgres import get_session, async_session
-from src.services.common import BaseService
+from src.core.exceptions import USER_ALREADY_EXIST, USER_NOT_FOUND, WRONG_PASSWORD, USER_CHANGED_CONCURRENTLY
+from src.core.cache import TTLCache
+from src.core.config import settings, admin_settings
+from src.db.postgres import async_session
+from src.services.common import BaseService, ServiceContainer, get_services
+from src.services.hashing import password_hasher
+from src.services.principals import Principal, publish_principal_invalidation
+from src.services.role_claims import role_versions
+
+
+logger = logging.getLogger(__name__)
+
+PROVISION_FEDERATED_USER = text("""
+WITH identity AS (
+    UPDATE federated_identities
+    SET email = :email, last_login_at = timezone('utc', now())
+    WHERE provider = :provider AND subject = :subject
+    RETURNING user_id
+), new_user AS (
+    INSERT INTO users (id, login, password, first_name, last_name, created_at)
+    SELECT gen_random_uuid(), :email, NULL, :first_name, :last_name, timezone('utc', now())
+    WHERE NOT EXISTS (SELECT 1 FROM identity)
+    ON CONFLICT (login) DO UPDATE SET login = EXCLUDED.login WHERE users.deleted_at IS NULL
+    RETURNING id
+), new_identity AS (
+    INSERT INTO federated_identities (provider, subject, user_id, email, created_at, last_login_at)
+    SELECT :provider, :subject, id, :email, timezone('utc', now()), timezone('utc', now()) FROM new_user
+    ON CONFLICT (provider, subject) DO UPDATE SET last_login_at = EXCLUDED.last_login_at
+    RETURNING user_id
+)
+SELECT user_id FROM identity
+UNION ALL
+SELECT user_id FROM new_identity
+""")
+
+# Записи кеша тел /users/me не устаревают (ключ включает версию строки), TTL только освобождает память
+USER_INFO_CACHE_TTL = 600.0
+
+# Ссылки на фоновые задачи, чтобы их не собрал сборщик мусора до завершения
+_rehash_tasks: set[asyncio.Task] = set()
 
 
 async def create_admin():
@@ -28,10 +66,10 @@ async def create_admin():
         db = async_session()
         admin = User(
             login=admin_settings.ADMIN_LOGIN,
-            password=admin_settings.ADMIN_PASSWORD,
             first_name=admin_settings.ADMIN_FIRST_NAME,
             last_name=admin_settings.ADMIN_LAST_NAME
         )
+        await admin.set_password(admin_settings.ADMIN_PASSWORD)
         role = Role(name=admin_settings.ADMIN_ROLE_NAME)
         admin.roles.append(role)
         db.add(admin)
@@ -41,77 +79,248 @@ async def create_admin():
         pass
 
 
+async def rehash_user_password(user_id: UUID, old_password_hash: str, password: str) -> None:
+    """Перехеширование пароля с текущими параметрами, если его не сменили параллельно"""
+    new_password_hash = await password_hasher.hash(password)
+    async with async_session() as db:
+        await db.execute(
+            update(User)
+            .where(User.id == user_id, User.password == old_password_hash)
+            .values(password=new_password_hash)
+        )
+        await db.commit()
+
+
+def schedule_password_rehash(user: User, password: str) -> None:
+    user_id, old_password_hash = user.id, user.password
+
+    async def rehash() -> None:
+        try:
+            await rehash_user_password(user_id, old_password_hash, password)
+        except Exception:
+            # Не страшно: попробуем снова при следующем входе
+            logger.exception('Password rehash failed for user %s', user_id)
+
+    task = asyncio.create_task(rehash())
+    _rehash_tasks.add(task)
+    task.add_done_callback(_rehash_tasks.discard)
+
+
+def encode_user_info(user: User, is_admin: bool) -> bytes:
+    """Тело FullUserSchema прямо из атрибутов модели, без jsonable_encoder и повторной валидации"""
+    return orjson.dumps({
+        'id': str(user.id),
+        'login': user.login,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'created_at': user.created_at,
+        'is_admin': is_admin
+    })
+
+
+def encode_login_history(login_records: list[LoginHistory]) -> bytes:
+    """Тело list[LoginHistorySchema]"""
+    return orjson.dumps([
+        {'user_agent': login_record.user_agent, 'created_at': login_record.created_at}
+        for login_record in login_records
+    ])
+
+
+user_info_cache = TTLCache(settings.USER_INFO_CACHE_SIZE, USER_INFO_CACHE_TTL)
+
+
 class UserService(BaseService):
 
-    async def create_user(self, user_create_form: UserCreateForm) -> User:
+    async def create_user(self, user_create_form: UserCreateForm) -> bytes:
         try:
             # DTO - data transfer object
             user_dto = jsonable_encoder(user_create_form)
+            password = user_dto.pop('password')
             user = User(**user_dto)
+            await user.set_password(password)
             await self.update_model_object(user)
-            return user
         except IntegrityError:
-            raise USER_ALREADY_EXIST
+            raise USER_ALREADY_EXIST()
+        return encode_user_info(user, is_admin=False)
 
     async def change_user_password(
             self, user: User, change_password_form: ChangePasswordForm
     ) -> None:
-        if not user.check_password(change_password_form.previous_password):
-            raise WRONG_PASSWORD
-        user.password = generate_password_hash(change_password_form.new_password)
-        await self.update_model_object(user)
+        await self.release_connection()
+        if not await user.check_password(change_password_form.previous_password):
+            raise WRONG_PASSWORD()
+        await user.set_password(change_password_form.new_password)
+        try:
+            # UPDATE ... WHERE version: пока считался хеш, строку мог изменить другой запрос
+            await self.update_model_object(user)
+        except StaleDataError:
+            raise USER_CHANGED_CONCURRENTLY()
 
     async def get_login_history_query(
-            self, user_id: UUID, page_number: int, page_size: int
+            self, user_id: UUID, page_number: int, page_size: int, cursor: HistoryCursor | None = None
     ) -> Result:
-        query = await self.db.execute(
+        query = (
             select(LoginHistory)
             .where(LoginHistory.user_id == user_id)
-            .order_by(LoginHistory.created_at.desc())
-            .offset((page_number - 1) * page_size)
+            .order_by(LoginHistory.created_at.desc(), LoginHistory.id.desc())
             .limit(page_size)
         )
-        return query
+        if cursor:
+            # Keyset: продолжаем с места прошлой страницы по индексу (user_id, created_at, id)
+            query = query.where(
+                tuple_(LoginHistory.created_at, LoginHistory.id) < tuple_(cursor.created_at, cursor.id)
+            )
+        else:
+            query = query.offset((page_number - 1) * page_size)
+        return await self.db.execute(query)
 
     @staticmethod
-    def get_login_records_from_query(query: Result) -> list[LoginHistorySchema]:
+    def get_login_records_from_query(query: Result) -> list[LoginHistory]:
         login_records = [login_record for login_record in query.scalars().all()]
         return login_records
 
-    async def get_user_history(self, user: User, paginator: Paginator) -> list[LoginHistorySchema]:
-        query = await self.get_login_history_query(user.id, paginator.page_number, paginator.page_size)
+    async def get_user_history(self, user: Principal, paginator: HistoryPaginator) -> list[LoginHistory]:
+        cursor = HistoryCursor.decode(paginator.cursor) if paginator.cursor else None
+        query = await self.get_login_history_query(
+            user.id, paginator.page_number, paginator.page_size, cursor
+        )
         login_records = self.get_login_records_from_query(query)
         return login_records
 
     @staticmethod
-    async def get_user_info(user: User) -> FullUserSchema:
-        # DTO - data transfer object
-        user_dto = jsonable_encoder(user)
-        user_dto['is_admin'] = user.is_admin()
-        return FullUserSchema(**user_dto)
-
-    async def get_or_create_user(self, user_info: dict) -> User:
-        user_data = {
-            'login': user_info['email'],
-            'password': User.generate_strong_password(16),
-            'first_name': user_info['given_name'],
-            'last_name': user_info['family_name']
-        }
-        sql_request = await self.db.execute(select(User).where(User.login == user_data['login']))
-        user: User = sql_request.scalar()
-        if not user:
-            user = User(**user_data)
-            await self.update_model_object(user)
-        return user
+    def get_next_history_cursor(login_records: list[LoginHistory], page_size: int) -> str | None:
+        if len(login_records) < page_size:
+            return None
+        last_record = login_records[-1]
+        return HistoryCursor(created_at=last_record.created_at, id=last_record.id).encode()
+
+    @staticmethod
+    def get_user_info(user: User) -> bytes:
+        is_admin = user.is_admin()
+        key = (user.id, user.version, is_admin)
+        body = user_info_cache.get(key)
+        if body is None:
+            body = encode_user_info(user, is_admin)
+            user_info_cache.set(key, body)
+        return body
+
+    async def provision_federated_user(self, provider: str, user_info: dict) -> UUID:
+        """Пользователь по учетной записи у провайдера, новый создается без пароля.
+
+        Один запрос без гонки между параллельными callback-ами: существующая учетная
+        запись только отмечает вход, иначе пользователь находится по логину или
+        создается, и к нему привязывается учетная запись провайдера.
+        """
+        query = await self.db.execute(PROVISION_FEDERATED_USER, {
+            'provider': provider,
+            'subject': str(user_info['sub']),
+            'email': user_info['email'],
+            'first_name': user_info.get('given_name'),
+            'last_name': user_info.get('family_name')
+        })
+        user_id = query.scalar_one_or_none()
+        await self.db.commit()
+        # Логин занят удаленным пользователем, которого еще не очистили
+        if user_id is None:
+            raise USER_NOT_FOUND()
+        return user_id
 
     async def delete_user(self, user_id: UUID) -> None:
-        user = await self.get_user_by_id(user_id)
-        await self.db.delete(user)
+        """Пометка пользователя удаленным; историю и токены чистит run_deleted_user_purge"""
+        query = await self.db.execute(
+            update(User)
+            .where(User.id == user_id, User.deleted_at.is_(None))
+            .values(deleted_at=datetime.utcnow())
+            .returning(User.id)
+        )
+        if query.scalar() is None:
+            raise USER_NOT_FOUND()
+        # Вход через провайдера не должен вернуть удаленного пользователя
+        await self.db.execute(delete(FederatedIdentity).where(FederatedIdentity.user_id == user_id))
         await self.db.commit()
+        # Токены удаленного пользователя больше не проходят по claims и упираются в БД
+        await role_versions.bump_user(self.redis, user_id)
+        await publish_principal_invalidation(self.redis, user_id)
+
+
+def get_user_service(services: ServiceContainer = Depends(get_services)) -> UserService:
+    return services.get(UserService)
+
+
+# Строки удаляются пачками в отдельных транзакциях: ни память, ни длительность
+# блокировок не зависят от размера истории пользователя
+PURGE_LOGIN_HISTORY = text("""
+DELETE FROM login_history
+WHERE (id, created_at) IN (
+    SELECT id, created_at FROM login_history WHERE user_id = :user_id LIMIT :batch_size
+)
+""")
 
+PURGE_REFRESH_TOKENS = text("""
+DELETE FROM refresh_tokens
+WHERE id IN (SELECT id FROM refresh_tokens WHERE user_id = :user_id LIMIT :batch_size)
+""")
 
-@lru_cache()
-def get_user_service(
-        db: AsyncSession = Depends(get_session)
-) -> UserService:
-    return UserService(db)
+
+async def purge_deleted_user(user_id: UUID) -> None:
+    async with async_session() as db:
+        for statement in (PURGE_LOGIN_HISTORY, PURGE_REFRESH_TOKENS):
+            while True:
+                result = await db.execute(statement, {'user_id': user_id, 'batch_size': settings.USER_PURGE_BATCH_SIZE})
+                await db.commit()
+                if result.rowcount < settings.USER_PURGE_BATCH_SIZE:
+                    break
+
+
+async def claim_deleted_user() -> UUID | None:
+    """Отметка purging_at в короткой транзакции: блокировка строки на все время очистки
+    заставляла бы вставки истории этого пользователя ждать ее на внешнем ключе"""
+    now = datetime.utcnow()
+    stale_claim = now - timedelta(seconds=settings.USER_PURGE_CLAIM_TIMEOUT)
+    candidate = (
+        select(User.id)
+        .where(User.deleted_at.is_not(None), or_(User.purging_at.is_(None), User.purging_at < stale_claim))
+        .order_by(User.deleted_at)
+        .limit(1)
+        # FOR NO KEY UPDATE не конфликтует с KEY SHARE от вставок по внешнему ключу
+        .with_for_update(skip_locked=True, key_share=True)
+        .scalar_subquery()
+    )
+    async with async_session() as db:
+        query = await db.execute(
+            update(User)
+            .where(User.id == candidate)
+            .values(purging_at=now)
+            .returning(User.id)
+            .execution_options(synchronize_session=False)
+        )
+        user_id = query.scalar()
+        await db.commit()
+    return user_id
+
+
+async def purge_deleted_users() -> int:
+    """Очищает удаленных пользователей по одному, возвращает их число.
+
+    Воркеры разбирают разных пользователей по отметке purging_at. Оставшиеся
+    связи удаляет ON DELETE CASCADE вместе со строкой пользователя.
+    """
+    purged = 0
+    while True:
+        user_id = await claim_deleted_user()
+        if user_id is None:
+            return purged
+        await purge_deleted_user(user_id)
+        async with async_session() as db:
+            await db.execute(delete(User).where(User.id == user_id))
+            await db.commit()
+        purged += 1
+
+
+async def run_deleted_user_purge() -> None:
+    while True:
+        try:
+            await purge_deleted_users()
+        except Exception:
+            logger.warning('Failed to purge deleted users', exc_info=True)
+        await asyncio.sleep(settings.USER_PURGE_INTERVAL)
@@ -3,6 +3,7 @@ sys.path[0] = '/app'
 
 import pytest
 import asyncio
+from uuid import uuid4
 from sqlalchemy import select, delete
 
 from src.main import app
@@ -40,5 +41,7 @@ async def clear_data():
 
 @pytest.fixture()
 async def test_client():
-    async with AsyncClient(app=app, base_url="http://localhost/api/v1") as ac:
+    async with AsyncClient(
+            app=app, base_url="http://localhost/api/v1", headers={"X-Request-Id": str(uuid4())}
+    ) as ac:
         yield ac
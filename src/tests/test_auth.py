@@ -2,9 +2,14 @@ import sys
 import json
 sys.path[0] = '/app'
 
+import jwt
 import pytest
+from cryptography.hazmat.primitives import serialization
 
-from src.core.config import admin_settings
+from src.core.config import admin_settings, settings
+from src.core.signing import key_ring
+from src.generate_signing_key import generate_private_key
+from src.services.revocation import logout_watermarks, session_revocations
 
 
 @pytest.mark.asyncio
@@ -67,3 +72,186 @@ async def test_logout(test_client):
         headers={"Accept": "application/json", **cookies}
     )
     assert refresh_response.status_code == 204
+
+
+@pytest.mark.asyncio
+async def test_refresh_token_reuse(test_client):
+    tokens_response = await test_client.post(
+        "/auth/login",
+        json={
+            'login': admin_settings.ADMIN_LOGIN,
+            'password': admin_settings.ADMIN_PASSWORD
+        }
+    )
+    content = json.loads(tokens_response.content.decode('utf-8'))
+    cookies = {"refresh_token": content["refresh_token"]}
+    refresh_response = await test_client.post("/auth/refresh", cookies=cookies)
+    assert refresh_response.status_code == 200
+    reuse_response = await test_client.post("/auth/refresh", cookies=cookies)
+    assert reuse_response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_login_without_request_id(test_client):
+    del test_client.headers["X-Request-Id"]
+    response = await test_client.post(
+        "/auth/login",
+        json={
+            'login': admin_settings.ADMIN_LOGIN,
+            'password': admin_settings.ADMIN_PASSWORD
+        }
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_logout_session(test_client):
+    access_tokens = []
+    for _ in range(2):
+        tokens_response = await test_client.post(
+            "/auth/login",
+            json={
+                'login': admin_settings.ADMIN_LOGIN,
+                'password': admin_settings.ADMIN_PASSWORD
+            }
+        )
+        access_tokens.append(json.loads(tokens_response.content.decode('utf-8'))["access_token"])
+    # Токен берется из заголовка, а не из cookie последнего входа
+    test_client.cookies.clear()
+    sessions_response = await test_client.get("/auth/sessions", headers={"Authorization": f"Bearer {access_tokens[0]}"})
+    assert sum(session['current'] for session in sessions_response.json()) == 1
+
+    logout_response = await test_client.get("/auth/logout/session", headers={"Authorization": f"Bearer {access_tokens[0]}"})
+    assert logout_response.status_code == 204
+    revoked_response = await test_client.get("/auth/sessions", headers={"Authorization": f"Bearer {access_tokens[0]}"})
+    assert revoked_response.status_code == 400
+    other_device_response = await test_client.get("/auth/sessions", headers={"Authorization": f"Bearer {access_tokens[1]}"})
+    assert other_device_response.status_code == 200
+
+
+@pytest.fixture()
+def signing_keys(tmp_path, monkeypatch):
+    pem = generate_private_key('EdDSA').private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption()
+    )
+    (tmp_path / 'test-key.pem').write_bytes(pem)
+    for attribute in ('path', '_keys', 'jwks', 'etag'):
+        monkeypatch.setattr(key_ring, attribute, getattr(key_ring, attribute))
+    key_ring.path = str(tmp_path)
+    key_ring.load()
+
+
+@pytest.mark.asyncio
+async def test_access_token_verified_by_jwks(test_client, signing_keys):
+    tokens_response = await test_client.post(
+        "/auth/login",
+        json={
+            'login': admin_settings.ADMIN_LOGIN,
+            'password': admin_settings.ADMIN_PASSWORD
+        }
+    )
+    access_token = json.loads(tokens_response.content.decode('utf-8'))["access_token"]
+    assert jwt.get_unverified_header(access_token)['kid'] == 'test-key'
+
+    jwks_response = await test_client.get(
+        "http://localhost/.well-known/jwks.json", headers={"X-Request-Id": ""}
+    )
+    assert jwks_response.status_code == 200
+    jwk_set = jwt.PyJWKSet.from_dict(jwks_response.json())
+    claims = jwt.decode(access_token, jwk_set['test-key'].key, algorithms=['EdDSA'])
+    assert claims['type'] == 'access'
+
+    me_response = await test_client.get("/users/me", headers={"Authorization": f"Bearer {access_token}"})
+    assert me_response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_introspect_requires_gateway_token(test_client, monkeypatch):
+    monkeypatch.setattr(settings, 'INTROSPECT_GATEWAY_TOKENS', ['gateway-secret'])
+    response = await test_client.post("/auth/introspect", json={'tokens': ['not-a-token']})
+    assert response.status_code == 401
+    response = await test_client.post(
+        "/auth/introspect", json={'tokens': ['not-a-token']}, headers={"X-Gateway-Token": "wrong"}
+    )
+    assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_introspect(test_client, monkeypatch):
+    monkeypatch.setattr(settings, 'INTROSPECT_GATEWAY_TOKENS', ['gateway-secret'])
+    test_client.headers["X-Gateway-Token"] = 'gateway-secret'
+    tokens = []
+    for _ in range(2):
+        tokens_response = await test_client.post(
+            "/auth/login",
+            json={
+                'login': admin_settings.ADMIN_LOGIN,
+                'password': admin_settings.ADMIN_PASSWORD
+            }
+        )
+        tokens.append(json.loads(tokens_response.content.decode('utf-8')))
+    test_client.cookies.clear()
+    first_token, second_token = tokens[0]["access_token"], tokens[1]["access_token"]
+
+    introspect_response = await test_client.post(
+        "/auth/introspect",
+        json={'tokens': [first_token, 'not-a-token', tokens[0]["refresh_token"], second_token, first_token]}
+    )
+    assert introspect_response.status_code == 200
+    results = introspect_response.json()
+    assert [result['active'] for result in results] == [True, False, False, True, True]
+    assert admin_settings.ADMIN_ROLE_NAME in results[0]['roles']
+    assert results[0]['sid'] != results[3]['sid']
+
+    await test_client.get("/auth/logout/session", headers={"Authorization": f"Bearer {first_token}"})
+    introspect_response = await test_client.post("/auth/introspect", json={'tokens': [first_token, second_token]})
+    assert [result['active'] for result in introspect_response.json()] == [False, True]
+
+
+@pytest.mark.asyncio
+async def test_verify(test_client):
+    tokens_response = await test_client.post(
+        "/auth/login",
+        json={
+            'login': admin_settings.ADMIN_LOGIN,
+            'password': admin_settings.ADMIN_PASSWORD
+        }
+    )
+    tokens = json.loads(tokens_response.content.decode('utf-8'))
+    test_client.cookies.clear()
+
+    verify_response = await test_client.get("/auth/verify", headers={"Authorization": f"Bearer {tokens['access_token']}"})
+    assert verify_response.status_code == 200
+    assert verify_response.content == b''
+    assert admin_settings.ADMIN_ROLE_NAME in verify_response.headers['X-User-Roles'].split(',')
+
+    for headers in ({}, {"Authorization": f"Bearer {tokens['refresh_token']}"}, {"Authorization": "Bearer not-a-token"}):
+        assert (await test_client.get("/auth/verify", headers=headers)).status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_logout_updates_local_replicas(test_client, monkeypatch):
+    # Копии синхронизированы, а канала в тестах нет: отзыв должен дойти до них без pub/sub
+    for replica in (logout_watermarks, session_revocations):
+        monkeypatch.setattr(replica, 'enabled', True)
+        monkeypatch.setattr(replica, 'synced', True)
+
+    async def login() -> str:
+        tokens_response = await test_client.post(
+            "/auth/login",
+            json={'login': admin_settings.ADMIN_LOGIN, 'password': admin_settings.ADMIN_PASSWORD}
+        )
+        test_client.cookies.clear()
+        return json.loads(tokens_response.content.decode('utf-8'))['access_token']
+
+    session_token = await login()
+    headers = {"Authorization": f"Bearer {session_token}"}
+    assert (await test_client.get("/auth/logout/session", headers=headers)).status_code == 204
+    assert (await test_client.get("/auth/verify", headers=headers)).status_code == 401
+
+    access_token = await login()
+    headers = {"Authorization": f"Bearer {access_token}"}
+    assert (await test_client.get("/auth/logout", headers=headers)).status_code == 204
+    assert (await test_client.get("/auth/verify", headers=headers)).status_code == 401
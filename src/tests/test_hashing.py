@@ -0,0 +1,38 @@
+import sys
+sys.path[0] = '/app'
+
+import asyncio
+
+import pytest
+
+from src.core.exceptions import CustomException, ErrorMessagesUtil
+from src.services.hashing import PasswordHasher
+
+
+@pytest.fixture()
+def hasher():
+    # Один процесс и одно место в очереди; spawn процесса дольше любого таймаута ниже
+    hasher = PasswordHasher(method='pbkdf2:sha256:1000', workers=1, queue_size=1, timeout=5.0)
+    yield hasher
+    hasher.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_hasher_rejects_when_queue_is_full(hasher):
+    first = asyncio.create_task(hasher.hash('password'))
+    await asyncio.sleep(0)
+    with pytest.raises(CustomException) as error:
+        await hasher.hash('password')
+    assert error.value.message == ErrorMessagesUtil.password_hasher_overloaded()
+    assert await hasher.verify(await first, 'password')
+
+
+@pytest.mark.asyncio
+async def test_hasher_times_out(hasher):
+    hasher.timeout = 0.001
+    with pytest.raises(CustomException) as error:
+        await hasher.hash('password')
+    assert error.value.message == ErrorMessagesUtil.password_hashing_timeout()
+    # Место в очереди освобождается и после таймаута
+    hasher.timeout = 30.0
+    assert await hasher.hash('password')
@@ -0,0 +1,48 @@
+import sys
+sys.path[0] = '/app'
+
+import time
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import select, delete
+
+from src.core.config import admin_settings
+from src.db.postgres import async_session
+from src.db.redis_db import redis
+from src.models.history import LoginHistory
+from src.models.users import User
+from src.services.history import LoginHistoryWriter, HISTORY_STREAM, HISTORY_GROUP
+
+
+@pytest.mark.asyncio
+async def test_history_writer_skips_rows_that_cannot_be_written():
+    writer = LoginHistoryWriter(enabled=True, batch_size=10, flush_interval=0.1, max_backlog=100)
+    user_agent = f'history-test-{uuid4()}'
+    async with async_session() as db:
+        user_id = (await db.execute(select(User.id).where(User.login == admin_settings.ADMIN_LOGIN))).scalar_one()
+
+    await redis.delete(HISTORY_STREAM)
+    await writer.ensure_group()
+    for fields in (
+        {'user_id': str(user_id), 'user_agent': user_agent},
+        # Удаленный пользователь и строка, которую отвергнет Postgres
+        {'user_id': str(uuid4()), 'user_agent': user_agent},
+        {'user_id': str(user_id), 'user_agent': f'{user_agent}\x00'},
+    ):
+        await redis.xadd(HISTORY_STREAM, {**fields, 'created_at': repr(time.time())})
+    response = await redis.xreadgroup(HISTORY_GROUP, writer.consumer, {HISTORY_STREAM: '>'}, count=10)
+
+    try:
+        await writer.flush(response[0][1])
+        async with async_session() as db:
+            query = await db.execute(select(LoginHistory.user_id).where(LoginHistory.user_agent == user_agent))
+            assert query.scalars().all() == [user_id]
+        # Непроходящие записи подтверждены и не заблокируют поток
+        assert await redis.xlen(HISTORY_STREAM) == 0
+        assert (await redis.xpending(HISTORY_STREAM, HISTORY_GROUP))['pending'] == 0
+    finally:
+        async with async_session() as db:
+            await db.execute(delete(LoginHistory).where(LoginHistory.user_agent == user_agent))
+            await db.commit()
+        await redis.delete(HISTORY_STREAM)
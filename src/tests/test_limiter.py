@@ -0,0 +1,40 @@
+import sys
+from ipaddress import ip_network
+sys.path[0] = '/app'
+
+import pytest
+from fastapi import Request
+
+from src import limiter as limiter_module
+from src.core.config import settings
+from src.limiter import get_client_ip, limiter
+
+
+def make_request(client_host: str) -> Request:
+    return Request({
+        'type': 'http', 'method': 'GET', 'path': '/', 'query_string': b'',
+        'headers': [(b'x-real-ip', b'203.0.113.7')], 'client': (client_host, 50000)
+    })
+
+
+@pytest.fixture()
+def trusted_nginx(monkeypatch):
+    monkeypatch.setattr(settings, 'RATE_LIMIT_TRUST_PROXY_HEADERS', True)
+    monkeypatch.setattr(limiter_module, 'trusted_proxies', [ip_network('172.16.0.0/12')])
+
+
+def test_proxy_headers_from_trusted_proxy(trusted_nginx):
+    assert get_client_ip(make_request('172.18.0.5')) == '203.0.113.7'
+
+
+def test_proxy_headers_from_client_ignored(trusted_nginx):
+    # Клиент напрямую к uvicorn не может выбрать себе ведро заголовком
+    assert get_client_ip(make_request('198.51.100.1')) == '198.51.100.1'
+
+
+def test_limit_requires_request_parameter():
+    async def endpoint(user=None):
+        pass
+
+    with pytest.raises(TypeError):
+        limiter.limit('20/minute', per_user=True)(endpoint)
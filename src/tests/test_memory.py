@@ -0,0 +1,39 @@
+import gc
+import sys
+import tracemalloc
+sys.path[0] = '/app'
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.limiter import limiter
+
+
+WARMUP_REQUESTS = 200
+SOAK_REQUESTS = 3000
+# Допустимый рост памяти за прогон: кеши уже прогреты, остается только шум аллокатора
+ALLOWED_GROWTH = 512 * 1024
+
+
+@pytest.mark.asyncio
+async def test_requests_do_not_retain_memory(test_client, monkeypatch):
+    monkeypatch.setattr(limiter, 'enabled', False)
+
+    async def make_requests(count: int) -> None:
+        for _ in range(count):
+            response = await test_client.get("/roles/?page_size=20&page_number=1")
+            assert response.status_code == 200
+
+    await make_requests(WARMUP_REQUESTS)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    await make_requests(SOAK_REQUESTS)
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    growth = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    assert growth < ALLOWED_GROWTH
+    # Сессии запросов не должны переживать сами запросы
+    assert not [obj for obj in gc.get_objects() if isinstance(obj, AsyncSession)]
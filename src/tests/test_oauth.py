@@ -0,0 +1,100 @@
+import sys
+import time
+from collections import Counter
+from urllib.parse import urlparse, parse_qs
+sys.path[0] = '/app'
+
+import httpx
+import pytest
+from authlib.jose import JsonWebKey, jwt
+from fastapi import FastAPI, Request
+
+from src.core import oauth as oauth_module
+from src.core.oauth import CachedOAuth, ProviderDocumentCache, SharedTransport
+
+
+ISSUER = 'http://oidc.test'
+CLIENT_ID = 'standin-client'
+
+
+def create_standin_provider(calls: Counter) -> FastAPI:
+    """Заглушка OpenID провайдера: nonce для id_token берется из code"""
+    app = FastAPI()
+    key = JsonWebKey.generate_key('RSA', 2048, is_private=True, options={'kid': 'standin'})
+
+    @app.get('/.well-known/openid-configuration')
+    async def metadata() -> dict:
+        calls['metadata'] += 1
+        return {
+            'issuer': ISSUER,
+            'authorization_endpoint': f'{ISSUER}/authorize',
+            'token_endpoint': f'{ISSUER}/token',
+            'jwks_uri': f'{ISSUER}/jwks'
+        }
+
+    @app.get('/jwks')
+    async def jwks() -> dict:
+        calls['jwks'] += 1
+        return {'keys': [key.as_dict(is_private=False)]}
+
+    @app.post('/token')
+    async def token(request: Request) -> dict:
+        calls['token'] += 1
+        code = parse_qs((await request.body()).decode())['code'][0]
+        now = int(time.time())
+        claims = {
+            'iss': ISSUER, 'aud': CLIENT_ID, 'sub': 'standin-user', 'iat': now, 'exp': now + 300,
+            'nonce': code, 'email': 'testuser', 'given_name': 'Test', 'family_name': 'User'
+        }
+        id_token = jwt.encode({'alg': 'RS256', 'kid': 'standin'}, claims, key).decode()
+        return {'access_token': 'standin', 'token_type': 'Bearer', 'expires_in': 300, 'id_token': id_token}
+
+    return app
+
+
+@pytest.fixture()
+def standin_calls(monkeypatch) -> Counter:
+    calls = Counter()
+    transport = SharedTransport(httpx.ASGITransport(app=create_standin_provider(calls)))
+    monkeypatch.setattr(oauth_module, 'shared_transport', transport)
+    monkeypatch.setattr(oauth_module, 'provider_documents', ProviderDocumentCache(transport, ttl=60, stale_ttl=60))
+
+    standin_oauth = CachedOAuth()
+    standin_oauth.register(
+        name='google',
+        client_id=CLIENT_ID,
+        client_secret='secret',
+        server_metadata_url=f'{ISSUER}/.well-known/openid-configuration',
+        client_kwargs={'scope': 'openid email profile'}
+    )
+    monkeypatch.setitem(oauth_module.oauth_services, 'google', standin_oauth.google)
+    return calls
+
+
+async def login_via_standin(test_client) -> httpx.Response:
+    redirect = await test_client.get('/auth/login/google')
+    assert redirect.status_code == 302
+    params = parse_qs(urlparse(redirect.headers['location']).query)
+    return await test_client.get(
+        '/auth/oauth/google',
+        params={'code': params['nonce'][0], 'state': params['state'][0]}
+    )
+
+
+@pytest.mark.asyncio
+async def test_oauth_login_uses_cached_documents(test_client, standin_calls, clear_data):
+    for _ in range(2):
+        callback_response = await login_via_standin(test_client)
+        assert callback_response.status_code == 200
+    assert standin_calls == Counter(metadata=1, jwks=1, token=2)
+
+
+@pytest.mark.asyncio
+async def test_oauth_user_has_no_password(test_client, standin_calls, clear_data):
+    callback_response = await login_via_standin(test_client)
+    assert callback_response.status_code == 200
+    login_response = await test_client.post(
+        '/auth/login',
+        json={'login': 'testuser', 'password': 'qwerty12345'}
+    )
+    assert login_response.status_code == 400
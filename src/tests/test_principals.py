@@ -0,0 +1,21 @@
+import sys
+sys.path[0] = '/app'
+
+from uuid import uuid4
+
+from src.services.principals import Principal, PrincipalCache
+
+
+def test_principal_read_before_invalidation_is_not_cached():
+    cache = PrincipalCache(enabled=True, maxsize=10, ttl=60)
+    cache.on_subscription_change(True)
+    principal = Principal(id=uuid4(), roles=('user',))
+
+    # Роли прочитаны из БД, а пока шел запрос, пришла инвалидация
+    generation = cache.generation
+    cache.invalidate(str(principal.id))
+    cache.set(principal, generation)
+    assert cache.get(principal.id) is None
+
+    cache.set(principal, cache.generation)
+    assert cache.get(principal.id) == principal
@@ -1,12 +1,16 @@
+import base64
 import json
 import sys
 import time
+from ipaddress import ip_network
+from uuid import uuid4
 sys.path[0] = '/app'
 
 import pytest
 from sqlalchemy import select
 
-from src.core.config import admin_settings
+from src import limiter as limiter_module
+from src.core.config import admin_settings, settings
 from src.db.postgres import async_session
 from src.models.users import User
 
@@ -144,3 +148,85 @@ async def test_roles_delete(test_client):
         headers={"Accept": "application/json", **cookies},
     )
     assert response.status_code == 204
+
+
+@pytest.mark.asyncio
+async def test_roles_not_modified(test_client):
+    response = await test_client.get(
+        "/roles/?page_size=20&page_number=1"
+    )
+    etag = response.headers['ETag']
+    response = await test_client.get(
+        "/roles/?page_size=20&page_number=1",
+        headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+
+
+@pytest.mark.asyncio
+async def test_roles_rate_limit(test_client, monkeypatch):
+    # Отдельное ведро на тест через X-Real-IP, которому верим только от доверенного прокси
+    monkeypatch.setattr(settings, 'RATE_LIMIT_TRUST_PROXY_HEADERS', True)
+    monkeypatch.setattr(limiter_module, 'trusted_proxies', [ip_network('127.0.0.1')])
+    headers = {"X-Real-IP": f"test-{uuid4()}"}
+    for _ in range(20):
+        response = await test_client.get("/roles/", headers=headers)
+        assert response.status_code == 200
+    response = await test_client.get("/roles/", headers=headers)
+    assert response.status_code == 429
+    assert 'Retry-After' in response.headers
+
+
+@pytest.mark.asyncio
+async def test_access_token_role_claims(test_client):
+    tokens_response = await test_client.post(
+        "/auth/login",
+        json={
+            'login': admin_settings.ADMIN_LOGIN,
+            'password': admin_settings.ADMIN_PASSWORD
+        }
+    )
+    access_token = json.loads(tokens_response.content.decode('utf-8'))["access_token"]
+    payload = access_token.split('.')[1]
+    claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+    assert admin_settings.ADMIN_ROLE_NAME in claims['roles']
+    assert 'rv' in claims
+
+
+@pytest.mark.asyncio
+async def test_roles_bulk_attach_detach(test_client):
+    tokens_response = await test_client.post(
+        "/auth/login",
+        json={
+            'login': admin_settings.ADMIN_LOGIN,
+            'password': admin_settings.ADMIN_PASSWORD
+        }
+    )
+    access_token = json.loads(tokens_response.content.decode('utf-8'))["access_token"]
+    cookies = {"access_token": access_token}
+    response = await test_client.post("/roles/", headers=cookies, json={"name": f"bulk_{uuid4()}"})
+    bulk_role_id = response.json()['id']
+    async with async_session() as session:
+        sql_request = await session.execute(select(User).where(User.login == admin_settings.ADMIN_LOGIN))
+        user: User = sql_request.scalar()
+
+    payload = {"role_id": bulk_role_id, "user_ids": [str(user.id), str(uuid4())]}
+    for expected_count in (1, 0):
+        response = await test_client.post("/roles/bulk_attach", headers=cookies, json=payload)
+        assert response.status_code == 200
+        assert response.json() == {"count": expected_count}
+
+    response = await test_client.post(
+        "/roles/bulk_detach",
+        headers=cookies,
+        json={"memberships": [{"user_id": str(user.id), "role_id": bulk_role_id}]}
+    )
+    assert response.json() == {"count": 1}
+    response = await test_client.post(
+        "/roles/bulk_detach",
+        headers=cookies,
+        json={"memberships": [{"user_id": str(user.id), "role_id": bulk_role_id}], "user_ids": [str(user.id)]}
+    )
+    assert response.status_code == 400
+    await test_client.delete(f"/roles/{bulk_role_id}", headers=cookies)
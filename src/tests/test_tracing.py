@@ -0,0 +1,37 @@
+import sys
+sys.path[0] = '/app'
+
+import pytest
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from sqlalchemy import text
+
+from src.db import postgres
+from src.db.postgres import async_session
+
+
+@pytest.fixture()
+def exporter(monkeypatch):
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    monkeypatch.setattr(postgres, 'tracer', provider.get_tracer(__name__))
+    yield exporter
+    provider.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_query_outside_trace_has_no_span(exporter):
+    # Так ходят в БД фоновые циклы: очистка, запись истории, перехеширование
+    async with async_session() as db:
+        await db.execute(text('SELECT 1'))
+    assert exporter.get_finished_spans() == ()
+
+
+@pytest.mark.asyncio
+async def test_query_inside_trace_has_span(exporter):
+    with postgres.tracer.start_as_current_span('GET /test'):
+        async with async_session() as db:
+            await db.execute(text('SELECT 1'))
+    assert [span.name for span in exporter.get_finished_spans()] == ['SELECT', 'GET /test']
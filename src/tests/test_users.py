@@ -1,6 +1,12 @@
 import json
 
 import pytest
+from sqlalchemy import select
+
+from src.core.config import admin_settings
+from src.db.postgres import async_session
+from src.models.users import User
+from src.services.users import purge_deleted_users
 
 
 @pytest.mark.asyncio
@@ -59,6 +65,24 @@ async def test_login_history(test_client):
     assert 1 <= len(get_content(response.content)) <= 20
 
 
+@pytest.mark.asyncio
+async def test_login_history_cursor(test_client):
+    access_token = await get_access_token(test_client, 'qwerty123456')
+    cookies = {"access_token": access_token}
+    first_page = await test_client.get(
+        "/users/get_user_history?page_size=1",
+        headers={"Accept": "application/json", **cookies},
+    )
+    assert first_page.status_code == 200
+    next_cursor = first_page.headers["X-Next-Cursor"]
+    second_page = await test_client.get(
+        f"/users/get_user_history?page_size=1&cursor={next_cursor}",
+        headers={"Accept": "application/json", **cookies},
+    )
+    assert second_page.status_code == 200
+    assert get_content(second_page.content) != get_content(first_page.content)
+
+
 @pytest.mark.asyncio
 async def test_user_information(test_client, clear_data):
     access_token = await get_access_token(test_client, 'qwerty123456')
@@ -68,3 +92,27 @@ async def test_user_information(test_client, clear_data):
         headers={"Accept": "application/json", **cookies},
     )
     assert response.status_code == 200
+    assert 'password' not in get_content(response.content)
+
+
+@pytest.mark.asyncio
+async def test_delete_user(test_client):
+    credentials = {'login': 'deleteduser', 'password': 'qwerty12345'}
+    signup_response = await test_client.post("/users/signup", json=credentials)
+    user_id = get_content(signup_response.content)['id']
+    await test_client.post("/auth/login", json=credentials)
+    admin_response = await test_client.post(
+        "/auth/login",
+        json={'login': admin_settings.ADMIN_LOGIN, 'password': admin_settings.ADMIN_PASSWORD}
+    )
+    cookies = {"access_token": get_content(admin_response.content)["access_token"]}
+
+    response = await test_client.delete(f"/users/delete/?user_id={user_id}", headers=cookies)
+    assert response.status_code == 204
+    login_response = await test_client.post("/auth/login", json=credentials)
+    assert login_response.status_code == 400
+
+    assert await purge_deleted_users() >= 1
+    async with async_session() as session:
+        sql_request = await session.execute(select(User).where(User.login == 'deleteduser'))
+        assert sql_request.scalar() is None